@@ -5,6 +5,7 @@ from django.contrib import messages
 from django.conf import settings
 from .forms import UserRegistrationForm, UserLoginForm
 from cart.cart import Cart
+from cart.storage import get_cart_storage
 
 
 def register_view(request):
@@ -68,9 +69,10 @@ def logout_view(request):
     """Выход пользователя"""
     from django.contrib.auth import logout
     
-    cart = Cart(request)
-    cart.sync_to_session(request.user)
-    
     logout(request)
+    # Кошик користувача лишається в БД. Гостьове сховище (cookie) сесію
+    # переживає, тож очищаємо його - інакше наступний вхід додасть ті самі
+    # кількості вдруге
+    get_cart_storage(request).clear()
     messages.success(request, 'Ви вийшли з акаунту.')
     return redirect('products:home')
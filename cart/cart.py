@@ -1,37 +1,64 @@
 from decimal import Decimal
-import copy
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from products.cache import catalog_version
 from products.models import Product
 from .models import CartItem
+from .storage import get_cart_storage
+
+SUMMARY_TIMEOUT = 60 * 60 * 24
+
+# CART_MERGE_POLICY -> політика upsert: гостьовий кошик новіший за збережений
+MERGE_POLICIES = {
+    'sum': 'sum',
+    'max': 'max',
+    'newest': 'set',
+}
+
+
+class CartLine:
+    """Рядок кошика з уже порахованими Decimal-цінами."""
+    __slots__ = ('product', 'quantity', 'price', 'total_price', 'update_quantity_form')
+
+    def __init__(self, product, quantity, price):
+        self.product = product
+        self.price = price
+        self.update_quantity_form = None
+        self.set_quantity(quantity)
+
+    def set_quantity(self, quantity):
+        self.quantity = quantity
+        self.total_price = self.price * quantity
 
 
 class Cart:
     def __init__(self, request):
         self.request = request
-        self.session = request.session
+        self.storage = get_cart_storage(request)
         self.user = request.user if request.user.is_authenticated else None
+        self._summary = None
+        self._lines = None
         
         if not self.user:
-            cart = self.session.get(settings.CART_SESSION_ID)
-            if not cart:
-                cart = self.session[settings.CART_SESSION_ID] = {}
-            self.cart = cart
+            self.cart = self.storage.load()
         else:
             self.cart = None
 
     def add(self, product, quantity=1, override_quantity=False):
+        """Повертає оновлений рядок кошика."""
         if self.user:
-            cart_item, created = CartItem.objects.get_or_create(
-                user=self.user,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            if not created:
-                if override_quantity:
-                    cart_item.quantity = quantity
-                else:
-                    cart_item.quantity += quantity
-                cart_item.save()
+            with transaction.atomic():
+                quantity = CartItem.objects.upsert(
+                    self.user, product, quantity, 'set' if override_quantity else 'sum'
+                )
+                self.invalidate_summary()
+                line = self._update_line(product, quantity, product.price)
+                # Підсумок рахується в тій самій транзакції, що й запис,
+                # а в кеш потрапляє лише після коміту
+                self.summary()
+            return line
         else:
             product_id = str(product.id)
             if product_id not in self.cart:
@@ -44,131 +71,224 @@ class Cart:
             else:
                 self.cart[product_id]['quantity'] += quantity
             self.save()
+            item = self.cart[product_id]
+            return self._update_line(product, item['quantity'], Decimal(item['price']))
+
+    def apply(self, updates, products):
+        """
+        Кілька змін за раз: updates - {product_id: кількість або None для
+        видалення}, products - {product_id: Product}. Для користувача -
+        один DELETE і один масовий upsert в одній транзакції.
+        """
+        removed = [product_id for product_id, quantity in updates.items() if quantity is None]
+        changed = {
+            product_id: quantity
+            for product_id, quantity in updates.items()
+            if quantity is not None and product_id in products
+        }
+        if self._lines is not None:
+            for product_id in removed:
+                self._lines.pop(product_id, None)
+
+        lines = {}
+        if self.user:
+            with transaction.atomic():
+                if removed:
+                    CartItem.objects.filter(user=self.user, product_id__in=removed).delete()
+                if changed:
+                    CartItem.objects.bulk_upsert(self.user, changed, 'set')
+                self.invalidate_summary()
+                for product_id, quantity in changed.items():
+                    product = products[product_id]
+                    lines[product_id] = self._update_line(product, quantity, product.price)
+                self.summary()
+        else:
+            for product_id in removed:
+                self.cart.pop(str(product_id), None)
+            for product_id, quantity in changed.items():
+                item = self.cart.setdefault(
+                    str(product_id), {'quantity': 0, 'price': str(products[product_id].price)}
+                )
+                item['quantity'] = quantity
+                lines[product_id] = self._update_line(
+                    products[product_id], quantity, Decimal(item['price'])
+                )
+            self.save()
+        return lines
 
     def save(self):
+        self._summary = None
         if not self.user:
-            # Переконуємося, що всі ціни збережені як strings, а не Decimal
-            for product_id, item_data in self.cart.items():
-                if isinstance(item_data.get('price'), (Decimal, float)):
-                    item_data['price'] = str(item_data['price'])
-            self.session.modified = True
+            self.storage.save(self.cart)
 
     def remove(self, product):
+        if self._lines is not None:
+            self._lines.pop(product.id, None)
         if self.user:
             CartItem.objects.filter(user=self.user, product=product).delete()
+            self.invalidate_summary()
         else:
             product_id = str(product.id)
             if product_id in self.cart:
                 del self.cart[product_id]
                 self.save()
 
+    def _load(self):
+        """Рядки кошика з товарами - один запит на весь запит."""
+        if self._lines is None:
+            lines = {}
+            if self.user:
+                for cart_item in CartItem.objects.filter(user=self.user).select_related('product'):
+                    lines[cart_item.product_id] = CartLine(
+                        cart_item.product, cart_item.quantity, cart_item.product.price
+                    )
+            else:
+                products = Product.objects.in_bulk([int(product_id) for product_id in self.cart])
+                for product_id, item in self.cart.items():
+                    product = products.get(int(product_id))
+                    if product is not None:
+                        # Для гостя ціна - та, що була при додаванні в кошик
+                        lines[product.id] = CartLine(product, item['quantity'], Decimal(item['price']))
+            self._lines = lines
+        return self._lines
+
+    def fresh_lines(self):
+        """
+        [(product_id, кількість, поточна ціна, залишок)] лише доступних
+        товарів - один запит; для оформлення замовлення, тож рядки
+        користувача блокуються.
+        """
+        if self.user:
+            return list(
+                CartItem.objects.select_for_update(of=('self',))
+                .filter(user=self.user, product__available=True)
+                .values_list('product_id', 'quantity', 'product__price', 'product__stock')
+            )
+        quantities = {int(product_id): item['quantity'] for product_id, item in self.cart.items()}
+        return [
+            (product_id, quantities[product_id], price, stock)
+            for product_id, price, stock in Product.objects.filter(id__in=quantities, available=True)
+            .values_list('id', 'price', 'stock')
+        ]
+
+    def _update_line(self, product, quantity, price):
+        if self._lines is None:
+            return CartLine(product, quantity, price)
+        line = self._lines.get(product.id)
+        if line is None:
+            line = self._lines[product.id] = CartLine(product, quantity, price)
+        else:
+            line.set_quantity(quantity)
+        return line
+
     def __iter__(self):
+        return iter(list(self._load().values()))
+
+    def summary_key(self, user=None):
+        # Версія каталогу в ключі - зміна цін робить старий підсумок недосяжним
+        return f'cart:summary:{(user or self.user).pk}:{catalog_version()}'
+
+    def invalidate_summary(self, user=None):
+        self._summary = None
+        if user or self.user:
+            key = self.summary_key(user)
+            cache.delete(key)
+            # Поки транзакція не закомічена, інший запит може закешувати
+            # старий підсумок - видаляємо ще раз після коміту
+            transaction.on_commit(lambda: cache.delete(key))
+
+    def _cache_summary(self, key, summary):
+        # Відкат транзакції не має лишити в кеші незбережений стан
+        transaction.on_commit(lambda: cache.set(key, summary, SUMMARY_TIMEOUT))
+
+    def summary(self):
+        """
+        Кількість товарів, сума та кількість рядків. Для користувача -
+        з кешу або одним агрегатним запитом, для гостя - із сесії без БД.
+        """
+        if self._lines is not None:
+            # Рядки вже в пам'яті - рахуємо з них
+            lines = self._lines.values()
+            return {
+                'items': sum(line.quantity for line in lines),
+                'subtotal': sum((line.total_price for line in lines), Decimal('0')),
+                'lines': len(self._lines),
+            }
+        if self._summary is not None:
+            return self._summary
         if self.user:
-            cart_items = CartItem.objects.filter(user=self.user).select_related('product')
-            for cart_item in cart_items:
-                yield {
-                    'product': cart_item.product,
-                    'quantity': cart_item.quantity,
-                    'price': cart_item.product.price,
-                    'total_price': cart_item.get_total_price()
+            key = self.summary_key()
+            summary = cache.get(key)
+            if summary is None:
+                row = CartItem.objects.filter(user=self.user).aggregate(
+                    items=Sum('quantity'),
+                    subtotal=Sum(F('quantity') * F('product__price')),
+                    lines=Count('id'),
+                )
+                summary = {
+                    'items': row['items'] or 0,
+                    'subtotal': row['subtotal'] or Decimal('0'),
+                    'lines': row['lines'],
                 }
+                self._cache_summary(key, summary)
         else:
-            product_ids = self.cart.keys()
-            products = Product.objects.filter(id__in=product_ids)
-            # Створюємо глибоку копію, щоб не модифікувати оригінальний словник сесії
-            cart = copy.deepcopy(self.cart)
-            
-            for product in products:
-                product_id = str(product.id)
-                if product_id in cart:
-                    cart[product_id]['product'] = product
-
-            for item in cart.values():
-                # Конвертуємо price в Decimal тільки для обчислень, не зберігаємо в сесію
-                price = Decimal(item['price'])
-                # Створюємо новий словник, щоб не модифікувати копію, яка може мати посилання
-                yield {
-                    'product': item.get('product'),
-                    'quantity': item['quantity'],
-                    'price': price,  # Decimal для використання в шаблоні
-                    'total_price': price * item['quantity']
-                }
+            summary = {
+                'items': sum(item['quantity'] for item in self.cart.values()),
+                'subtotal': sum(
+                    (Decimal(item['price']) * item['quantity'] for item in self.cart.values()),
+                    Decimal('0'),
+                ),
+                'lines': len(self.cart),
+            }
+        self._summary = summary
+        return summary
 
     def __len__(self):
-        if self.user:
-            return sum(item.quantity for item in CartItem.objects.filter(user=self.user))
-        else:
-            return sum(item['quantity'] for item in self.cart.values())
+        return self.summary()['items']
 
     def get_total_price(self):
-        if self.user:
-            return sum(
-                item.get_total_price()
-                for item in CartItem.objects.filter(user=self.user)
-            )
-        else:
-            return sum(
-                Decimal(item['price']) * item['quantity']
-                for item in self.cart.values()
-            )
+        return self.summary()['subtotal']
 
     def get_item_price(self, product):
-        if self.user:
-            try:
-                cart_item = CartItem.objects.get(user=self.user, product=product)
-                return cart_item.get_total_price()
-            except CartItem.DoesNotExist:
-                return Decimal('0')
-        else:
-            item = self.cart.get(str(product.id))
-            if item:
-                return Decimal(item['price']) * item['quantity']
-            return Decimal('0')
+        line = self._load().get(product.id)
+        return line.total_price if line else Decimal('0')
 
     def clear(self):
+        self._lines = {}
         if self.user:
             CartItem.objects.filter(user=self.user).delete()
+            self.invalidate_summary()
         else:
-            # Видаляємо кошик з сесії
-            if settings.CART_SESSION_ID in self.session:
-                del self.session[settings.CART_SESSION_ID]
+            self.storage.clear()
             # Очищаємо локальну змінну
             self.cart = {}
-            # Позначаємо сесію як змінену
-            self.session.modified = True
+            self._summary = None
 
     def sync_to_db(self, user):
-        session_cart = self.session.get(settings.CART_SESSION_ID)
+        """
+        Переносить гостьовий кошик у БД при вході: одна перевірка товарів
+        і один масовий upsert в одній транзакції. Як поєднати кількості
+        з уже збереженими - визначає CART_MERGE_POLICY.
+        """
+        session_cart = self.storage.load()
         if not session_cart:
             return
-        
-        for product_id, item_data in session_cart.items():
-            try:
-                product = Product.objects.get(id=product_id)
-                cart_item, created = CartItem.objects.get_or_create(
-                    user=user,
-                    product=product,
-                    defaults={'quantity': item_data['quantity']}
-                )
-                if not created:
-                    cart_item.quantity += item_data['quantity']
-                    cart_item.save()
-            except Product.DoesNotExist:
-                continue
-        
-        if settings.CART_SESSION_ID in self.session:
-            del self.session[settings.CART_SESSION_ID]
-            self.session.modified = True
 
-    def sync_to_session(self, user):
-        cart_items = CartItem.objects.filter(user=user)
-        cart = {}
-        
-        for cart_item in cart_items:
-            cart[str(cart_item.product.id)] = {
-                'quantity': cart_item.quantity,
-                'price': str(cart_item.product.price)
-            }
-        
-        self.session[settings.CART_SESSION_ID] = cart
-        self.session.modified = True
\ No newline at end of file
+        policy = MERGE_POLICIES[getattr(settings, 'CART_MERGE_POLICY', 'sum')]
+        quantities = {
+            int(product_id): item_data['quantity']
+            for product_id, item_data in session_cart.items()
+        }
+        with transaction.atomic():
+            existing = Product.objects.filter(id__in=quantities).values_list('id', flat=True)
+            CartItem.objects.bulk_upsert(
+                user, {product_id: quantities[product_id] for product_id in existing}, policy
+            )
+        self.invalidate_summary(user)
+        self.storage.clear()
+
+def get_cart(request):
+    """Один Cart на запит, спільний для в'юхи, контекст-процесора й шаблону."""
+    if not hasattr(request, '_cart'):
+        request._cart = Cart(request)
+    return request._cart
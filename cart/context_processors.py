@@ -1,4 +1,6 @@
-from .cart import Cart
+from django.utils.functional import SimpleLazyObject
+from .cart import get_cart
 
 def cart(request):
-    return {'cart': Cart(request)}
+    # Кошик будується лише якщо шаблон справді до нього звертається
+    return {'cart': SimpleLazyObject(lambda: get_cart(request))}
@@ -0,0 +1,14 @@
+from django.utils.deprecation import MiddlewareMixin
+
+
+class CartStorageMiddleware(MiddlewareMixin):
+    """
+    Записує у відповідь зміни гостьового кошика (cookie сховища).
+    MiddlewareMixin - щоб під ASGI не загортати асинхронні в'юхи в один потік.
+    """
+
+    def process_response(self, request, response):
+        storage = getattr(request, '_cart_storage', None)
+        if storage is not None:
+            response = storage.process_response(response)
+        return response
@@ -1,9 +1,103 @@
-from django.db import models
+from django.db import models, connections, router, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from products.models import Product
 
 User = get_user_model()
 
+# Як поєднати наявну кількість із новою при конфлікті
+QUANTITY_POLICIES = ('sum', 'set', 'max')
+
+
+class CartItemManager(models.Manager):
+    def _supports_upsert(self, connection):
+        return (
+            connection.features.supports_update_conflicts_with_target and
+            connection.features.can_return_rows_from_bulk_insert
+        )
+
+    def _upsert_sql(self, connection, rows, policy, returning=False):
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        column = qn('quantity')
+        greatest = 'GREATEST' if connection.vendor == 'postgresql' else 'MAX'
+        value = {
+            'sum': f'{table}.{column} + excluded.{column}',
+            'set': f'excluded.{column}',
+            'max': f'{greatest}({table}.{column}, excluded.{column})',
+        }[policy]
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * rows)
+        return (
+            f'INSERT INTO {table} ({qn("user_id")}, {qn("product_id")}, {column}, '
+            f'{qn("created")}, {qn("updated")}) VALUES {placeholders} '
+            f'ON CONFLICT ({qn("user_id")}, {qn("product_id")}) DO UPDATE SET '
+            f'{column} = {value}, {qn("updated")} = excluded.{qn("updated")}'
+            + (f' RETURNING {column}' if returning else '')
+        )
+
+    def upsert(self, user, product, quantity, policy='sum'):
+        """
+        Додає або оновлює рядок кошика одним INSERT ... ON CONFLICT DO UPDATE
+        і повертає нову кількість. Паралельні запити не гублять інкрементів.
+        """
+        if policy not in QUANTITY_POLICIES:
+            raise ValueError(f'Невідома політика кількості: {policy}')
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        if not self._supports_upsert(connection):
+            return self._upsert_fallback(user, product, quantity, policy, using)
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                self._upsert_sql(connection, 1, policy, returning=True),
+                [getattr(user, 'pk', user), getattr(product, 'pk', product), quantity, now, now],
+            )
+            return cursor.fetchone()[0]
+
+    def bulk_upsert(self, user, quantities, policy='sum', batch_size=500):
+        """Те саме для багатьох товарів: quantities - {product_id: кількість}."""
+        if policy not in QUANTITY_POLICIES:
+            raise ValueError(f'Невідома політика кількості: {policy}')
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        items = list(quantities.items())
+        with transaction.atomic(using=using):
+            if not self._supports_upsert(connection):
+                for product_id, quantity in items:
+                    self._upsert_fallback(user, product_id, quantity, policy, using)
+                return
+            user_id = getattr(user, 'pk', user)
+            now = connection.ops.adapt_datetimefield_value(timezone.now())
+            with connection.cursor() as cursor:
+                for start in range(0, len(items), batch_size):
+                    batch = items[start:start + batch_size]
+                    params = []
+                    for product_id, quantity in batch:
+                        params += [user_id, product_id, quantity, now, now]
+                    cursor.execute(self._upsert_sql(connection, len(batch), policy), params)
+
+    def _upsert_fallback(self, user, product, quantity, policy, using):
+        # Для БД без ON CONFLICT ... RETURNING - блокування рядка + F-вираз
+        with transaction.atomic(using=using):
+            item, created = self.using(using).select_for_update().get_or_create(
+                user_id=getattr(user, 'pk', user),
+                product_id=getattr(product, 'pk', product),
+                defaults={'quantity': quantity},
+            )
+            if not created:
+                value = {
+                    'sum': F('quantity') + quantity,
+                    'set': quantity,
+                    'max': Greatest(F('quantity'), quantity),
+                }[policy]
+                self.using(using).filter(pk=item.pk).update(quantity=value, updated=timezone.now())
+                item.refresh_from_db(fields=['quantity'])
+            return item.quantity
+
+
 class CartItem(models.Model):
     user = models.ForeignKey(
         User,
@@ -21,6 +115,8 @@ class CartItem(models.Model):
     created = models.DateTimeField('Додано', auto_now_add=True)
     updated = models.DateTimeField('Оновлено', auto_now=True)
 
+    objects = CartItemManager()
+
     class Meta:
         verbose_name = 'Товар у кошику'
         verbose_name_plural = 'Товари у кошику'
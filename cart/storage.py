@@ -0,0 +1,181 @@
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from products.models import Product
+
+COOKIE_SALT = 'cart.storage.cookie'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+# Обмеження розміру cookie (~4 КБ) - більше рядків гість не збереже
+MAX_COOKIE_LINES = 100
+CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+
+class BaseCartStorage:
+    """
+    Де живе кошик гостя. load() повертає {product_id: {'quantity', 'price'}}
+    (ключі - рядки, ціни - рядки), save()/clear() лише позначають зміни,
+    а записати їх у відповідь може process_response().
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.modified = False
+
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, cart):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def process_response(self, response):
+        return response
+
+    def _pop_legacy(self):
+        """Кошик зі старого сховища в сесії - переносимо один раз."""
+        session = self.request.session
+        if settings.CART_SESSION_ID not in session:
+            return None
+        cart = session.pop(settings.CART_SESSION_ID)
+        session.modified = True
+        if cart:
+            self.save(cart)
+        return cart or None
+
+
+class SessionCartStorage(BaseCartStorage):
+    """Попередня поведінка: кошик у сесії."""
+
+    def load(self):
+        return self.request.session.get(settings.CART_SESSION_ID) or {}
+
+    def save(self, cart):
+        for item in cart.values():
+            if isinstance(item.get('price'), (Decimal, float)):
+                item['price'] = str(item['price'])
+        self.request.session[settings.CART_SESSION_ID] = cart
+        self.request.session.modified = True
+
+    def clear(self):
+        if settings.CART_SESSION_ID in self.request.session:
+            del self.request.session[settings.CART_SESSION_ID]
+            self.request.session.modified = True
+
+
+def encode_lines(cart):
+    return ','.join(
+        f'{product_id}:{item["quantity"]}'
+        for product_id, item in list(cart.items())[:MAX_COOKIE_LINES]
+    )
+
+
+def decode_lines(value):
+    lines = {}
+    for pair in (value or '').split(','):
+        product_id, _, quantity = pair.partition(':')
+        if product_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+            lines[product_id] = int(quantity)
+    return lines
+
+
+class SignedCookieCartStorage(BaseCartStorage):
+    """
+    Кошик у підписаній cookie як "id:кількість,id:кількість". Ціни беруться
+    з каталогу при читанні, тож гість не робить жодного запису в БД.
+    """
+    cookie_name = 'cart'
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.value = None
+
+    def load(self):
+        quantities = decode_lines(
+            self.request.get_signed_cookie(self.cookie_name, default=None, salt=COOKIE_SALT)
+        )
+        if not quantities:
+            return self._pop_legacy() or {}
+        prices = dict(
+            Product.objects.filter(id__in=quantities).values_list('id', 'price')
+        )
+        return {
+            product_id: {'quantity': quantity, 'price': str(prices[int(product_id)])}
+            for product_id, quantity in quantities.items()
+            if int(product_id) in prices
+        }
+
+    def save(self, cart):
+        self.value = encode_lines(cart)
+        self.modified = True
+
+    def clear(self):
+        self.value = ''
+        self.modified = True
+
+    def process_response(self, response):
+        if not self.modified:
+            return response
+        if self.value:
+            response.set_signed_cookie(
+                self.cookie_name, self.value, salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+            )
+        elif self.cookie_name in self.request.COOKIES:
+            response.delete_cookie(self.cookie_name, samesite='Lax')
+        return response
+
+
+class CacheCartStorage(BaseCartStorage):
+    """Кошик у кеші за випадковим id гостя з cookie."""
+    cookie_name = 'cart_id'
+
+    def __init__(self, request):
+        super().__init__(request)
+        try:
+            self.cart_id = str(uuid.UUID(request.COOKIES.get(self.cookie_name, '')))
+        except ValueError:
+            self.cart_id = None
+
+    def key(self):
+        return f'cart:guest:{self.cart_id}'
+
+    def load(self):
+        cart = cache.get(self.key()) if self.cart_id else None
+        if not cart:
+            return self._pop_legacy() or {}
+        return cart
+
+    def save(self, cart):
+        if self.cart_id is None:
+            self.cart_id = str(uuid.uuid4())
+            self.modified = True
+        cache.set(self.key(), {
+            product_id: {'quantity': item['quantity'], 'price': str(item['price'])}
+            for product_id, item in cart.items()
+        }, CACHE_TIMEOUT)
+
+    def clear(self):
+        if self.cart_id:
+            cache.delete(self.key())
+
+    def process_response(self, response):
+        if self.modified:
+            response.set_cookie(
+                self.cookie_name, self.cart_id, max_age=CACHE_TIMEOUT,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+def get_cart_storage(request):
+    if not hasattr(request, '_cart_storage'):
+        storage_class = import_string(
+            getattr(settings, 'CART_STORAGE', 'cart.storage.SessionCartStorage')
+        )
+        request._cart_storage = storage_class(request)
+    return request._cart_storage
@@ -1,3 +1,241 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.db import connection, transaction
+from unittest import mock
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from products.models import Category, Product
+from .cart import Cart, get_cart
+from .models import CartItem
+from .storage import MAX_COOKIE_LINES, SignedCookieCartStorage, decode_lines, encode_lines
 
-# Create your tests here.
+
+class CartTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('buyer', password='pw12345!')
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.products = [
+            Product.objects.create(
+                category=category, name=f'P{i}', slug=f'p{i}', description='',
+                scent_type='woody', price=100 * (i + 1),
+            )
+            for i in range(3)
+        ]
+
+    def cart(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = SessionStore()
+        return Cart(request)
+
+
+class SummaryCacheTests(CartTestCase):
+    def test_summary_is_cached_only_after_commit(self):
+        cart = self.cart()
+        key = cart.summary_key()
+        with self.captureOnCommitCallbacks() as callbacks:
+            cart.add(self.products[0], 2)
+            self.assertIsNone(cache.get(key))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cache.get(key)['items'], 2)
+
+    def test_rolled_back_change_is_not_cached(self):
+        cart = self.cart()
+        key = cart.summary_key()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    cart.apply({self.products[0].id: 3}, {self.products[0].id: self.products[0]})
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertIsNone(cache.get(key))
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+        self.assertEqual(self.cart().summary()['items'], 0)
+
+    def test_cached_summary_skips_cart_rows_until_prices_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cart().add(self.products[0], 2)
+        with CaptureQueriesContext(connection) as queries:
+            summary = self.cart().summary()
+        self.assertEqual((summary['items'], summary['subtotal']), (2, 200))
+        self.assertFalse([q for q in queries.captured_queries if 'cart_cartitem' in q['sql']])
+
+        # Нова ціна - нова версія каталогу, старий підсумок недосяжний
+        self.products[0].price = 150
+        self.products[0].save()
+        self.assertEqual(self.cart().summary()['subtotal'], 300)
+
+
+class RequestScopedCartTests(CartTestCase):
+    def test_one_cart_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = SessionStore()
+        self.assertIs(get_cart(request), get_cart(request))
+
+    def test_lines_are_loaded_once(self):
+        CartItem.objects.bulk_create([
+            CartItem(user=self.user, product=product, quantity=i + 1)
+            for i, product in enumerate(self.products)
+        ])
+        cart = self.cart()
+        with self.assertNumQueries(1):
+            lines = list(cart)
+            list(cart)
+            self.assertEqual(cart.get_item_price(self.products[2]), 900)
+            # Підсумок рахується з уже завантажених рядків
+            self.assertEqual((len(cart), cart.get_total_price()), (6, 1400))
+        self.assertEqual({line.product for line in lines}, set(self.products))
+
+
+class UpsertTests(CartTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ids = [product.id for product in self.products]
+        CartItem.objects.bulk_create([
+            CartItem(user=self.user, product_id=self.ids[0], quantity=2),
+            CartItem(user=self.user, product_id=self.ids[1], quantity=5),
+        ])
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+
+    def assert_policies(self):
+        expected = {
+            'sum': {self.ids[0]: 5, self.ids[1]: 6, self.ids[2]: 1},
+            'set': {self.ids[0]: 3, self.ids[1]: 1, self.ids[2]: 1},
+            'max': {self.ids[0]: 3, self.ids[1]: 5, self.ids[2]: 1},
+        }
+        for policy, result in expected.items():
+            with self.subTest(policy=policy), transaction.atomic():
+                CartItem.objects.bulk_upsert(
+                    self.user, {self.ids[0]: 3, self.ids[1]: 1, self.ids[2]: 1}, policy, batch_size=2
+                )
+                self.assertEqual(self.quantities(), result)
+                transaction.set_rollback(True)
+
+    def test_bulk_upsert_policies(self):
+        self.assert_policies()
+
+    def test_bulk_upsert_policies_without_on_conflict(self):
+        with mock.patch.object(CartItem.objects, '_supports_upsert', return_value=False):
+            self.assert_policies()
+
+    def test_upsert_returns_new_quantity(self):
+        self.assertEqual(CartItem.objects.upsert(self.user, self.ids[0], 4), 6)
+        self.assertEqual(CartItem.objects.upsert(self.user, self.ids[0], 1, 'set'), 1)
+        self.assertEqual(CartItem.objects.upsert(self.user, self.ids[2], 3, 'max'), 3)
+        with self.assertRaises(ValueError):
+            CartItem.objects.upsert(self.user, self.ids[0], 1, 'replace')
+
+    def test_add_is_a_single_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            line = self.cart().add(self.products[0], 3)
+        writes = [q['sql'] for q in queries.captured_queries if 'cart_cartitem' in q['sql']]
+        # Upsert і агрегат підсумку - без SELECT перед записом
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(writes[0].startswith('INSERT'))
+        self.assertEqual(line.quantity, 5)
+
+    def test_add_view_sums_quantities(self):
+        self.client.force_login(self.user)
+        for quantity in (2, 3):
+            self.client.post(f'/cart/add/{self.ids[2]}/', {'quantity': quantity})
+        self.assertEqual(self.quantities()[self.ids[2]], 5)
+
+    @override_settings(CART_STORAGE='cart.storage.SessionCartStorage', CART_MERGE_POLICY='newest')
+    def test_sync_to_db_applies_merge_policy(self):
+        cart = self.cart()
+        cart.storage.save({
+            str(self.ids[0]): {'quantity': 7, 'price': '100'},
+            '999999': {'quantity': 1, 'price': '100'},
+        })
+        cart.sync_to_db(self.user)
+        self.assertEqual(self.quantities(), {self.ids[0]: 7, self.ids[1]: 5})
+        self.assertEqual(cart.storage.load(), {})
+
+
+class StorageBackendTests(CartTestCase):
+    def add(self, product, quantity=1):
+        return self.client.post(f'/cart/add/{product.id}/', {'quantity': quantity})
+
+    def guest_items(self):
+        return self.client.get('/session-state/').json()['total_items']
+
+    @override_settings(CART_STORAGE='cart.storage.SignedCookieCartStorage')
+    def test_signed_cookie_keeps_guest_out_of_the_database(self):
+        self.add(self.products[0], 2)
+        self.add(self.products[1])
+        self.assertEqual(self.client.cookies['cart'].value.split(':', 1)[0], str(self.products[0].id))
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(self.guest_items(), 3)
+
+        # Ціни - з каталогу, у cookie лише кількості
+        self.products[0].price = 1000
+        self.products[0].save()
+        request = RequestFactory().get('/')
+        request.COOKIES['cart'] = self.client.cookies['cart'].value
+        cart = SignedCookieCartStorage(request).load()
+        self.assertEqual(cart[str(self.products[0].id)], {'quantity': 2, 'price': '1000.00'})
+
+        self.client.cookies['cart'] = self.client.cookies['cart'].value.replace(':2', ':9')
+        self.assertEqual(self.guest_items(), 0)
+
+    def test_cookie_lines_are_capped_and_validated(self):
+        cart = {str(i): {'quantity': 1} for i in range(1, MAX_COOKIE_LINES + 10)}
+        self.assertEqual(len(decode_lines(encode_lines(cart))), MAX_COOKIE_LINES)
+        self.assertEqual(decode_lines('1:2,x:1,3:0,4:-1,5'), {'1': 2})
+
+    @override_settings(CART_STORAGE='cart.storage.CacheCartStorage')
+    def test_cache_storage_uses_a_random_id_cookie(self):
+        self.add(self.products[2], 4)
+        cart_id = self.client.cookies['cart_id'].value
+        self.assertEqual(cache.get(f'cart:guest:{cart_id}')[str(self.products[2].id)]['quantity'], 4)
+        self.assertEqual(self.guest_items(), 4)
+        self.client.cookies['cart_id'] = 'not-a-uuid'
+        self.assertEqual(self.guest_items(), 0)
+
+    @override_settings(CART_STORAGE='cart.storage.SessionCartStorage')
+    def test_session_storage(self):
+        self.add(self.products[1], 2)
+        self.assertNotIn('cart', self.client.cookies)
+        cart = self.client.session[settings.CART_SESSION_ID]
+        self.assertEqual(cart[str(self.products[1].id)]['quantity'], 2)
+        self.assertEqual(self.guest_items(), 2)
+
+
+@override_settings(CART_STORAGE='cart.storage.SignedCookieCartStorage', CART_MERGE_POLICY='sum')
+class LoginRoundTripTests(CartTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.email = 'buyer@example.com'
+        self.user.save()
+
+    def login(self):
+        response = self.client.post(
+            '/accounts/login/', {'email': 'buyer@example.com', 'password': 'pw12345!'}
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_logout_does_not_double_the_cart_on_next_login(self):
+        self.login()
+        self.client.post(f'/cart/add/{self.products[0].id}/', {'quantity': 2})
+        self.client.post('/accounts/logout/')
+        self.assertFalse(self.client.cookies.get('cart') and self.client.cookies['cart'].value)
+        self.login()
+        quantities = list(CartItem.objects.filter(user=self.user).values_list('quantity', flat=True))
+        self.assertEqual(quantities, [2])
+
+    def test_guest_cart_is_merged_on_login(self):
+        self.client.post(f'/cart/add/{self.products[1].id}/', {'quantity': 3})
+        self.login()
+        self.assertEqual(
+            dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+            {self.products[1].id: 3},
+        )
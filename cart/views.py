@@ -1,13 +1,14 @@
+import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
 from products.models import Product
-from .cart import Cart
+from .cart import get_cart
 from .forms import CartAddProductForm
 
 @require_POST
 def cart_add(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     form = CartAddProductForm(request.POST)
     
@@ -40,7 +41,7 @@ def cart_add(request, product_id):
 @require_POST
 def cart_remove(request, product_id):
     try:
-        cart = Cart(request)
+        cart = get_cart(request)
         product = get_object_or_404(Product, id=product_id)
         cart.remove(product)
         
@@ -64,13 +65,13 @@ def cart_remove(request, product_id):
 
 @require_POST
 def cart_update(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     form = CartAddProductForm(request.POST)
     
     if form.is_valid():
         cd = form.cleaned_data
-        cart.add(
+        line = cart.add(
             product=product,
             quantity=cd['quantity'],
             override_quantity=True
@@ -80,7 +81,7 @@ def cart_update(request, product_id):
             cart_info = {
                 'total_items': len(cart),
                 'total_price': float(cart.get_total_price()),
-                'item_total': float(cart.get_item_price(product)),
+                'item_total': float(line.total_price),
                 'success': True,
                 'message': 'Кошик оновлено'
             }
@@ -95,15 +96,76 @@ def cart_update(request, product_id):
             
     return redirect('cart:cart_detail')
 
+@require_POST
+def cart_batch(request):
+    """
+    Пакет змін кошика одним запитом:
+    {"operations": [{"product_id": 1, "quantity": 3}, {"product_id": 2, "remove": true}]}
+    Пізніша операція над тим самим товаром перекриває попередню.
+    """
+    try:
+        operations = json.loads(request.body).get('operations')
+    except (ValueError, AttributeError):
+        operations = None
+    if not isinstance(operations, list):
+        return JsonResponse({
+            'success': False,
+            'message': 'Невалідний запит'
+        }, status=400)
+
+    updates = {}
+    errors = {}
+    for operation in operations:
+        try:
+            product_id = int(operation.get('product_id'))
+        except (AttributeError, TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'message': 'Невалідний запит'
+            }, status=400)
+        if operation.get('remove'):
+            updates[product_id] = None
+            continue
+        form = CartAddProductForm({'quantity': operation.get('quantity'), 'override': True})
+        if form.is_valid():
+            updates[product_id] = form.cleaned_data['quantity']
+        else:
+            errors[product_id] = form.errors
+
+    products = Product.objects.in_bulk(
+        [product_id for product_id, quantity in updates.items() if quantity is not None]
+    )
+    for product_id, quantity in updates.items():
+        if quantity is not None and product_id not in products:
+            errors[product_id] = {'product_id': ['Товар не знайдено']}
+    if errors:
+        return JsonResponse({
+            'success': False,
+            'message': 'Невалідна форма',
+            'errors': errors
+        }, status=400)
+
+    cart = get_cart(request)
+    lines = cart.apply(updates, products)
+    return JsonResponse({
+        'total_items': len(cart),
+        'total_price': float(cart.get_total_price()),
+        'is_empty': len(cart) == 0,
+        'items': {
+            product_id: float(line.total_price) for product_id, line in lines.items()
+        },
+        'success': True,
+        'message': 'Кошик оновлено'
+    })
+
 def cart_detail(request):
-    cart = Cart(request)
-    cart_items = []
-    for item in cart:
-        item['update_quantity_form'] = CartAddProductForm(initial={
-            'quantity': item['quantity'],
+    cart = get_cart(request)
+    cart_items = list(cart)
+    for item in cart_items:
+        item.update_quantity_form = CartAddProductForm(initial={
+            'quantity': item.quantity,
             'override': True
         })
-        cart_items.append(item)
     return render(request, 'cart/cart_detail.html', {
         'cart': cart_items,
         'cart_obj': cart,
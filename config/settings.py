@@ -35,6 +35,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cart.middleware.CartStorageMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -51,6 +52,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'cart.context_processors.cart',
+                'products.context_processors.public_shell',
             ],
         },
     },
@@ -60,6 +62,21 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Скільки чекати на блокування запису. Транзакції воркерів черги
+        # беруть його одразу (orders.db.write_atomic), решта - як зазвичай
+        'OPTIONS': {
+            'timeout': 20,
+        },
+    }
+}
+
+# Версії каталогу - в базі (products.CatalogVersion), тож bump бачать
+# усі процеси й з локальним кешем. Спільний бекенд (Redis, Memcached)
+# лише прибирає дублі фасетів і сторінок у кожного процесу
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'arome-noir'),
     }
 }
 
@@ -78,6 +95,12 @@ USE_TZ = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CART_SESSION_ID = 'cart'
+# Як поєднати гостьовий кошик зі збереженим при вході: sum, max або newest
+CART_MERGE_POLICY = os.getenv('CART_MERGE_POLICY', 'sum')
+# Де зберігати кошик гостя: SignedCookieCartStorage, CacheCartStorage або SessionCartStorage
+CART_STORAGE = os.getenv('CART_STORAGE', 'cart.storage.SignedCookieCartStorage')
+# Скільки секунд товар тримається за неоплаченим замовленням
+STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 60 * 15))
 
 SESSION_COOKIE_AGE = 86400
 SESSION_COOKIE_SECURE = False
@@ -86,6 +109,17 @@ SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Клієнт платежів: orders.payments.StripeClient або orders.fake_stripe.FakeStripeClient
+PAYMENT_CLIENT = os.getenv('PAYMENT_CLIENT', 'orders.payments.StripeClient')
+# Через скільки секунд незавершений статус платежу перевіряється в Stripe ще раз
+PAYMENT_SYNC_TTL = int(os.getenv('PAYMENT_SYNC_TTL', 60 * 5))
+# Найдовше очікування відповіді платіжного сервісу (с) і скільки викликів
+# на процес можуть іти одночасно - решта воркерів лишається для сайту
+PAYMENT_TIMEOUT = float(os.getenv('PAYMENT_TIMEOUT', 5))
+PAYMENT_MAX_CONCURRENCY = int(os.getenv('PAYMENT_MAX_CONCURRENCY', 8))
+# Для FakeStripeClient: затримка відповіді (с) і частка збоїв
+FAKE_STRIPE_LATENCY = float(os.getenv('FAKE_STRIPE_LATENCY', 0))
+FAKE_STRIPE_ERROR_RATE = float(os.getenv('FAKE_STRIPE_ERROR_RATE', 0))
 
 AUTHENTICATION_BACKENDS = [
     'accounts.backends.EmailBackend',
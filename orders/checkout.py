@@ -0,0 +1,94 @@
+import logging
+import time
+from contextlib import contextmanager
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from cart.cart import get_cart
+from . import stock
+from .db import write_atomic
+from .models import Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutError(Exception):
+    """У кошику не лишилося доступних товарів."""
+
+
+class StageTimings:
+    """Тривалість етапів оформлення - для логів і заголовка Server-Timing."""
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, (time.perf_counter() - started) * 1000))
+
+    def header(self):
+        return ', '.join(f'{name};dur={duration:.1f}' for name, duration in self.stages)
+
+    def __str__(self):
+        return ' '.join(f'{name}={duration:.1f}ms' for name, duration in self.stages)
+
+
+def _order_total():
+    return Subquery(
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum(ExpressionWrapper(
+            F('price') * F('quantity'),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )))
+        .values('total')
+    )
+
+
+def place_order(request, form):
+    """
+    Оформлення замовлення однією транзакцією: рядки кошика зі свіжими
+    цінами одним запитом, списання залишку одним умовним UPDATE, усі
+    OrderItem одним bulk_create, сума - в SQL, кошик - одним DELETE.
+    Кількість запитів не залежить від кількості рядків. Повертає
+    (order, timings); якщо товару не вистачає - stock.OutOfStock.
+    """
+    cart = get_cart(request)
+    timings = StageTimings()
+
+    with write_atomic():
+        with timings.stage('lines'):
+            lines = cart.fresh_lines()
+        if not lines:
+            raise CheckoutError('Товари з кошика більше недоступні')
+
+        with timings.stage('order'):
+            order = form.save(commit=False)
+            if request.user.is_authenticated:
+                order.user = request.user
+            order.save()
+
+        with timings.stage('stock'):
+            stock.reserve(order, {
+                product_id: quantity
+                for product_id, quantity, _, in_stock in lines
+                if in_stock is not None
+            })
+
+        with timings.stage('items'):
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=product_id, price=price, quantity=quantity)
+                for product_id, quantity, price, _ in lines
+            ])
+
+        with timings.stage('total'):
+            Order.objects.filter(pk=order.pk).update(total_price=_order_total())
+            order.refresh_from_db(fields=['total_price'])
+
+        with timings.stage('cart'):
+            cart.clear()
+
+    logger.info('checkout order=%s lines=%s %s', order.pk, len(lines), timings)
+    return order, timings
@@ -0,0 +1,27 @@
+from contextlib import contextmanager
+from django.db import transaction
+
+
+@contextmanager
+def write_atomic():
+    """
+    transaction.atomic() для транзакцій, що читають, а потім пишуть
+    паралельно з воркерами черги. На SQLite вона одразу бере блокування
+    на запис (BEGIN IMMEDIATE) і чекає на нього до OPTIONS['timeout'],
+    а не падає з "database is locked" посеред транзакції. Решта сайту
+    лишається на звичайному BEGIN і не чекає на воркерів.
+    """
+    connection = transaction.get_connection()
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
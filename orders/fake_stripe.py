@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import uuid
+from django.conf import settings
+from .payments import PaymentError, PaymentUnavailable
+
+# Які події надсилає Stripe для кожного результату оплати
+OUTCOMES = {
+    'succeeded': ['payment_intent.created', 'payment_intent.succeeded'],
+    'failed': ['payment_intent.created', 'payment_intent.payment_failed'],
+    'canceled': ['payment_intent.created', 'payment_intent.canceled'],
+    'refunded': ['payment_intent.created', 'payment_intent.succeeded', 'charge.refunded'],
+}
+# Статус PaymentIntent після кожної події
+STATUS_AFTER = {
+    'payment_intent.created': 'requires_payment_method',
+    'payment_intent.succeeded': 'succeeded',
+    'payment_intent.payment_failed': 'requires_payment_method',
+    'payment_intent.canceled': 'canceled',
+}
+
+
+def intent(amount, metadata, currency='uah', status='requires_payment_method'):
+    intent_id = f'pi_fake_{uuid.uuid4().hex[:24]}'
+    return {
+        'id': intent_id,
+        'object': 'payment_intent',
+        'amount': amount,
+        'currency': currency,
+        'status': status,
+        'client_secret': f'{intent_id}_secret_{uuid.uuid4().hex[:12]}',
+        'metadata': {key: str(value) for key, value in metadata.items()},
+    }
+
+
+def payment_intent(order, status='requires_payment_method'):
+    return intent(
+        int(order.total_price * 100),
+        {'order_id': order.id, 'customer_email': order.email},
+        status=status,
+    )
+
+
+def event(event_type, obj, created=None):
+    return {
+        'id': f'evt_fake_{uuid.uuid4().hex[:24]}',
+        'object': 'event',
+        'type': event_type,
+        'created': int(created or time.time()),
+        'data': {'object': obj},
+    }
+
+
+def payment_events(order, outcome='succeeded', started=None):
+    """Події однієї оплати в тому порядку, в якому їх створив би Stripe."""
+    started = started or time.time()
+    payment = payment_intent(order)
+    if order.stripe_payment_intent_id:
+        payment['id'] = order.stripe_payment_intent_id
+    events = []
+    for step, event_type in enumerate(OUTCOMES[outcome]):
+        if event_type == 'charge.refunded':
+            obj = {
+                'id': f'ch_fake_{uuid.uuid4().hex[:24]}',
+                'object': 'charge',
+                'payment_intent': payment['id'],
+                'amount': payment['amount'],
+                'amount_refunded': payment['amount'],
+                'refunded': True,
+                'metadata': payment['metadata'],
+            }
+        else:
+            obj = dict(payment, status=STATUS_AFTER[event_type])
+        events.append(event(event_type, obj, started + step))
+    return events
+
+
+def burst(orders, outcomes=None, duplicates=0.3, seed=None):
+    """
+    Потік подій як після простою Stripe: перемішаний, з повторними
+    доставками частини подій.
+    """
+    rng = random.Random(seed)
+    outcomes = outcomes or list(OUTCOMES)
+    events = []
+    for order in orders:
+        events.extend(payment_events(order, rng.choice(outcomes)))
+    events.extend(rng.sample(events, int(len(events) * duplicates)))
+    rng.shuffle(events)
+    return events
+
+
+class FakeStripeClient:
+    """
+    Клієнт платежів без мережі - для навантажувального тестування
+    оформлення (PAYMENT_CLIENT = 'orders.fake_stripe.FakeStripeClient').
+    FAKE_STRIPE_LATENCY імітує час відповіді Stripe у секундах (±50%),
+    FAKE_STRIPE_ERROR_RATE - частку викликів, що падають як збій мережі.
+    """
+
+    def __init__(self, latency=None, error_rate=None):
+        self.latency = getattr(settings, 'FAKE_STRIPE_LATENCY', 0) if latency is None else latency
+        self.error_rate = getattr(settings, 'FAKE_STRIPE_ERROR_RATE', 0) if error_rate is None else error_rate
+        self.intents = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _delay(self):
+        with self.lock:
+            self.calls += 1
+        return self.latency * random.uniform(0.5, 1.5) if self.latency else 0
+
+    def _fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            raise PaymentUnavailable('Fake Stripe: збій з\'єднання')
+
+    def _create(self, amount, currency, metadata):
+        self._fail()
+        created = intent(amount, metadata, currency)
+        with self.lock:
+            self.intents[created['id']] = created
+        return dict(created)
+
+    def _retrieve(self, intent_id):
+        self._fail()
+        with self.lock:
+            # Невідомий id (наприклад, після перезапуску) - вважаємо платіж новим
+            found = self.intents.setdefault(intent_id, {
+                **intent(0, {}), 'id': intent_id,
+            })
+        return dict(found)
+
+    def _cancel(self, intent_id):
+        self._fail()
+        with self.lock:
+            found = self.intents.get(intent_id)
+            if found is None or found['status'] == 'succeeded':
+                # Як і Stripe: оплачений чи невідомий платіж не скасувати
+                raise PaymentError(f'Fake Stripe: неможливо скасувати {intent_id}')
+            found['status'] = 'canceled'
+        return dict(found)
+
+    def create_intent(self, amount, currency, metadata):
+        time.sleep(self._delay())
+        return self._create(amount, currency, metadata)
+
+    def retrieve_intent(self, intent_id):
+        time.sleep(self._delay())
+        return self._retrieve(intent_id)
+
+    def cancel_intent(self, intent_id):
+        time.sleep(self._delay())
+        return self._cancel(intent_id)
+
+    async def acreate_intent(self, amount, currency, metadata):
+        await asyncio.sleep(self._delay())
+        return self._create(amount, currency, metadata)
+
+    async def aretrieve_intent(self, intent_id):
+        await asyncio.sleep(self._delay())
+        return self._retrieve(intent_id)
+
+    def set_status(self, intent_id, status):
+        """Імітує дію покупця чи Stripe: оплату, відмову, скасування."""
+        with self.lock:
+            self.intents[intent_id]['status'] = status
+
+
+def sign(payload, secret, timestamp=None):
+    """Заголовок Stripe-Signature для payload - щоб слати події в справжню в'юху."""
+    timestamp = int(timestamp or time.time())
+    if not isinstance(payload, str):
+        payload = json.dumps(payload)
+    signature = hmac.new(
+        secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256
+    ).hexdigest()
+    return f't={timestamp},v1={signature}'
@@ -0,0 +1,239 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+# Скільки секунд чекати на вільний слот, перш ніж відмовити одразу
+BULKHEAD_WAIT = 0.5
+BULKHEAD_POLL = 0.01
+LATENCY_SAMPLES = 1000
+
+
+class CircuitBreaker:
+    """
+    Відкривається, коли за останні window секунд було не менше min_calls
+    викликів і частка помилок досягла error_rate. Через cooldown секунд
+    пропускає один пробний виклик: успіх закриває, помилка знову відкриває.
+    """
+
+    def __init__(self, window=30, min_calls=5, error_rate=0.5, cooldown=30):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.opened_at = None
+        self.trial = False
+        self.results = deque()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self._set_state('half_open')
+            if self.state == 'half_open':
+                if self.trial:
+                    return False
+                self.trial = True
+            return True
+
+    def record(self, ok):
+        with self.lock:
+            now = time.monotonic()
+            if self.state == 'half_open':
+                self.trial = False
+                if ok:
+                    self.results.clear()
+                    self._set_state('closed')
+                else:
+                    self._open(now)
+                return
+            self.results.append((now, ok))
+            while self.results and self.results[0][0] < now - self.window:
+                self.results.popleft()
+            failures = sum(1 for _, result in self.results if not result)
+            if len(self.results) >= self.min_calls and failures / len(self.results) >= self.error_rate:
+                self._open(now)
+
+    def cancel_trial(self):
+        # Пробний виклик так і не відбувся - наступний може спробувати знову
+        with self.lock:
+            self.trial = False
+
+    def retry_after(self):
+        if self.state != 'open':
+            return 0
+        return max(1, int(self.cooldown - (time.monotonic() - self.opened_at)))
+
+    def _open(self, now):
+        self.opened_at = now
+        self.results.clear()
+        self._set_state('open')
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning('circuit breaker %s -> %s', self.state, state)
+        self.state = state
+
+
+class Gateway:
+    """
+    Обгортка клієнта зовнішнього сервісу: виклик не довше timeout секунд,
+    одночасно не більше concurrency викликів (bulkhead - решта воркерів
+    сайту не зависає разом зі Stripe), автоматичний вимикач і метрики.
+    Методи клієнта викликаються як методи шлюзу. Помилки failures
+    (разом із тайм-аутами) рахуються як збої сервісу; коли виклик
+    відхилено, кидається unavailable(message, retry_after).
+    """
+
+    def __init__(self, client, unavailable, failures=(), timeout=5, concurrency=8, breaker=None):
+        self.client = client
+        self.unavailable = unavailable
+        self.failures = (unavailable, *failures)
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.breaker = breaker or CircuitBreaker()
+        # Слот звільняється, лише коли виклик справді завершився,
+        # тож навіть покинуті через тайм-аут виклики не перевищать ліміт
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='gateway')
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {
+            'calls': 0, 'ok': 0, 'errors': 0, 'timeouts': 0, 'rejected': 0, 'short_circuited': 0,
+        }
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if not callable(method):
+            return method
+        # Асинхронні методи клієнта (acreate_intent тощо) - через acall
+        if inspect.iscoroutinefunction(method):
+            async def acall(*args, **kwargs):
+                return await self.acall(method, *args, **kwargs)
+            return acall
+
+        def call(*args, **kwargs):
+            return self.call(method, *args, **kwargs)
+        return call
+
+    def _count(self, stat, latency=None):
+        with self.lock:
+            self.stats[stat] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise self.unavailable(
+                'Платіжний сервіс тимчасово недоступний', self.breaker.retry_after()
+            )
+
+    def _reject(self):
+        self._count('rejected')
+        self.breaker.cancel_trial()
+        raise self.unavailable('Платіжний сервіс перевантажений', 5)
+
+    def _started(self):
+        with self.lock:
+            self.in_flight += 1
+            self.stats['calls'] += 1
+        return time.perf_counter()
+
+    def _finished(self, future=None):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def _timed_out(self, started):
+        self._count('timeouts', time.perf_counter() - started)
+        self.breaker.record(False)
+        return self.unavailable('Платіжний сервіс не відповідає', 5)
+
+    def _result(self, started, ok):
+        # Відмова по суті (наприклад, картку відхилено) - сервіс працює, ok=True
+        self._count('ok' if ok else 'errors', time.perf_counter() - started)
+        self.breaker.record(ok)
+
+    def call(self, method, *args, **kwargs):
+        self._admit()
+        if not self.slots.acquire(timeout=BULKHEAD_WAIT):
+            self._reject()
+
+        started = self._started()
+        future = self.pool.submit(method, *args, **kwargs)
+        future.add_done_callback(self._finished)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise self._timed_out(started)
+        except self.failures:
+            self._result(started, False)
+            raise
+        except Exception:
+            self._result(started, True)
+            raise
+        self._result(started, True)
+        return result
+
+    async def acall(self, method, *args, **kwargs):
+        """
+        Те саме для корутин: без потоку на виклик, а після тайм-ауту
+        корутина скасовується й одразу звільняє слот. Ліміт одночасних
+        викликів спільний із синхронними.
+        """
+        self._admit()
+        deadline = time.monotonic() + BULKHEAD_WAIT
+        while not self.slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                self._reject()
+            await asyncio.sleep(BULKHEAD_POLL)
+
+        started = self._started()
+        try:
+            result = await asyncio.wait_for(method(*args, **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(started)
+        except self.failures:
+            self._result(started, False)
+            raise
+        except Exception:
+            self._result(started, True)
+            raise
+        finally:
+            self._finished()
+        self._result(started, True)
+        return result
+
+    def metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.stats, in_flight=self.in_flight)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+
+        return {
+            **stats,
+            'state': self.breaker.state,
+            'retry_after': self.breaker.retry_after(),
+            'timeout': self.timeout,
+            'concurrency': self.concurrency,
+            'latency_ms': {
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'p99': percentile(0.99),
+                'max': percentile(1),
+            },
+        }
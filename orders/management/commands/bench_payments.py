@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.shortcuts import get_object_or_404, render
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import include, path, reverse
+from orders import payments
+from orders.models import Order
+from orders.views import payment_unavailable
+
+
+def sync_payment_process(request, order_id):
+    """Синхронна сторінка оплати, як до переходу на async - база порівняння."""
+    order = get_object_or_404(Order, id=order_id)
+    context = {
+        'order': order,
+        'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
+    }
+    try:
+        context['client_secret'] = payments.ensure_intent(order)
+    except payments.PaymentUnavailable as e:
+        return payment_unavailable(request, order, e)
+    except payments.PaymentError as e:
+        context['error'] = str(e)
+    return render(request, 'orders/payment.html', context)
+
+
+# Маршрути сайту + синхронна версія сторінки оплати
+urlpatterns = [
+    path('bench/payment/<int:order_id>/', sync_payment_process, name='bench_sync_payment'),
+    path('', include(settings.ROOT_URLCONF)),
+]
+
+
+def _report(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return (
+        f'{len(latencies) / elapsed:8.1f} запитів/с, '
+        f'p50 {percentile(0.5):7.1f} мс, p95 {percentile(0.95):7.1f} мс, '
+        f'статуси {dict(statuses)}'
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Порівнює синхронну сторінку оплати під WSGI (потік на запит) з '
+        'асинхронною під ASGI при імітованій затримці платіжного сервісу. '
+        'Пише в БД - запускати лише на тестових даних.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.3, help='Затримка Stripe, с')
+        parser.add_argument('--threads', type=int, default=8, help='Потоків WSGI-воркера')
+        parser.add_argument('--concurrency', type=int, default=200, help='Одночасних запитів ASGI')
+
+    def handle(self, *args, **options):
+        order_ids = list(
+            Order.objects.filter(paid=False).values_list('id', flat=True)[:options['requests']]
+        )
+        if not order_ids:
+            raise CommandError('Немає неоплачених замовлень')
+        ids = [order_ids[i % len(order_ids)] for i in range(options['requests'])]
+
+        # Кожен запит іде в платіжний сервіс: копія платежу одразу застаріла
+        with override_settings(
+            ROOT_URLCONF=__name__,
+            ALLOWED_HOSTS=['testserver'],
+            PAYMENT_CLIENT='orders.fake_stripe.FakeStripeClient',
+            FAKE_STRIPE_LATENCY=options['latency'],
+            FAKE_STRIPE_ERROR_RATE=0,
+            PAYMENT_SYNC_TTL=0,
+            PAYMENT_TIMEOUT=options['latency'] * 3 + 1,
+            PAYMENT_MAX_CONCURRENCY=max(options['requests'], options['threads']),
+        ):
+            sync_urls = [reverse('bench_sync_payment', args=[pk]) for pk in ids]
+            async_urls = [reverse('orders:payment_process', args=[pk]) for pk in ids]
+            self.stdout.write(
+                f'Синхронна в\'юха, WSGI, {options["threads"]} потоків: '
+                + self._wsgi(sync_urls, options['threads'])
+            )
+            self.stdout.write(
+                f'Асинхронна в\'юха, ASGI, до {options["concurrency"]} одночасно: '
+                + asyncio.run(self._asgi(async_urls, options['concurrency']))
+            )
+        payments._gateway.cache_clear()
+
+    def _wsgi(self, urls, threads):
+        payments._gateway.cache_clear()
+
+        def fetch(url):
+            started = time.perf_counter()
+            response = Client().get(url)
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(fetch, urls))
+        elapsed = time.perf_counter() - started
+        return _report([r[0] for r in results], Counter(r[1] for r in results), elapsed)
+
+    async def _asgi(self, urls, concurrency):
+        payments._gateway.cache_clear()
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with slots:
+                started = time.perf_counter()
+                response = await client.get(url)
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(fetch(url) for url in urls))
+        elapsed = time.perf_counter() - started
+        return _report([r[0] for r in results], Counter(r[1] for r in results), elapsed)
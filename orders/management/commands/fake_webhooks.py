@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders import fake_stripe, webhooks
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Ставить у чергу згенеровані події Stripe для неоплачених замовлень (для перевірки воркерів)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100)
+        parser.add_argument(
+            '--outcome', action='append', choices=list(fake_stripe.OUTCOMES),
+            help='Можливі результати оплати (за замовчуванням - усі)'
+        )
+        parser.add_argument('--duplicates', type=float, default=0.3)
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        orders = list(Order.objects.filter(paid=False).order_by('-id')[:options['orders']])
+        if not orders:
+            raise CommandError('Немає неоплачених замовлень')
+        events = fake_stripe.burst(
+            orders, options['outcome'], options['duplicates'], options['seed']
+        )
+        recorded = sum(webhooks.record(event) for event in events)
+        self.stdout.write(self.style.SUCCESS(
+            f'Подій: {len(events)}, нових у черзі: {recorded}'
+        ))
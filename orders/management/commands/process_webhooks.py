@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from orders import webhooks
+
+
+class Command(BaseCommand):
+    help = 'Обробляє чергу подій Stripe пулом воркерів'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=webhooks.CLAIM_BATCH_SIZE)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Працювати постійно, перевіряючи чергу раз на --interval секунд'
+        )
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument(
+            '--retry-failed', action='store_true',
+            help='Повернути в чергу події, що вичерпали спроби (вони блокують свій PaymentIntent)'
+        )
+
+    def _run_group(self, events):
+        try:
+            return webhooks.process_group(events)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = webhooks.retry_failed()
+            self.stdout.write(f'Повернуто в чергу: {retried}')
+        total = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                groups = webhooks.claim(options['batch_size'])
+                if groups:
+                    # Групи різних PaymentIntent - паралельно, події однієї групи - по черзі
+                    processed = sum(pool.map(self._run_group, groups))
+                    total += processed
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'Оброблено подій: {processed}')
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Оброблено подій: {total}'))
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from orders import stock
+
+
+class Command(BaseCommand):
+    help = 'Повертає на склад товар із прострочених резервів неоплачених замовлень і скасовує їхні платежі'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Працювати постійно, перевіряючи раз на --interval секунд'
+        )
+        parser.add_argument('--interval', type=int, default=60)
+        parser.add_argument('--batch-size', type=int, default=stock.RELEASE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            released = stock.release_expired(batch_size=options['batch_size'])
+            if released or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Звільнено резервів: {released}'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_paid_order_stripe_payment_intent_id'),
+        ('products', '0007_product_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Кількість')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Створено')),
+                ('expires', models.DateTimeField(db_index=True, verbose_name='Діє до')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='orders.order', verbose_name='Замовлення')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Резерв товару',
+                'verbose_name_plural': 'Резерви товарів',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'На обробці'), ('processing', 'Комплектується'), ('shipped', 'Відправлено'), ('delivered', 'Доставлено'), ('cancelled', 'Відмінено'), ('refunded', 'Кошти повернено')], default='pending', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='ID події')),
+                ('type', models.CharField(max_length=100, verbose_name='Тип')),
+                ('payment_intent', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='Payment Intent')),
+                ('payload', models.JSONField(verbose_name='Дані')),
+                ('occurred', models.DateTimeField(verbose_name='Час події в Stripe')),
+                ('status', models.CharField(choices=[('pending', 'Очікує'), ('processing', 'Обробляється'), ('done', 'Оброблено'), ('failed', 'Помилка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Спроб')),
+                ('next_attempt', models.DateTimeField(blank=True, null=True, verbose_name='Наступна спроба')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Заблоковано до')),
+                ('last_error', models.TextField(blank=True, verbose_name='Остання помилка')),
+                ('received', models.DateTimeField(auto_now_add=True, verbose_name='Отримано')),
+                ('processed', models.DateTimeField(blank=True, null=True, verbose_name='Оброблено')),
+            ],
+            options={
+                'verbose_name': 'Подія Stripe',
+                'verbose_name_plural': 'Події Stripe',
+                'indexes': [models.Index(fields=['status', 'occurred', 'id'], name='orders_webh_status_fa4d69_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='payment_amount',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Сума платежу, коп.'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_client_secret',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Client secret'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_status',
+            field=models.CharField(blank=True, max_length=50, verbose_name='Статус платежу в Stripe'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_synced',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Синхронізовано зі Stripe'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True, verbose_name='Stripe Payment Intent ID'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:28
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_paid_at(apps, schema_editor):
+    # Точний час оплати старих замовлень невідомий - беремо останню зміну
+    Order = apps.get_model('orders', 'Order')
+    Order.objects.filter(paid=True, paid_at__isnull=True).update(paid_at=F('updated'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_payment_intent_mirror'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='Оплачено о'),
+        ),
+        migrations.RunPython(backfill_paid_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_paid_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'На обробці'), ('processing', 'Комплектується'), ('shipped', 'Відправлено'), ('delivered', 'Доставлено'), ('cancelled', 'Відмінено'), ('refunded', 'Кошти повернено'), ('review', 'Потребує перевірки')], default='pending', max_length=20, verbose_name='Статус'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from products.models import Product
 
@@ -11,6 +12,9 @@ class Order(models.Model):
         ('shipped', 'Відправлено'),
         ('delivered', 'Доставлено'),
         ('cancelled', 'Відмінено'),
+        ('refunded', 'Кошти повернено'),
+        # Оплачено, але товару вже немає - повернути кошти чи вирішити вручну
+        ('review', 'Потребує перевірки'),
     ]
     
     user = models.ForeignKey(
@@ -44,12 +48,19 @@ class Order(models.Model):
         default=0
     )
     paid = models.BooleanField('Оплачено', default=False)
+    paid_at = models.DateTimeField('Оплачено о', null=True, blank=True, db_index=True, editable=False)
     stripe_payment_intent_id = models.CharField(
         'Stripe Payment Intent ID',
         max_length=255,
         blank=True,
-        null=True
+        null=True,
+        db_index=True
     )
+    # Локальна копія PaymentIntent - щоб не питати Stripe на кожному запиті
+    payment_client_secret = models.CharField('Client secret', max_length=255, blank=True)
+    payment_status = models.CharField('Статус платежу в Stripe', max_length=50, blank=True)
+    payment_amount = models.PositiveIntegerField('Сума платежу, коп.', null=True, blank=True)
+    payment_synced = models.DateTimeField('Синхронізовано зі Stripe', null=True, blank=True)
     
     class Meta:
         ordering = ['-created']
@@ -63,8 +74,14 @@ class Order(models.Model):
         return sum(item.get_cost() for item in self.items.all())
         
     def save(self, *args, **kwargs):
-        if not self.total_price:
+        # Нове замовлення ще без товарів - суму рахує оформлення (orders.checkout)
+        if not self.total_price and self.pk:
             self.total_price = self.get_total_cost()
+        # Час оплати фіксується один раз - за ним рахуються рекомендації
+        if self.paid and self.paid_at is None:
+            self.paid_at = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'paid_at'}
         super().save(*args, **kwargs)
 
 class OrderItem(models.Model):
@@ -92,4 +109,69 @@ class OrderItem(models.Model):
         return f'{self.id}'
         
     def get_cost(self):
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+class StockReservation(models.Model):
+    """
+    Товар, списаний із залишку під неоплачене замовлення. Після оплати
+    резерв просто видаляється, після скасування чи закінчення строку -
+    кількість повертається на склад.
+    """
+    order = models.ForeignKey(
+        Order,
+        related_name='reservations',
+        on_delete=models.CASCADE,
+        verbose_name='Замовлення'
+    )
+    product = models.ForeignKey(
+        Product,
+        related_name='reservations',
+        on_delete=models.CASCADE,
+        verbose_name='Товар'
+    )
+    quantity = models.PositiveIntegerField('Кількість')
+    created = models.DateTimeField('Створено', auto_now_add=True)
+    expires = models.DateTimeField('Діє до', db_index=True)
+
+    class Meta:
+        verbose_name = 'Резерв товару'
+        verbose_name_plural = 'Резерви товарів'
+
+    def __str__(self):
+        return f'{self.product_id} x {self.quantity}'
+
+
+class WebhookEvent(models.Model):
+    """
+    Вхідна черга подій Stripe: кожен id події записується один раз,
+    обробляє їх команда process_webhooks.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Очікує'),
+        ('processing', 'Обробляється'),
+        ('done', 'Оброблено'),
+        ('failed', 'Помилка'),
+    ]
+
+    event_id = models.CharField('ID події', max_length=255, unique=True)
+    type = models.CharField('Тип', max_length=100)
+    payment_intent = models.CharField('Payment Intent', max_length=255, blank=True, db_index=True)
+    payload = models.JSONField('Дані')
+    occurred = models.DateTimeField('Час події в Stripe')
+    status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField('Спроб', default=0)
+    next_attempt = models.DateTimeField('Наступна спроба', null=True, blank=True)
+    locked_until = models.DateTimeField('Заблоковано до', null=True, blank=True)
+    last_error = models.TextField('Остання помилка', blank=True)
+    received = models.DateTimeField('Отримано', auto_now_add=True)
+    processed = models.DateTimeField('Оброблено', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Подія Stripe'
+        verbose_name_plural = 'Події Stripe'
+        indexes = [
+            models.Index(fields=['status', 'occurred', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.type} {self.event_id}'
@@ -0,0 +1,208 @@
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .gateway import Gateway
+
+try:
+    import stripe
+except ImportError:
+    stripe = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+CURRENCY = 'uah'
+# Після цих статусів PaymentIntent уже не змінюється сам собою
+FINAL_STATUSES = ('succeeded', 'canceled')
+# Клієнт щойно підтвердив оплату - локальний статус точно застарів,
+# але повторні перезавантаження сторінки не мають щоразу йти в Stripe
+CONFIRM_SYNC_TTL = 5
+MIRROR_FIELDS = [
+    'stripe_payment_intent_id', 'payment_client_secret', 'payment_status',
+    'payment_amount', 'payment_synced',
+]
+
+
+class PaymentError(Exception):
+    pass
+
+
+class PaymentUnavailable(PaymentError):
+    """Платіжний сервіс не відповідає чи перевантажений - варто спробувати пізніше."""
+
+    def __init__(self, message='Платіжний сервіс тимчасово недоступний', retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StripeClient:
+    """
+    Справжній Stripe. Інтерфейс клієнта: create_intent(), retrieve_intent(),
+    cancel_intent() та асинхронні acreate_intent(), aretrieve_intent().
+    """
+
+    def __init__(self):
+        if stripe is None:
+            raise PaymentError('Stripe не встановлено. Будь ласка, встановіть: pip install stripe')
+        if httpx is None:
+            # Без нього асинхронні виклики пішли б у пул потоків
+            raise PaymentError('httpx не встановлено. Будь ласка, встановіть: pip install httpx')
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        # Мережевий тайм-аут самого SDK - щоб потік звільнявся, а не лише запит.
+        # Той самий httpx-клієнт обслуговує й асинхронні виклики
+        stripe.default_http_client = stripe.HTTPXClient(
+            timeout=getattr(settings, 'PAYMENT_TIMEOUT', 5), allow_sync_methods=True
+        )
+
+    def _error(self, e):
+        if isinstance(e, (stripe.APIConnectionError, stripe.RateLimitError, stripe.APIError)):
+            return PaymentUnavailable(str(e))
+        return PaymentError(str(e))
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except stripe.StripeError as e:
+            raise self._error(e) from e
+
+    async def _acall(self, method, *args, **kwargs):
+        try:
+            return await method(*args, **kwargs)
+        except stripe.StripeError as e:
+            raise self._error(e) from e
+
+    def create_intent(self, amount, currency, metadata):
+        return self._call(
+            stripe.PaymentIntent.create, amount=amount, currency=currency, metadata=metadata
+        )
+
+    def retrieve_intent(self, intent_id):
+        return self._call(stripe.PaymentIntent.retrieve, intent_id)
+
+    def cancel_intent(self, intent_id):
+        return self._call(stripe.PaymentIntent.cancel, intent_id)
+
+    async def acreate_intent(self, amount, currency, metadata):
+        return await self._acall(
+            stripe.PaymentIntent.create_async, amount=amount, currency=currency, metadata=metadata
+        )
+
+    async def aretrieve_intent(self, intent_id):
+        return await self._acall(stripe.PaymentIntent.retrieve_async, intent_id)
+
+
+@lru_cache(maxsize=None)
+def _gateway(path):
+    return Gateway(
+        import_string(path)(),
+        unavailable=PaymentUnavailable,
+        timeout=getattr(settings, 'PAYMENT_TIMEOUT', 5),
+        concurrency=getattr(settings, 'PAYMENT_MAX_CONCURRENCY', 8),
+    )
+
+
+def get_client():
+    """Клієнт платежів за шлюзом з тайм-аутами, bulkhead і вимикачем."""
+    return _gateway(getattr(settings, 'PAYMENT_CLIENT', 'orders.payments.StripeClient'))
+
+
+def amount_for(order):
+    # Stripe рахує в копійках
+    return int(order.total_price * 100)
+
+
+def _apply(order, intent):
+    order.stripe_payment_intent_id = intent['id']
+    if intent.get('client_secret'):
+        order.payment_client_secret = intent['client_secret']
+    order.payment_status = intent['status']
+    order.payment_amount = intent['amount']
+    order.payment_synced = timezone.now()
+
+
+def mirror(order, intent):
+    """Зберігає стан PaymentIntent у замовленні."""
+    _apply(order, intent)
+    if order.pk:
+        order.save(update_fields=MIRROR_FIELDS)
+
+
+async def amirror(order, intent):
+    _apply(order, intent)
+    if order.pk:
+        await order.asave(update_fields=MIRROR_FIELDS)
+
+
+def is_stale(order, max_age=None):
+    if not order.stripe_payment_intent_id or not order.payment_status:
+        return True
+    if order.payment_status in FINAL_STATUSES:
+        return False
+    if max_age is None:
+        max_age = getattr(settings, 'PAYMENT_SYNC_TTL', 60 * 5)
+    return (
+        order.payment_synced is None
+        or timezone.now() - order.payment_synced > timedelta(seconds=max_age)
+    )
+
+
+def _metadata(order):
+    return {'order_id': order.id, 'customer_email': order.email}
+
+
+def create_intent(order):
+    intent = get_client().create_intent(amount_for(order), CURRENCY, _metadata(order))
+    mirror(order, intent)
+    return intent
+
+
+def refresh_intent(order, max_age=None):
+    """Оновлює копію зі Stripe, лише якщо вона застаріла або невідома."""
+    if order.stripe_payment_intent_id and is_stale(order, max_age):
+        mirror(order, get_client().retrieve_intent(order.stripe_payment_intent_id))
+
+
+def cancel_intent(order):
+    """Скасовує PaymentIntent - після цього покупець уже не зможе його оплатити."""
+    mirror(order, get_client().cancel_intent(order.stripe_payment_intent_id))
+
+
+def ensure_intent(order):
+    """
+    client_secret для сторінки оплати. Stripe викликається, лише коли
+    платежу ще немає, копія застаріла або попередній платіж скасовано.
+    """
+    if not order.stripe_payment_intent_id:
+        create_intent(order)
+    else:
+        refresh_intent(order)
+        if order.payment_status == 'canceled' or not order.payment_client_secret:
+            create_intent(order)
+    return order.payment_client_secret
+
+
+# Асинхронні варіанти для ASGI-в'юх: очікування Stripe не тримає потік
+
+async def acreate_intent(order):
+    intent = await get_client().acreate_intent(amount_for(order), CURRENCY, _metadata(order))
+    await amirror(order, intent)
+    return intent
+
+
+async def arefresh_intent(order, max_age=None):
+    if order.stripe_payment_intent_id and is_stale(order, max_age):
+        await amirror(order, await get_client().aretrieve_intent(order.stripe_payment_intent_id))
+
+
+async def aensure_intent(order):
+    if not order.stripe_payment_intent_id:
+        await acreate_intent(order)
+    else:
+        await arefresh_intent(order)
+        if order.payment_status == 'canceled' or not order.payment_client_secret:
+            await acreate_intent(order)
+    return order.payment_client_secret
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import Order
+from . import stock
+
+
+@receiver(post_save, sender=Order)
+def order_cancelled(sender, instance, created, **kwargs):
+    # Скасоване без оплати (зокрема вручну в адмінці) - товар назад на склад
+    if not created and instance.status == 'cancelled' and not instance.paid:
+        stock.release_order(instance)
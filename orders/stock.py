@@ -0,0 +1,183 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from products.models import Product
+from . import payments
+from .db import write_atomic
+from .models import Order, OrderItem, StockReservation
+
+logger = logging.getLogger(__name__)
+
+RELEASE_BATCH_SIZE = 500
+
+
+class OutOfStock(Exception):
+    def __init__(self, names):
+        self.names = names
+        super().__init__('Недостатньо на складі: ' + ', '.join(names))
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 60 * 15))
+
+
+def _quantity_case(quantities):
+    return Case(
+        *(When(pk=product_id, then=quantity) for product_id, quantity in quantities.items()),
+        default=0,
+    )
+
+
+def reserve(order, quantities):
+    """
+    Списує товар під замовлення одним умовним UPDATE
+    (stock = stock - n WHERE stock >= n) - блокуються лише рядки цих
+    товарів. Якщо хоч одного не вистачило, кидає OutOfStock; викликати
+    всередині транзакції, щоб списане відкотилося. quantities - лише
+    товари з обліком залишку: {product_id: кількість}.
+    """
+    if not quantities:
+        return []
+    enough = Q()
+    for product_id, quantity in quantities.items():
+        enough |= Q(pk=product_id, stock__gte=quantity)
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(enough).update(
+                stock=F('stock') - _quantity_case(quantities)
+            )
+            if updated != len(quantities):
+                raise OutOfStock([])
+    except OutOfStock:
+        # Часткове списання вже відкочене - дивимось, чого саме бракує
+        raise OutOfStock([
+            name for product_id, name, stock in
+            Product.objects.filter(pk__in=quantities).values_list('pk', 'name', 'stock')
+            if stock is None or stock < quantities[product_id]
+        ])
+
+    expires = timezone.now() + reservation_ttl()
+    return StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=product_id, quantity=quantity, expires=expires)
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def _release(reservations):
+    """Повертає кількість на склад і видаляє резерви. Повертає кількість резервів."""
+    with write_atomic():
+        rows = list(
+            reservations.select_for_update(skip_locked=True)
+            .values_list('pk', 'product_id', 'quantity')
+        )
+        if not rows:
+            return 0
+        quantities = {}
+        for _, product_id, quantity in rows:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        Product.objects.filter(pk__in=quantities, stock__isnull=False).update(
+            stock=F('stock') + _quantity_case(quantities)
+        )
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    return len(rows)
+
+
+def release_order(order):
+    """Скасування замовлення - товар знову доступний."""
+    released = _release(StockReservation.objects.filter(order=order))
+    if released:
+        logger.info('stock released order=%s reservations=%s', order.pk, released)
+    return released
+
+
+def commit_order(order):
+    """Замовлення оплачене - списання остаточне, резерви більше не потрібні."""
+    return StockReservation.objects.filter(order=order).delete()[0]
+
+
+def _order_quantities(order):
+    quantities = {}
+    for product_id, quantity in OrderItem.objects.filter(
+        order=order, product__stock__isnull=False
+    ).values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def settle_paid(order):
+    """
+    Позначає замовлення оплаченим. Якщо резерв живий, списання стає
+    остаточним. Якщо його вже повернуто на склад (строк минув чи
+    замовлення скасували, а оплата все одно пройшла), товар списується
+    наново тим самим умовним UPDATE. Не вистачило - замовлення
+    отримує статус review: гроші взято, товару немає, потрібне
+    повернення коштів чи рішення менеджера. Повертає False, якщо
+    замовлення вже було оплачене.
+    """
+    with write_atomic():
+        # Вебхук і сторінка успіху можуть прийти одночасно - списуємо раз
+        if not Order.objects.select_for_update().filter(pk=order.pk, paid=False).exists():
+            order.paid = True
+            return False
+        held = list(
+            StockReservation.objects.select_for_update().filter(order=order)
+            .values_list('pk', flat=True)
+        )
+        in_stock = True
+        if held:
+            StockReservation.objects.filter(pk__in=held).delete()
+        else:
+            try:
+                reserve(order, _order_quantities(order))
+                commit_order(order)
+            except OutOfStock as e:
+                in_stock = False
+                logger.warning('paid order=%s out of stock: %s', order.pk, e)
+        order.paid = True
+        order.status = 'processing' if in_stock else 'review'
+        order.save()
+    return True
+
+
+def _cancel_payments(order_ids):
+    """Скасовує в Stripe платежі замовлень, для яких строк резерву минув."""
+    for order in Order.objects.filter(pk__in=order_ids, stripe_payment_intent_id__isnull=False) \
+            .exclude(stripe_payment_intent_id='') \
+            .exclude(payment_status__in=payments.FINAL_STATUSES):
+        try:
+            payments.cancel_intent(order)
+        except payments.PaymentError as e:
+            # Якщо оплата таки пройде, settle_paid спише товар наново
+            logger.warning('payment cancel failed order=%s: %s', order.pk, e)
+
+
+def release_expired(now=None, batch_size=RELEASE_BATCH_SIZE):
+    """
+    Повертає на склад прострочені резерви неоплачених замовлень, скасовує
+    ці замовлення та їхні платежі в Stripe. Обробляє пачками, повертає
+    кількість звільнених резервів.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        order_ids = list(
+            StockReservation.objects.filter(expires__lte=now, order__paid=False)
+            .values_list('order_id', flat=True)
+            .distinct()[:batch_size]
+        )
+        if not order_ids:
+            return total
+        with write_atomic():
+            released = _release(StockReservation.objects.filter(order_id__in=order_ids))
+            cancelled = Order.objects.filter(pk__in=order_ids, paid=False).exclude(status='cancelled')
+            cancelled_ids = list(cancelled.values_list('pk', flat=True))
+            cancelled.filter(pk__in=cancelled_ids).update(status='cancelled', updated=now)
+        # Мережевий виклик - уже поза транзакцією
+        _cancel_payments(cancelled_ids)
+        total += released
+        if not released:
+            # Усі рядки зараз тримає інший процес - він їх і звільнить
+            return total
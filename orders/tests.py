@@ -1,3 +1,580 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
+from django.test import SimpleTestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from cart.models import CartItem
+from products.models import Category, Product
+from . import fake_stripe, payments, stock, views, webhooks
+from .checkout import place_order
+from .db import write_atomic
+from .forms import OrderCreateForm
+from .gateway import CircuitBreaker, Gateway
+from .models import Order, OrderItem, StockReservation, WebhookEvent
 
-# Create your tests here.
+
+def make_order(products):
+    """products - {Product: кількість}."""
+    order = Order.objects.create(
+        first_name='Ім\'я', last_name='Прізвище', email='buyer@example.com',
+        phone='1', address='вул. 1', postal_code='1', city='Київ',
+    )
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, price=product.price, quantity=quantity)
+        for product, quantity in products.items()
+    ])
+    return order
+
+
+class OrderTestCase(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.product = Product.objects.create(
+            category=category, name='Drop', slug='drop', description='',
+            scent_type='woody', price=1000, stock=1,
+        )
+        self.other = Product.objects.create(
+            category=category, name='Other', slug='other', description='',
+            scent_type='woody', price=500, stock=5,
+        )
+
+    def checkout(self, quantities):
+        order = make_order(quantities)
+        stock.reserve(order, {product.pk: quantity for product, quantity in quantities.items()})
+        return order
+
+    def stock_of(self, product):
+        product.refresh_from_db(fields=['stock'])
+        return product.stock
+
+
+class StockReserveTests(OrderTestCase):
+    def test_refuses_to_oversell(self):
+        self.checkout({self.product: 1})
+        with self.assertRaises(stock.OutOfStock) as raised:
+            self.checkout({self.product: 1, self.other: 2})
+        self.assertEqual(raised.exception.names, ['Drop'])
+        # Частину, якої вистачало, теж не списано
+        self.assertEqual(self.stock_of(self.product), 0)
+        self.assertEqual(self.stock_of(self.other), 5)
+
+    def test_cancelled_order_returns_stock(self):
+        order = self.checkout({self.product: 1})
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(self.stock_of(self.product), 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class CheckoutPipelineTests(OrderTestCase):
+    form = {
+        'first_name': 'Олена', 'last_name': 'Коваль', 'email': 'buyer@example.com',
+        'phone': '1', 'address': 'вул. 1', 'postal_code': '1', 'city': 'Київ',
+    }
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = get_user_model().objects.create_user('buyer', password='pw12345!')
+        self.client.force_login(self.user)
+
+    def fill_cart(self, quantities):
+        CartItem.objects.bulk_create([
+            CartItem(user=self.user, product=product, quantity=quantity)
+            for product, quantity in quantities.items()
+        ])
+
+    def test_places_order_and_reports_stages(self):
+        self.fill_cart({self.product: 1, self.other: 3})
+        response = self.client.post('/orders/create/', self.form)
+        order = Order.objects.get()
+        self.assertRedirects(response, f'/orders/payment/{order.pk}/', fetch_redirect_response=False)
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['lines', 'order', 'stock', 'items', 'total', 'cart'])
+        self.assertEqual(order.total_price, 2500)
+        self.assertEqual((self.stock_of(self.product), self.stock_of(self.other)), (0, 2))
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+    def test_query_count_does_not_grow_with_lines(self):
+        category = self.product.category
+        extra = [
+            Product.objects.create(
+                category=category, name=f'Extra {i}', slug=f'extra-{i}', description='',
+                scent_type='woody', price=100, stock=10,
+            )
+            for i in range(4)
+        ]
+        counts = []
+        for products in ([self.other], extra):
+            self.fill_cart({product: 1 for product in products})
+            request = RequestFactory().post('/orders/create/', self.form)
+            request.user = self.user
+            request.session = self.client.session
+            form = OrderCreateForm(self.form)
+            self.assertTrue(form.is_valid())
+            with CaptureQueriesContext(connection) as queries:
+                place_order(request, form)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_out_of_stock_rolls_back(self):
+        self.fill_cart({self.product: 2, self.other: 1})
+        response = self.client.post('/orders/create/', self.form)
+        self.assertRedirects(response, '/cart/', fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual((self.stock_of(self.product), self.stock_of(self.other)), (1, 5))
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+
+@override_settings(PAYMENT_CLIENT='orders.fake_stripe.FakeStripeClient', FAKE_STRIPE_ERROR_RATE=0)
+class PaymentStockTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        payments._gateway.cache_clear()
+        self.addCleanup(payments._gateway.cache_clear)
+        self.stripe = payments.get_client().client
+
+    def pay(self, order):
+        payments.create_intent(order)
+        return order.stripe_payment_intent_id
+
+    def deliver(self, order, outcome):
+        for event in fake_stripe.payment_events(order, outcome):
+            webhooks.record(event)
+        while True:
+            groups = webhooks.claim()
+            if not groups:
+                break
+            for group in groups:
+                webhooks.process_group(group)
+        order.refresh_from_db()
+
+    def expire(self):
+        return stock.release_expired(now=timezone.now() + stock.reservation_ttl() + timedelta(seconds=1))
+
+    def test_expiry_cancels_payment_intent(self):
+        order = self.checkout({self.product: 1})
+        intent_id = self.pay(order)
+        self.assertEqual(self.expire(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(order.payment_status, 'canceled')
+        self.assertEqual(self.stripe.intents[intent_id]['status'], 'canceled')
+        self.assertEqual(self.stock_of(self.product), 1)
+
+    def test_failed_payment_keeps_reservation_until_paid(self):
+        order = self.checkout({self.product: 1})
+        self.pay(order)
+        self.deliver(order, 'failed')
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(self.stock_of(self.product), 0)
+        # Поки покупець пробує ще раз, товар не продається вдруге
+        with self.assertRaises(stock.OutOfStock):
+            self.checkout({self.product: 1})
+
+        self.deliver(order, 'succeeded')
+        self.assertTrue(order.paid)
+        self.assertEqual(order.status, 'processing')
+        self.assertFalse(StockReservation.objects.filter(order=order).exists())
+        self.assertEqual(self.stock_of(self.product), 0)
+
+    def test_payment_after_expiry_reserves_again(self):
+        order = self.checkout({self.product: 1, self.other: 2})
+        self.pay(order)
+        self.expire()
+        self.assertEqual(self.stock_of(self.other), 5)
+
+        self.deliver(order, 'succeeded')
+        self.assertTrue(order.paid)
+        self.assertEqual(order.status, 'processing')
+        self.assertEqual(self.stock_of(self.product), 0)
+        self.assertEqual(self.stock_of(self.other), 3)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_payment_after_expiry_without_stock_needs_review(self):
+        order = self.checkout({self.product: 1, self.other: 2})
+        self.pay(order)
+        self.expire()
+        # Останню одиницю вже купив інший покупець
+        self.checkout({self.product: 1})
+
+        with self.assertLogs('orders.stock', 'WARNING'):
+            self.deliver(order, 'succeeded')
+        self.assertTrue(order.paid)
+        self.assertEqual(order.status, 'review')
+        self.assertEqual(self.stock_of(self.product), 0)
+        self.assertEqual(self.stock_of(self.other), 5)
+
+    def test_settles_once(self):
+        order = self.checkout({self.other: 2})
+        self.assertTrue(stock.settle_paid(order))
+        stale = Order.objects.get(pk=order.pk)
+        stale.paid = False
+        self.assertFalse(stock.settle_paid(stale))
+        self.assertEqual(self.stock_of(self.other), 3)
+
+
+@override_settings(PAYMENT_CLIENT='orders.fake_stripe.FakeStripeClient', FAKE_STRIPE_ERROR_RATE=0)
+class PaymentMirrorTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        payments._gateway.cache_clear()
+        self.addCleanup(payments._gateway.cache_clear)
+        self.stripe = payments.get_client().client
+        self.order = make_order({self.other: 2})
+        Order.objects.filter(pk=self.order.pk).update(total_price=1000)
+        self.order.refresh_from_db()
+
+    def stored(self):
+        return Order.objects.get(pk=self.order.pk)
+
+    def test_payment_page_reuses_fresh_mirror(self):
+        secret = payments.ensure_intent(self.order)
+        order = self.stored()
+        self.assertEqual(
+            (order.payment_client_secret, order.payment_status, order.payment_amount),
+            (secret, 'requires_payment_method', 100000),
+        )
+        calls = self.stripe.calls
+        self.assertEqual(payments.ensure_intent(order), secret)
+        self.assertEqual(self.stripe.calls, calls)
+
+    def test_stale_mirror_is_refreshed_once(self):
+        payments.ensure_intent(self.order)
+        order = self.stored()
+        order.payment_synced = timezone.now() - timedelta(hours=1)
+        calls = self.stripe.calls
+        payments.refresh_intent(order)
+        self.assertEqual(self.stripe.calls, calls + 1)
+        payments.refresh_intent(order)
+        self.assertEqual(self.stripe.calls, calls + 1)
+
+        # Фінальний статус не застаріває
+        order.payment_status = 'succeeded'
+        order.payment_synced = timezone.now() - timedelta(days=1)
+        self.assertFalse(payments.is_stale(order))
+
+    def test_cancelled_intent_is_replaced(self):
+        payments.ensure_intent(self.order)
+        order = self.stored()
+        old_id = order.stripe_payment_intent_id
+        self.stripe.intents[old_id]['status'] = 'canceled'
+        order.payment_synced = None
+        payments.ensure_intent(order)
+        self.assertNotEqual(self.stored().stripe_payment_intent_id, old_id)
+
+    def test_webhook_of_replaced_intent_keeps_the_mirror(self):
+        payments.ensure_intent(self.order)
+        order = self.stored()
+        # Подія попереднього, вже заміненого платежу того ж замовлення
+        old = fake_stripe.payment_intent(order)
+        with self.assertLogs('orders.webhooks', 'INFO'):
+            webhooks.record(fake_stripe.event('payment_intent.payment_failed', old))
+            [group] = webhooks.claim()
+            webhooks.process_group(group)
+        self.assertEqual(self.stored().stripe_payment_intent_id, order.stripe_payment_intent_id)
+
+        current = dict(self.stripe.intents[order.stripe_payment_intent_id], status='succeeded')
+        webhooks.record(fake_stripe.event('payment_intent.succeeded', current))
+        [group] = webhooks.claim()
+        webhooks.process_group(group)
+        order = self.stored()
+        self.assertEqual((order.payment_status, order.paid), ('succeeded', True))
+
+
+class WebhookQueueTests(OrderTestCase):
+    def events(self, outcome='succeeded'):
+        order = make_order({self.other: 1})
+        order.stripe_payment_intent_id = f'pi_{order.pk}'
+        order.save()
+        return order, fake_stripe.payment_events(order, outcome)
+
+    def test_duplicate_delivery_is_recorded_once(self):
+        order, events = self.events()
+        self.assertTrue(webhooks.record(events[-1]))
+        self.assertFalse(webhooks.record(events[-1]))
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+        for group in webhooks.claim():
+            webhooks.process_group(group)
+        self.assertFalse(webhooks.record(events[-1]))
+        self.assertEqual(webhooks.claim(), [])
+        order.refresh_from_db()
+        self.assertTrue(order.paid)
+        self.assertEqual(self.stock_of(self.other), 4)
+
+    def test_failed_event_backs_off_and_blocks_later_events(self):
+        order, events = self.events()
+        for event in events:
+            webhooks.record(event)
+        failing = mock.Mock(side_effect=RuntimeError('boom'))
+        with mock.patch.dict(webhooks.HANDLERS, {'payment_intent.created': failing}):
+            with self.assertLogs('orders.webhooks', 'WARNING'):
+                [group] = webhooks.claim()
+                self.assertEqual(webhooks.process_group(group), 0)
+
+        first, second = WebhookEvent.objects.order_by('occurred')
+        self.assertEqual((first.status, first.attempts), ('pending', 1))
+        self.assertGreater(first.next_attempt, timezone.now())
+        self.assertEqual((second.status, second.attempts), ('pending', 0))
+        # Пізніша подія того ж платежу не обганяє ранішу
+        self.assertEqual(webhooks.claim(), [])
+
+        [group] = webhooks.claim(now=first.next_attempt)
+        self.assertEqual([event.pk for event in group], [first.pk, second.pk])
+        self.assertEqual(webhooks.process_group(group), 2)
+        order.refresh_from_db()
+        self.assertTrue(order.paid)
+
+    def test_gives_up_after_max_attempts(self):
+        order, events = self.events()
+        webhooks.record(events[-1])
+        event = WebhookEvent.objects.get()
+        event.attempts = webhooks.MAX_ATTEMPTS - 1
+        with mock.patch.object(webhooks.stock, 'settle_paid', side_effect=RuntimeError('boom')):
+            with self.assertLogs('orders.webhooks', 'WARNING'):
+                self.assertFalse(webhooks.process(event))
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'failed')
+        self.assertIsNone(event.next_attempt)
+
+    def test_backed_off_events_do_not_starve_the_batch(self):
+        retry_at = timezone.now() + timedelta(hours=1)
+        for index in range(5):
+            webhooks.record(fake_stripe.event(
+                'payment_intent.succeeded', {'object': 'payment_intent', 'id': f'pi_waiting_{index}'},
+                created=1000 + index,
+            ))
+        WebhookEvent.objects.update(next_attempt=retry_at, attempts=1)
+        _, events = self.events()
+        webhooks.record(events[-1])
+
+        groups = webhooks.claim(batch_size=3)
+        self.assertEqual([[event.event_id for event in group] for group in groups], [[events[-1]['id']]])
+
+    def test_failed_event_blocks_intent_until_retried(self):
+        order, events = self.events()
+        for event in events:
+            webhooks.record(event)
+        first, second = WebhookEvent.objects.order_by('occurred')
+        WebhookEvent.objects.filter(pk=first.pk).update(
+            status='failed', attempts=webhooks.MAX_ATTEMPTS, last_error='boom'
+        )
+        # Інакше succeeded застосувався б без created
+        self.assertEqual(webhooks.claim(), [])
+
+        self.assertEqual(webhooks.retry_failed(order.stripe_payment_intent_id), 1)
+        [group] = webhooks.claim()
+        self.assertEqual([event.pk for event in group], [first.pk, second.pk])
+        self.assertEqual(webhooks.process_group(group), 2)
+        order.refresh_from_db()
+        self.assertTrue(order.paid)
+
+
+class WriteAtomicTests(TransactionTestCase):
+    def test_immediate_only_for_its_own_transaction(self):
+        modes = []
+        start = connection._start_transaction_under_autocommit
+
+        def record_mode():
+            modes.append(connection.transaction_mode)
+            start()
+
+        with mock.patch.object(connection, '_start_transaction_under_autocommit', record_mode):
+            with write_atomic():
+                with write_atomic():
+                    Category.objects.create(name='a', slug='a')
+            Category.objects.create(name='b', slug='b')
+            with transaction.atomic():
+                Category.objects.create(name='c', slug='c')
+        # Сигнали категорії можуть відкрити ще свої транзакції - усі звичайні
+        self.assertEqual(modes[0], 'IMMEDIATE')
+        self.assertEqual(set(modes[1:]), {None})
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        for patcher in (
+            mock.patch('orders.gateway.time.monotonic', lambda: self.now),
+            mock.patch('orders.gateway.logger'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(window=30, min_calls=4, error_rate=0.5, cooldown=10)
+
+    def trip(self):
+        for ok in (True, True, False, False):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(ok)
+
+    def test_opens_at_error_rate_after_min_calls(self):
+        for ok in (False, False, False):
+            self.breaker.record(ok)
+        # Замало викликів для рішення
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.retry_after(), 10)
+
+    def test_old_results_leave_the_window(self):
+        self.breaker.record(False)
+        self.breaker.record(False)
+        self.now += 31
+        self.breaker.record(True)
+        self.breaker.record(False)
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_half_open_lets_one_trial_through(self):
+        self.trip()
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, 'half_open')
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_opens_again(self):
+        self.trip()
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertFalse(self.breaker.allow())
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+
+    def test_cancelled_trial_can_be_retried(self):
+        self.trip()
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.cancel_trial()
+        self.assertTrue(self.breaker.allow())
+
+
+class GatewayTests(SimpleTestCase):
+    class Client:
+        def __init__(self):
+            self.release = threading.Event()
+
+        def ok(self):
+            return 'ok'
+
+        def declined(self):
+            raise payments.PaymentError('Картку відхилено')
+
+        def down(self):
+            raise payments.PaymentUnavailable()
+
+        def hang(self):
+            self.release.wait(5)
+            return 'late'
+
+    def gateway(self, **kwargs):
+        client = self.Client()
+        gateway = Gateway(client, unavailable=payments.PaymentUnavailable, **kwargs)
+        self.addCleanup(gateway.pool.shutdown, wait=True)
+        self.addCleanup(client.release.set)
+        return client, gateway
+
+    def test_timeout_counts_as_failure(self):
+        client, gateway = self.gateway(timeout=0.05, breaker=CircuitBreaker(min_calls=1))
+        with self.assertRaises(payments.PaymentUnavailable), self.assertLogs('orders.gateway', 'WARNING'):
+            gateway.hang()
+        self.assertEqual(gateway.metrics()['timeouts'], 1)
+        self.assertEqual(gateway.breaker.state, 'open')
+        with self.assertRaises(payments.PaymentUnavailable):
+            gateway.ok()
+        self.assertEqual(gateway.metrics()['short_circuited'], 1)
+
+    def test_business_errors_do_not_trip_the_breaker(self):
+        client, gateway = self.gateway(breaker=CircuitBreaker(min_calls=2))
+        for _ in range(3):
+            with self.assertRaises(payments.PaymentError):
+                gateway.declined()
+        self.assertEqual(gateway.breaker.state, 'closed')
+        with self.assertLogs('orders.gateway', 'WARNING'):
+            for _ in range(3):
+                with self.assertRaises(payments.PaymentUnavailable):
+                    gateway.down()
+        self.assertEqual(gateway.breaker.state, 'open')
+
+    def test_bulkhead_rejects_when_all_slots_are_busy(self):
+        client, gateway = self.gateway(timeout=5, concurrency=1)
+        worker = threading.Thread(target=gateway.hang)
+        worker.start()
+        self.addCleanup(worker.join)
+        while not gateway.metrics()['in_flight']:
+            pass
+        with mock.patch('orders.gateway.BULKHEAD_WAIT', 0.01), \
+                self.assertRaises(payments.PaymentUnavailable):
+            gateway.ok()
+        self.assertEqual(gateway.metrics()['rejected'], 1)
+        client.release.set()
+        worker.join()
+        self.assertEqual(gateway.ok(), 'ok')
+
+
+class OrderStatusTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('buyer', password='pw12345!')
+        self.order = make_order({self.other: 1})
+        self.order.user = self.user
+        self.order.save()
+        self.url = f'/orders/status/{self.order.pk}/'
+
+    def test_only_owner_can_read_status(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), {'paid': False, 'status': 'pending'})
+
+    def test_checkout_session_can_read_status(self):
+        session = self.client.session
+        session['order_id'] = self.order.pk
+        session.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_unchanged_status_is_not_modified(self):
+        self.client.force_login(self.user)
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        Order.objects.filter(pk=self.order.pk).update(paid=True, status='processing')
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_wait_is_short_under_wsgi(self):
+        self.client.force_login(self.user)
+        etag = self.client.get(self.url)['ETag']
+        with mock.patch.object(views, 'STATUS_MAX_WAIT_WSGI', 0), \
+                mock.patch.object(views.asyncio, 'sleep') as sleep:
+            response = self.client.get(f'{self.url}?wait=25', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        sleep.assert_not_called()
+
+    async def test_wait_returns_as_soon_as_status_changes(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        etag = response['ETag']
+        changes = [{'paid': False, 'status': 'pending'}, {'paid': True, 'status': 'processing'}]
+        with mock.patch.object(views, 'STATUS_POLL_INTERVAL', 0.01), \
+                mock.patch.object(views, '_aorder_status', side_effect=[changes[0], *changes]):
+            response = await self.async_client.get(
+                f'{self.url}?wait=25', headers={'If-None-Match': etag}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), changes[1])
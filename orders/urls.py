@@ -7,8 +7,10 @@ urlpatterns = [
     path('create/', views.order_create, name='order_create'),
     path('payment/<int:order_id>/', views.payment_process, name='payment_process'),
     path('payment/success/<int:order_id>/', views.payment_success, name='payment_success'),
+    path('status/<int:order_id>/', views.order_status, name='order_status'),
     path('detail/<int:order_id>/', views.order_detail, name='order_detail'),
     path('history/', views.order_history, name='order_history'),
     path('success/', views.order_success, name='order_success'),
     path('webhook/', views.stripe_webhook, name='stripe_webhook'),
+    path('gateway/metrics/', views.payment_gateway_metrics, name='payment_gateway_metrics'),
 ]
\ No newline at end of file
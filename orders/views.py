@@ -1,59 +1,54 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib import messages
 from django.urls import reverse
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
+import asyncio
+import hashlib
 import json
+import time
+from asgiref.sync import sync_to_async
 from .models import Order, OrderItem
 from .forms import OrderCreateForm
-from cart.cart import Cart
+from cart.cart import get_cart
+from .checkout import CheckoutError, place_order
+from . import payments, stock, webhooks
+from .payments import stripe
+from .stock import OutOfStock
 
-try:
-    import stripe
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-except ImportError:
-    stripe = None
+# Довге опитування статусу: як часто перевіряти БД і найдовше очікування, с.
+# Під WSGI очікування тримає потік воркера, тому там воно коротке
+STATUS_POLL_INTERVAL = 1
+STATUS_MAX_WAIT = 25
+STATUS_MAX_WAIT_WSGI = 2
 
 def order_create(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     if len(cart) == 0:
         return redirect('cart:cart_detail')
     
     if request.method == 'POST':
         form = OrderCreateForm(request.POST)
         if form.is_valid():
-            order = form.save(commit=False)
-            if request.user.is_authenticated:
-                order.user = request.user
-            order.total_price = cart.get_total_price()
-            order.save()
-            
-            for item in cart:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item['product'],
-                    price=item['price'],
-                    quantity=item['quantity']
-                )
-            
-            # Очищаємо кошик перед збереженням сесії
-            cart.clear()
-            
-            # Зберігаємо order_id після очищення кошика
+            try:
+                order, timings = place_order(request, form)
+            except (CheckoutError, OutOfStock) as e:
+                messages.error(request, str(e))
+                return redirect('cart:cart_detail')
+
             request.session['order_id'] = order.id
-            
-            # Переконуємося, що сесія не містить Decimal об'єктів
-            # Очищаємо кошик з сесії, якщо він там залишився
-            from django.conf import settings
-            if settings.CART_SESSION_ID in request.session:
-                del request.session[settings.CART_SESSION_ID]
-            
-            request.session.modified = True
-            
+
             # Перенаправляємо на сторінку оплати Stripe
-            return redirect(reverse('orders:payment_process', args=[order.id]))
+            response = redirect(reverse('orders:payment_process', args=[order.id]))
+            response['Server-Timing'] = timings.header()
+            return response
             
     else:
         form = OrderCreateForm()
@@ -88,91 +83,113 @@ def order_history(request):
     orders = Order.objects.filter(user=request.user).order_by('-created')
     return render(request, 'orders/order_history.html', {'orders': orders})
 
-def payment_process(request, order_id):
-    if stripe is None:
-        return render(request, 'orders/payment.html', {
-            'order': get_object_or_404(Order, id=order_id),
-            'error': 'Stripe не встановлено. Будь ласка, встановіть: pip install stripe',
-            'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
-        })
-    
-    order = get_object_or_404(Order, id=order_id)
+async def _aget_order(order_id):
+    try:
+        return await Order.objects.aget(id=order_id)
+    except Order.DoesNotExist:
+        raise Http404
+
+# Шаблони з контекст-процесорами (кошик, користувач) звертаються до БД
+# синхронно, тому рендеринг асинхронних в'юх іде через sync_to_async
+arender = sync_to_async(render)
+
+async def payment_process(request, order_id):
+    order = await _aget_order(order_id)
+    context = {
+        'order': order,
+        'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
+    }
+    try:
+        # Stripe викликається, лише якщо локальна копія платежу застаріла
+        context['client_secret'] = await payments.aensure_intent(order)
+    except payments.PaymentUnavailable as e:
+        return await sync_to_async(payment_unavailable)(request, order, e)
+    except payments.PaymentError as e:
+        context['error'] = str(e)
+    return await arender(request, 'orders/payment.html', context)
+
+def payment_unavailable(request, order, error):
+    response = render(request, 'orders/payment_unavailable.html', {
+        'order': order,
+        'retry_after': error.retry_after,
+    }, status=503)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+@staff_member_required
+def payment_gateway_metrics(request):
+    try:
+        return JsonResponse(payments.get_client().metrics())
+    except payments.PaymentError as e:
+        return JsonResponse({'error': str(e)}, status=503)
+
+def _mark_paid(request, order):
+    stock.settle_paid(order)
     
-    if request.method == 'POST':
-        try:
-            # Створюємо Payment Intent в Stripe
-            intent = stripe.PaymentIntent.create(
-                amount=int(order.total_price * 100),  # Конвертуємо в копійки
-                currency='uah',
-                metadata={
-                    'order_id': order.id,
-                    'customer_email': order.email,
-                },
-            )
-            
-            order.stripe_payment_intent_id = intent.id
-            order.save()
-            
-            return render(request, 'orders/payment.html', {
-                'order': order,
-                'client_secret': intent.client_secret,
-                'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
-            })
-        except stripe.error.StripeError as e:
-            return render(request, 'orders/payment.html', {
-                'order': order,
-                'error': str(e),
-                'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
-            })
-    else:
-        try:
-            # Перевіряємо, чи вже є payment intent
-            if order.stripe_payment_intent_id:
-                intent = stripe.PaymentIntent.retrieve(order.stripe_payment_intent_id)
-            else:
-                # Створюємо новий Payment Intent
-                intent = stripe.PaymentIntent.create(
-                    amount=int(order.total_price * 100),
-                    currency='uah',
-                    metadata={
-                        'order_id': order.id,
-                        'customer_email': order.email,
-                    },
-                )
-                order.stripe_payment_intent_id = intent.id
-                order.save()
-            
-            return render(request, 'orders/payment.html', {
-                'order': order,
-                'client_secret': intent.client_secret,
-                'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
-            })
-        except stripe.error.StripeError as e:
-            return render(request, 'orders/payment.html', {
-                'order': order,
-                'error': str(e),
-                'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
-            })
+    # Очищаємо кошик
+    cart = get_cart(request)
+    cart.clear()
 
-def payment_success(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
+async def payment_success(request, order_id):
+    order = await _aget_order(order_id)
     
-    # Перевіряємо статус оплати через Stripe
-    if order.stripe_payment_intent_id and stripe:
+    # Перевіряємо статус оплати; вебхук зазвичай уже оновив його локально
+    if not order.paid and order.stripe_payment_intent_id:
         try:
-            intent = stripe.PaymentIntent.retrieve(order.stripe_payment_intent_id)
-            if intent.status == 'succeeded' and not order.paid:
-                order.paid = True
-                order.status = 'processing'
-                order.save()
-                
-                # Очищаємо кошик
-                cart = Cart(request)
-                cart.clear()
-        except Exception:
+            await payments.arefresh_intent(order, max_age=payments.CONFIRM_SYNC_TTL)
+        except payments.PaymentError:
             pass
+        if order.payment_status == 'succeeded':
+            await sync_to_async(_mark_paid)(request, order)
     
-    return render(request, 'orders/order_success.html', {'order': order})
+    return await arender(request, 'orders/order_success.html', {'order': order})
+
+async def _aorder_status(order_id):
+    # Лише два поля за первинним ключем - запит дешевий навіть для частого опитування
+    status = await Order.objects.filter(id=order_id).values('paid', 'status').afirst()
+    if status is None:
+        raise Http404
+    return status
+
+def _status_etag(status):
+    return '"%s"' % hashlib.md5(f'{status["paid"]}:{status["status"]}'.encode()).hexdigest()[:16]
+
+async def _aowns_order(request, order_id):
+    # Як order_detail: власник замовлення або сесія, в якій його оформили
+    if await request.session.aget('order_id') == order_id:
+        return True
+    user = await request.auser()
+    return user.is_authenticated and await Order.objects.filter(id=order_id, user=user).aexists()
+
+async def order_status(request, order_id):
+    """
+    Стан оплати для сторінки, що чекає на підтвердження. Якщо стан із
+    If-None-Match не змінився, а в запиті є ?wait=N, відповідь чекає на
+    зміну до N секунд, після чого - 304. Під ASGI N не більше
+    STATUS_MAX_WAIT, під WSGI - STATUS_MAX_WAIT_WSGI.
+    """
+    if not await _aowns_order(request, order_id):
+        raise Http404
+    status = await _aorder_status(order_id)
+    etag = _status_etag(status)
+    known = parse_etags(request.headers.get('If-None-Match', ''))
+
+    if etag in known:
+        try:
+            max_wait = STATUS_MAX_WAIT if isinstance(request, ASGIRequest) else STATUS_MAX_WAIT_WSGI
+            wait = min(max(int(request.GET.get('wait', 0)), 0), max_wait)
+        except ValueError:
+            wait = 0
+        deadline = time.monotonic() + wait
+        while etag in known and time.monotonic() < deadline:
+            await asyncio.sleep(min(STATUS_POLL_INTERVAL, deadline - time.monotonic()))
+            status = await _aorder_status(order_id)
+            etag = _status_etag(status)
+
+    response = HttpResponseNotModified() if etag in known else JsonResponse(status)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @csrf_exempt
 @require_POST
@@ -190,24 +207,9 @@ def stripe_webhook(request):
         )
     except ValueError:
         return HttpResponse(status=400)
-    except stripe.error.SignatureVerificationError:
+    except stripe.SignatureVerificationError:
         return HttpResponse(status=400)
     
-    # Обробка подій
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        order_id = payment_intent['metadata'].get('order_id')
-        
-        if order_id:
-            try:
-                order = Order.objects.get(id=order_id)
-                order.paid = True
-                order.status = 'processing'
-                order.save()
-                
-                # Очищаємо кошик
-                # (потрібно буде зберігати session_id в order для цього)
-            except Order.DoesNotExist:
-                pass
-    
-    return HttpResponse(status=200)
\ No newline at end of file
+    # Лише записуємо подію й одразу відповідаємо - обробляє process_webhooks
+    webhooks.record(json.loads(payload))
+    return HttpResponse(status=200)
@@ -0,0 +1,193 @@
+import logging
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import Q
+from django.utils import timezone
+from . import payments, stock
+from .db import write_atomic
+from .models import Order, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+CLAIM_BATCH_SIZE = 100
+# Скільки воркер може тримати подію, перш ніж її забере інший процес
+LOCK_TIMEOUT = 60 * 5
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 5
+BACKOFF_MAX = 60 * 60
+
+
+def payment_intent_id(event):
+    obj = event['data']['object']
+    if obj.get('object') == 'payment_intent':
+        return obj.get('id') or ''
+    return obj.get('payment_intent') or ''
+
+
+def record(event):
+    """
+    Записує подію в чергу. Повторна доставка того самого id нічого не
+    змінює - повертає False.
+    """
+    _, created = WebhookEvent.objects.get_or_create(
+        event_id=event['id'],
+        defaults={
+            'type': event['type'],
+            'payment_intent': payment_intent_id(event),
+            'payload': event,
+            'occurred': datetime.fromtimestamp(event['created'], tz=dt_timezone.utc),
+        },
+    )
+    return created
+
+
+def _order_for(obj, intent_id):
+    order_id = (obj.get('metadata') or {}).get('order_id')
+    if order_id:
+        return Order.objects.filter(id=order_id).first()
+    if intent_id:
+        return Order.objects.filter(stripe_payment_intent_id=intent_id).first()
+    return None
+
+
+def handle_succeeded(order, obj):
+    if not order.paid:
+        stock.settle_paid(order)
+
+
+def handle_failed(order, obj):
+    # Відмова картки не остаточна - покупець може спробувати ще раз, тож
+    # резерв лишається до скасування платежу чи закінчення строку
+    logger.info('payment failed order=%s', order.pk)
+
+
+def handle_canceled(order, obj):
+    if not order.paid and order.status != 'cancelled':
+        order.status = 'cancelled'
+        # Сигнал order_cancelled поверне товар на склад
+        order.save()
+
+
+def handle_refunded(order, obj):
+    # Часткове повернення замовлення не скасовує
+    if obj.get('refunded') or obj.get('amount_refunded', 0) >= obj.get('amount', 0):
+        order.paid = False
+        order.status = 'refunded'
+        order.save()
+
+
+HANDLERS = {
+    'payment_intent.succeeded': handle_succeeded,
+    'payment_intent.payment_failed': handle_failed,
+    'payment_intent.canceled': handle_canceled,
+    'charge.refunded': handle_refunded,
+}
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim(batch_size=CLAIM_BATCH_SIZE, now=None):
+    """
+    Забирає готові до обробки події й групує їх за PaymentIntent у
+    порядку часу в Stripe. Подія не береться, поки подію того ж
+    PaymentIntent обробляє інший воркер, вона чекає на повтор або
+    потрапила в failed - до retry_failed() черга цього платежу стоїть.
+    Обидва фільтри - в SQL, до LIMIT, щоб події у відкладенні не
+    займали всю пачку. Повертає список груп [[event, ...], ...].
+    """
+    now = now or timezone.now()
+    blocked = (
+        WebhookEvent.objects.filter(
+            Q(status='processing', locked_until__gte=now) |
+            Q(status='pending', next_attempt__gt=now) |
+            Q(status='failed')
+        )
+        .exclude(payment_intent='')
+        .values('payment_intent')
+    )
+    candidates = (
+        WebhookEvent.objects.filter(
+            Q(status='pending') | Q(status='processing', locked_until__lt=now)
+        )
+        .filter(Q(next_attempt__isnull=True) | Q(next_attempt__lte=now))
+        .exclude(payment_intent__in=blocked)
+        .order_by('occurred', 'id')[:batch_size]
+    )
+    busy = set()
+    groups = {}
+    for event in candidates:
+        key = event.payment_intent or event.event_id
+        if key in busy:
+            continue
+        # Умовний UPDATE - подію забирає лише один процес
+        locked_until = now + timedelta(seconds=LOCK_TIMEOUT)
+        claimed = WebhookEvent.objects.filter(
+            pk=event.pk, status=event.status, locked_until=event.locked_until
+        ).update(status='processing', locked_until=locked_until)
+        if not claimed:
+            busy.add(key)
+            continue
+        event.status = 'processing'
+        event.locked_until = locked_until
+        groups.setdefault(key, []).append(event)
+    return list(groups.values())
+
+
+def retry_failed(payment_intent=None):
+    """Повертає failed-події в чергу з нуля спроб. Повертає їх кількість."""
+    events = WebhookEvent.objects.filter(status='failed')
+    if payment_intent:
+        events = events.filter(payment_intent=payment_intent)
+    return events.update(status='pending', attempts=0, next_attempt=None, last_error='')
+
+
+def process(event):
+    """Застосовує одну подію. Повертає True, якщо вона оброблена."""
+    handler = HANDLERS.get(event.type)
+    try:
+        with write_atomic():
+            if handler is not None:
+                obj = event.payload['data']['object']
+                order = _order_for(obj, event.payment_intent)
+                if order is not None:
+                    # Подія старого, вже заміненого платежу копію не чіпає
+                    if obj.get('object') == 'payment_intent' and \
+                            order.stripe_payment_intent_id in (None, '', obj['id']):
+                        payments.mirror(order, obj)
+                    handler(order, obj)
+            WebhookEvent.objects.filter(pk=event.pk).update(
+                status='done', processed=timezone.now(), locked_until=None, attempts=event.attempts + 1
+            )
+        return True
+    except Exception as e:
+        attempts = event.attempts + 1
+        failed = attempts >= MAX_ATTEMPTS
+        WebhookEvent.objects.filter(pk=event.pk).update(
+            status='failed' if failed else 'pending',
+            attempts=attempts,
+            next_attempt=None if failed else timezone.now() + backoff(attempts),
+            locked_until=None,
+            last_error=repr(e),
+        )
+        logger.warning('webhook %s %s attempt %s failed: %r', event.type, event.event_id, attempts, e)
+        return False
+
+
+def process_group(events):
+    """
+    Події одного PaymentIntent - строго по черзі. Після невдачі решту
+    повертаємо в чергу, щоб пізніша подія не обігнала ранішу.
+    """
+    done = 0
+    for index, event in enumerate(events):
+        if process(event):
+            done += 1
+            continue
+        rest = [later.pk for later in events[index + 1:]]
+        if rest:
+            WebhookEvent.objects.filter(pk__in=rest).update(status='pending', locked_until=None)
+        break
+    return done
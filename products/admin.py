@@ -1,4 +1,7 @@
+from django import forms
 from django.contrib import admin
+from django.db.models import F
+from django.db.models.functions import Greatest
 from .models import Category, Product
 
 @admin.register(Category)
@@ -6,12 +9,53 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'slug']
     prepopulated_fields = {'slug': ('name',)}
 
+
+class ProductAdminForm(forms.ModelForm):
+    stock_change = forms.IntegerField(
+        label='Змінити залишок на',
+        required=False,
+        initial=0,
+        help_text='Прихід - додатне число, списання - від\'ємне'
+    )
+
+    class Meta:
+        model = Product
+        fields = '__all__'
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'price', 'available', 'is_bestseller', 'created']
+    form = ProductAdminForm
+    list_display = ['name', 'category', 'price', 'available', 'stock', 'is_bestseller', 'created']
     list_filter = ['available', 'category', 'scent_type', 'created']
+    # Залишок змінює й checkout: число з відкритої сторінки затерло б
+    # резерви, зроблені після її завантаження. Тож лише різницею
     list_editable = ['price', 'available']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name', 'description']
     date_hierarchy = 'created'
-    ordering = ['-created']
\ No newline at end of file
+    ordering = ['-created']
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return super().get_readonly_fields(request, obj)
+        return [*super().get_readonly_fields(request, obj), 'stock']
+
+    def get_fields(self, request, obj=None):
+        fields = super().get_fields(request, obj)
+        if obj is None:
+            return [field for field in fields if field != 'stock_change']
+        return fields
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Залишок з моменту завантаження форми не записуємо
+        obj.save(update_fields=[
+            field.name for field in obj._meta.concrete_fields
+            if not field.primary_key and field.name != 'stock'
+        ])
+        delta = form.cleaned_data.get('stock_change')
+        if delta:
+            Product.objects.filter(pk=obj.pk).update(stock=Greatest(F('stock') + delta, 0))
+            obj.refresh_from_db(fields=['stock'])
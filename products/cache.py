@@ -0,0 +1,75 @@
+import time
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog'
+CATEGORY_VERSION_KEY = 'category'
+
+
+def _get_version(key):
+    # Версія живе в базі, а не в кеші: локальний кеш у кожного процесу
+    # свій, і bump в одному процесі інші б не побачили. Версія - час
+    # останньої зміни, тому її можна віддавати як Last-Modified
+    from .models import CatalogVersion
+
+    version = CatalogVersion.objects.filter(key=key).values_list('value', flat=True).first()
+    if version is None:
+        CatalogVersion.objects.bulk_create([CatalogVersion(key=key, value=time.time())], ignore_conflicts=True)
+        version = CatalogVersion.objects.values_list('value', flat=True).get(key=key)
+    return version
+
+
+def _bump_version(key):
+    from .models import CatalogVersion
+
+    CatalogVersion.objects.update_or_create(key=key, defaults={'value': time.time()})
+
+
+def catalog_version():
+    """Змінюється при будь-якій зміні товарів, категорій чи відгуків."""
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def category_version():
+    return _get_version(CATEGORY_VERSION_KEY)
+
+
+def bump_catalog_version():
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def bump_category_version():
+    _bump_version(CATEGORY_VERSION_KEY)
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+FAVORITES_TIMEOUT = 60 * 60 * 24
+
+
+def favorites_key(user_id):
+    return f'products:favorites:{user_id}'
+
+
+def favorite_ids(request):
+    """
+    Множина id улюблених товарів користувача для перевірки карток за O(1).
+    Один запит на промах кешу, далі - з кешу й з request до кінця запиту.
+    """
+    # На спільній сторінці серце підсвічує JS, сесію не чіпаємо
+    if getattr(request, 'public_shell', False) or not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, '_favorite_ids'):
+        from .models import Favorite
+
+        key = favorites_key(request.user.pk)
+        ids = cache.get(key)
+        if ids is None:
+            ids = frozenset(
+                Favorite.objects.filter(user=request.user).values_list('product_id', flat=True)
+            )
+            cache.set(key, ids, FAVORITES_TIMEOUT)
+        request._favorite_ids = ids
+    return request._favorite_ids
+
+
+def invalidate_favorites(user_id):
+    cache.delete(favorites_key(user_id))
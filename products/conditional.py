@@ -0,0 +1,52 @@
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from django.views.decorators.http import condition
+from .cache import catalog_version
+from .models import Product
+
+
+def make_etag(request, *parts):
+    # Сторінки - спільна оболонка (public_shell), тож валідатор не залежить від відвідувача
+    key = [*parts, request.get_full_path(), request.headers.get('X-Requested-With')]
+    return hashlib.md5(repr(key).encode()).hexdigest()
+
+
+def _last_modified(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def catalog_etag(request, *args, **kwargs):
+    return make_etag(request, catalog_version())
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return _last_modified(catalog_version())
+
+
+def _product_updated(request, slug):
+    if not hasattr(request, '_product_updated'):
+        request._product_updated = (
+            Product.objects.filter(slug=slug, available=True)
+            .values_list('updated', flat=True)
+            .first()
+        )
+    return request._product_updated
+
+
+def product_etag(request, slug):
+    updated = _product_updated(request, slug)
+    if updated is None:
+        return None
+    # Версія каталогу - бо сторінка містить ще й схожі/супутні товари
+    return make_etag(request, updated.isoformat(), catalog_version())
+
+
+def product_last_modified(request, slug):
+    updated = _product_updated(request, slug)
+    if updated is None:
+        return None
+    return _last_modified(max(updated.timestamp(), catalog_version()))
+
+
+catalog_condition = condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+product_condition = condition(etag_func=product_etag, last_modified_func=product_last_modified)
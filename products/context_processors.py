@@ -0,0 +1,8 @@
+from .shell import is_public_shell
+
+
+def public_shell(request):
+    # NOTPROVIDED - {% csrf_token %} нічого не виводить і не ставить cookie
+    if is_public_shell(request):
+        return {'public_shell': True, 'csrf_token': 'NOTPROVIDED'}
+    return {}
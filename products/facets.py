@@ -0,0 +1,132 @@
+import hashlib
+from decimal import Decimal
+from django.core.cache import cache
+from django.db.models import Q, Count, Min, Max
+from .cache import catalog_version, category_version
+from .models import Category, Product
+
+FACETS_TIMEOUT = 60 * 10
+
+BADGES = [
+    ('bestseller', 'Бестселери', Q(is_bestseller=True)),
+    ('exclusive', 'Ексклюзив', Q(is_exclusive=True)),
+    ('limited', 'Обмежена серія', Q(is_limited=True)),
+]
+
+# Межі кошиків гістограми цін; None - без верхньої межі
+PRICE_BUCKETS = [0, 1000, 2000, 3000, 5000, 10000, None]
+# Ціни з копійками: кошик "до 1000" - це price <= 999.99, тобто та сама
+# умова, що й фільтр max_price у каталозі
+PRICE_STEP = Decimal('0.01')
+
+
+def get_categories():
+    key = f'products:categories:{category_version()}'
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.values('id', 'name', 'slug'))
+        cache.set(key, categories, None)
+    return categories
+
+
+def price_buckets():
+    """Список (min, max, підпис, умова); max включно, як у фільтрі каталогу."""
+    buckets = []
+    for low, high in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:]):
+        upper = high - PRICE_STEP if high is not None else None
+        if high is None:
+            label = f'від {low} ₴'
+            condition = Q(price__gte=low)
+        elif not low:
+            label = f'до {high} ₴'
+            condition = Q(price__lte=upper)
+        else:
+            label = f'{low} – {high} ₴'
+            condition = Q(price__gte=low, price__lte=upper)
+        buckets.append((low, upper, label, condition))
+    return buckets
+
+
+def _combine(filters, exclude=None):
+    condition = Q()
+    for name, q in filters.items():
+        if name != exclude and q is not None:
+            condition &= q
+    return condition
+
+
+def compute_facets(filters):
+    """
+    Рахує всі лічильники бокової панелі одним агрегатним запитом.
+
+    filters - словник {вимір: Q або None} для category, scent_type, badge,
+    price і search. Лічильники кожного виміру враховують усі фільтри,
+    крім власного (щоб "Woody (14)" показував, скільки буде після вибору).
+    """
+    categories = get_categories()
+    buckets = price_buckets()
+    aggregates = {
+        'total': Count('id', filter=_combine(filters)),
+        'min_price': Min('price'),
+        'max_price': Max('price'),
+    }
+
+    without_category = _combine(filters, 'category')
+    for category in categories:
+        aggregates[f'category_{category["id"]}'] = Count(
+            'id', filter=without_category & Q(category_id=category['id'])
+        )
+
+    without_scent = _combine(filters, 'scent_type')
+    for value, label in Product.SCENT_CHOICES:
+        aggregates[f'scent_{value}'] = Count(
+            'id', filter=without_scent & Q(scent_type=value)
+        )
+
+    without_badge = _combine(filters, 'badge')
+    for value, label, condition in BADGES:
+        aggregates[f'badge_{value}'] = Count('id', filter=without_badge & condition)
+
+    without_price = _combine(filters, 'price')
+    for index, (low, high, label, condition) in enumerate(buckets):
+        aggregates[f'price_{index}'] = Count('id', filter=without_price & condition)
+
+    row = Product.objects.filter(available=True).aggregate(**aggregates)
+
+    return {
+        'total': row['total'],
+        'price_range': {
+            'min_price': row['min_price'] if row['min_price'] is not None else 0,
+            'max_price': row['max_price'] if row['max_price'] is not None else 10000,
+        },
+        'categories': [
+            {**category, 'count': row[f'category_{category["id"]}']}
+            for category in categories
+        ],
+        'scent_types': [
+            {'value': value, 'label': label, 'count': row[f'scent_{value}']}
+            for value, label in Product.SCENT_CHOICES
+        ],
+        'badges': [
+            {'value': value, 'label': label, 'count': row[f'badge_{value}']}
+            for value, label, condition in BADGES
+        ],
+        'price_buckets': [
+            {'min': low, 'max': high, 'label': label, 'count': row[f'price_{index}']}
+            for index, (low, high, label, condition) in enumerate(buckets)
+        ],
+    }
+
+
+def get_facets(filters, params):
+    """
+    Кешований знімок фасетів. params - нормалізовані значення фільтрів,
+    ключ містить версію каталогу, тож будь-яка зміна товарів його скидає.
+    """
+    digest = hashlib.md5(repr(sorted(params.items())).encode()).hexdigest()
+    key = f'products:facets:{catalog_version()}:{digest}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        cache.set(key, facets, FACETS_TIMEOUT)
+    return facets
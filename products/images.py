@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (320, 640, 960, 1280)
+VARIANT_DIR = 'products/variants'
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+SIZES = {
+    'card': '(max-width: 768px) 100vw, (max-width: 1200px) 50vw, 380px',
+    'hero': '(max-width: 768px) 100vw, 50vw',
+    'related': '(max-width: 768px) 50vw, 280px',
+    'thumb': '100px',
+}
+
+
+def variant_name(source_name, width, extension):
+    # Хеш шляху, щоб однакові імена файлів з різних завантажень не конфліктували
+    digest = hashlib.md5(source_name.encode()).hexdigest()[:8]
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return f'{VARIANT_DIR}/{stem}-{digest}-{width}.{extension}'
+
+
+def generate_variants(source_name, media_root=None, widths=VARIANT_WIDTHS):
+    """
+    Створює зменшені копії зображення (JPEG/PNG + WebP) для кожної ширини
+    й повертає маніфест. Не торкається БД, тож придатна для ProcessPool.
+    """
+    if Image is None:
+        raise RuntimeError('Pillow не встановлено')
+    media_root = str(media_root or settings.MEDIA_ROOT)
+    source_path = os.path.join(media_root, source_name)
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        fallback_format, fallback_ext = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+
+        targets = sorted({w for w in widths if w < image.width} | {min(image.width, max(widths))})
+        manifest = {
+            'source': source_name,
+            'width': image.width,
+            'height': image.height,
+            'fallback': {},
+            'webp': {},
+        }
+        for width in targets:
+            height = round(image.height * width / image.width)
+            resized = image if width == image.width else image.resize(
+                (width, height), Image.LANCZOS
+            )
+            for key, fmt, ext, options in (
+                ('fallback', fallback_format, fallback_ext,
+                 {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}
+                 if fallback_format == 'JPEG' else {'optimize': True}),
+                ('webp', 'WEBP', 'webp', {'quality': WEBP_QUALITY, 'method': 6}),
+            ):
+                name = variant_name(source_name, width, ext)
+                path = os.path.join(media_root, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                resized.save(path, fmt, **options)
+                manifest[key][str(width)] = name
+    return manifest
+
+
+def needs_variants(product):
+    return bool(product.image) and (
+        not product.image_variants or
+        product.image_variants.get('source') != product.image.name
+    )
+
+
+def save_manifest(product_id, manifest):
+    from .cache import bump_catalog_version
+    from .models import Product
+
+    # Умова на image - щоб не записати маніфест старого файлу поверх нового
+    updated = Product.objects.filter(
+        pk=product_id, image=manifest['source']
+    ).update(image_variants=manifest, updated=timezone.now())
+    if updated:
+        bump_catalog_version()
+    return bool(updated)
+
+
+def process_product(product_id):
+    from .models import Product
+
+    product = Product.objects.filter(pk=product_id).only('image', 'image_variants').first()
+    if product is None or not needs_variants(product):
+        return False
+    manifest = generate_variants(product.image.name)
+    return save_manifest(product_id, manifest)
+
+
+class ImageWorker:
+    """Фоновий потік, що обробляє зображення поза циклом запиту."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def enqueue(self, product_id):
+        self.queue.put(product_id)
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='product-image-worker', daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        while True:
+            product_id = self.queue.get()
+            try:
+                close_old_connections()
+                process_product(product_id)
+            except Exception:
+                logger.exception('Не вдалося обробити зображення товару %s', product_id)
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+
+worker = ImageWorker()
+
+
+def schedule(product_id):
+    if Image is None:
+        return
+    if getattr(settings, 'PRODUCT_IMAGE_WORKER', True):
+        worker.enqueue(product_id)
+    else:
+        process_product(product_id)
+
+
+def variant_srcset(product, key):
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w'
+        for width, name in sorted(
+            product.image_variants.get(key, {}).items(), key=lambda item: int(item[0])
+        )
+    )
@@ -0,0 +1,55 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from products import images
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Генерує зменшені копії та WebP-варіанти зображень товарів у кількох процесах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перегенерувати навіть наявні варіанти'
+        )
+
+    def handle(self, *args, **options):
+        if images.Image is None:
+            raise CommandError('Pillow не встановлено')
+
+        products = Product.objects.exclude(image='').only('image', 'image_variants')
+        jobs = [
+            (product.pk, product.image.name)
+            for product in products.iterator()
+            if options['force'] or images.needs_variants(product)
+        ]
+        if not jobs:
+            self.stdout.write('Усі зображення вже оброблено.')
+            return
+
+        # Дочірні процеси не працюють з БД, тож не успадковуємо з'єднання
+        connections.close_all()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(images.generate_variants, name, str(settings.MEDIA_ROOT)): pk
+                for pk, name in jobs
+            }
+            for future in as_completed(futures):
+                pk = futures[future]
+                try:
+                    manifest = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'Товар {pk}: {exc}')
+                    continue
+                if images.save_manifest(pk, manifest):
+                    done += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Оброблено зображень: {done}, помилок: {failed}'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from products import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Оновлює рекомендації "також купують" за новими замовленнями'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Перерахувати з нуля за всіма замовленнями'
+        )
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K)
+        parser.add_argument('--batch-size', type=int, default=recommendations.ORDER_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if recommendations.np is None:
+            raise CommandError('NumPy не встановлено')
+        processed = recommendations.update(
+            full=options['full'],
+            k=options['top_k'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Оброблено замовлень: {processed}'))
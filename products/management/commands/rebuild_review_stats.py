@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products import ratings
+from products.cache import bump_catalog_version
+from products.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = 'Перераховує кількість відгуків, суму та гістограму оцінок для всіх товарів'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = ratings.rebuild(Product, Review, batch_size=options['batch_size'])
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Оновлено товарів: {updated}'))
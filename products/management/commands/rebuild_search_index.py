@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from products import search
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Перебудовує повнотекстовий індекс пошуку товарів (SQLite FTS5)'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError(
+                'Індекс пошуку недоступний: потрібна SQLite з FTS5 та застосовані міграції.'
+            )
+        search.rebuild_index(Product.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f'Проіндексовано товарів: {Product.objects.count()}'
+        ))
@@ -0,0 +1,77 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# Копія нормалізації з products.search на момент міграції: міграція не
+# має залежати від коду, що змінюватиметься. Актуальний індекс -
+# manage.py rebuild_search_index
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'h', 'ґ': 'g', 'д': 'd', 'е': 'e',
+    'є': 'ie', 'ж': 'zh', 'з': 'z', 'и': 'y', 'і': 'i', 'ї': 'i', 'й': 'i',
+    'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'shch', 'ь': '', 'ю': 'iu', 'я': 'ia',
+    'ё': 'e', 'ы': 'y', 'э': 'e', 'ъ': '',
+}
+TOKEN_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[Ѐ-ӿ]')
+APOSTROPHES = str.maketrans('', '', '\'’ʼ`')
+
+
+def index_text(text):
+    text = unicodedata.normalize('NFC', (text or '').casefold()).translate(APOSTROPHES)
+    text = ''.join(
+        ch for ch in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(ch)
+    )
+    tokens = TOKEN_RE.findall(text)
+    latin = [
+        ''.join(TRANSLIT.get(ch, ch) for ch in token)
+        for token in tokens if CYRILLIC_RE.search(token)
+    ]
+    return ' '.join(tokens + latin)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS products_search USING fts5('
+        'name, description, category, '
+        'tokenize="unicode61 remove_diacritics 2")'
+    )
+    Product = apps.get_model('products', 'Product')
+    rows = [
+        (
+            product.id,
+            index_text(product.name),
+            index_text(product.description),
+            index_text(product.category.name),
+        )
+        for product in Product.objects.select_related('category').iterator(chunk_size=500)
+    ]
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO products_search (rowid, name, description, category) '
+                'VALUES (%s, %s, %s, %s)',
+                rows
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS products_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
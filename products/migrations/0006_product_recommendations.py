@@ -0,0 +1,54 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRecommendation',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendation', serialize=False, to='products.product', verbose_name='Товар')),
+                ('also_bought', models.JSONField(default=list, verbose_name='Також купують')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Оновлено')),
+            ],
+            options={
+                'verbose_name': 'Рекомендації товару',
+                'verbose_name_plural': 'Рекомендації товарів',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.PositiveBigIntegerField(default=0, verbose_name='Останнє замовлення')),
+                ('orders_processed', models.PositiveIntegerField(default=0, verbose_name='Оброблено замовлень')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Створено')),
+            ],
+            options={
+                'verbose_name': 'Запуск рекомендацій',
+                'verbose_name_plural': 'Запуски рекомендацій',
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPairCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Спільних замовлень')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product', verbose_name='Купували разом')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Спільна покупка',
+                'verbose_name_plural': 'Спільні покупки',
+                'unique_together': {('product', 'other')},
+            },
+        ),
+    ]
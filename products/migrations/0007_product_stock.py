@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, help_text='Порожнє поле - кількість не обліковується', null=True, verbose_name='Залишок'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+def reset_counts(apps, schema_editor):
+    # Старий курсор за id рахував і неоплачені замовлення - лічильники
+    # перебудує наступний запуск build_recommendations
+    apps.get_model('products', 'RecommendationRun').objects.all().delete()
+    apps.get_model('products', 'ProductPairCount').objects.all().delete()
+    apps.get_model('products', 'ProductRecommendation').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_stock'),
+        ('orders', '0006_order_paid_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationrun',
+            name='last_paid_at',
+            field=models.DateTimeField(null=True, verbose_name='Оплата останнього замовлення'),
+        ),
+        migrations.RunPython(reset_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:40
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast, Round
+
+
+def backfill_review_rating(apps, schema_editor):
+    # Раніше середня записувалась у rating; тепер вона окремо
+    Product = apps.get_model('products', 'Product')
+    Product.objects.filter(review_count__gt=0).update(
+        review_rating=Round(Cast(F('rating_sum'), FloatField()) / F('review_count'), 1)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_recommendationrun_last_paid_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_rating_6f555e_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_rating',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=2, null=True, verbose_name='Середня оцінка відгуків'),
+        ),
+        migrations.RunPython(backfill_review_rating, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('review_rating', 'rating', output_field=models.FloatField()), descending=True), models.OrderBy(models.F('id'), descending=True), name='product_display_rating_idx'),
+        ),
+    ]
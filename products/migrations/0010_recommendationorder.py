@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:46
+
+from django.db import migrations, models
+
+
+def reset_counts(apps, schema_editor):
+    # Наявні лічильники не знають, з яких замовлень складені, і їх не
+    # відняти - наступний запуск build_recommendations перебудує їх
+    for model in ('RecommendationRun', 'ProductPairCount', 'ProductRecommendation'):
+        apps.get_model('products', model).objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_review_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationOrder',
+            fields=[
+                ('order_id', models.PositiveBigIntegerField(primary_key=True, serialize=False, verbose_name='Замовлення')),
+                ('products', models.JSONField(default=list, verbose_name='Товари')),
+            ],
+            options={
+                'verbose_name': 'Враховане замовлення',
+                'verbose_name_plural': 'Враховані замовлення',
+            },
+        ),
+        migrations.RunPython(reset_counts, migrations.RunPython.noop),
+    ]
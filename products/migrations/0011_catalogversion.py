@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_recommendationorder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('value', models.FloatField(verbose_name='Версія')),
+            ],
+            options={
+                'verbose_name': 'Версія каталогу',
+                'verbose_name_plural': 'Версії каталогу',
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
@@ -34,14 +36,31 @@ class Product(models.Model):
     name = models.CharField('Назва', max_length=200)
     slug = models.SlugField(unique=True)
     image = models.ImageField('Зображення', upload_to='products/')
+    image_variants = models.JSONField('Варіанти зображення', default=dict, blank=True, editable=False)
     description = models.TextField('Опис')
     scent_type = models.CharField('Тип аромату', max_length=20, choices=SCENT_CHOICES)
     price = models.DecimalField('Ціна', max_digits=10, decimal_places=2)
     available = models.BooleanField('Доступний', default=True)
+    stock = models.PositiveIntegerField(
+        'Залишок', null=True, blank=True,
+        help_text='Порожнє поле - кількість не обліковується'
+    )
     is_bestseller = models.BooleanField('Бестселер', default=False)
     is_exclusive = models.BooleanField('Екслюзив', default=False)
     is_limited = models.BooleanField('Обмежена серія', default=False)
     rating = models.DecimalField('Рейтинг', max_digits=2, decimal_places=1, default=5.0)
+    # Середня оцінка відгуків; окремо від rating, який задає адмінка
+    review_rating = models.DecimalField(
+        'Середня оцінка відгуків', max_digits=2, decimal_places=1,
+        null=True, blank=True, editable=False
+    )
+    review_count = models.PositiveIntegerField('Кількість відгуків', default=0, editable=False)
+    rating_sum = models.PositiveIntegerField('Сума оцінок', default=0, editable=False)
+    rating_count_1 = models.PositiveIntegerField('Оцінок 1', default=0, editable=False)
+    rating_count_2 = models.PositiveIntegerField('Оцінок 2', default=0, editable=False)
+    rating_count_3 = models.PositiveIntegerField('Оцінок 3', default=0, editable=False)
+    rating_count_4 = models.PositiveIntegerField('Оцінок 4', default=0, editable=False)
+    rating_count_5 = models.PositiveIntegerField('Оцінок 5', default=0, editable=False)
     created = models.DateTimeField('Створено', auto_now_add=True)
     updated = models.DateTimeField('Оновлено', auto_now=True)
     
@@ -52,6 +71,14 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=['slug']),
             models.Index(fields=['-created']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['name', 'id']),
+            # Той самий вираз, що й ratings.display_rating() - сортування за рейтингом
+            models.Index(
+                Coalesce('review_rating', 'rating', output_field=models.FloatField()).desc(),
+                F('id').desc(),
+                name='product_display_rating_idx',
+            ),
         ]
     
     def __str__(self):
@@ -69,6 +96,20 @@ class Product(models.Model):
             return 'Обмежено'
         return None
 
+    @property
+    def rating_avg(self):
+        if not self.review_count or self.review_rating is None:
+            return self.rating
+        return self.review_rating
+
+    def get_rating_histogram(self):
+        histogram = []
+        for star in range(5, 0, -1):
+            count = getattr(self, f'rating_count_{star}')
+            percent = round(count * 100 / self.review_count) if self.review_count else 0
+            histogram.append({'star': star, 'count': count, 'percent': percent})
+        return histogram
+
 class Review(models.Model):
     product = models.ForeignKey(
         Product,
@@ -120,4 +161,87 @@ class Favorite(models.Model):
         unique_together = ['user', 'product']
         
     def __str__(self):
-        return f'{self.product.name} в обраному у {self.user.username}'
\ No newline at end of file
+        return f'{self.product.name} в обраному у {self.user.username}'
+
+class ProductPairCount(models.Model):
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Товар'
+    )
+    other = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Купували разом'
+    )
+    count = models.PositiveIntegerField('Спільних замовлень', default=0)
+
+    class Meta:
+        verbose_name = 'Спільна покупка'
+        verbose_name_plural = 'Спільні покупки'
+        unique_together = ['product', 'other']
+
+    def __str__(self):
+        return f'{self.product_id} + {self.other_id}: {self.count}'
+
+
+class ProductRecommendation(models.Model):
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recommendation',
+        verbose_name='Товар'
+    )
+    also_bought = models.JSONField('Також купують', default=list)
+    updated = models.DateTimeField('Оновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Рекомендації товару'
+        verbose_name_plural = 'Рекомендації товарів'
+
+    def __str__(self):
+        return f'Рекомендації для {self.product_id}'
+
+
+class CatalogVersion(models.Model):
+    key = models.CharField('Ключ', max_length=50, primary_key=True)
+    value = models.FloatField('Версія')
+
+    class Meta:
+        verbose_name = 'Версія каталогу'
+        verbose_name_plural = 'Версії каталогу'
+
+    def __str__(self):
+        return f'{self.key}: {self.value}'
+
+
+class RecommendationOrder(models.Model):
+    # Без FK на orders.Order: замовлення може зникнути, а його пари
+    # все одно треба відняти
+    order_id = models.PositiveBigIntegerField('Замовлення', primary_key=True)
+    products = models.JSONField('Товари', default=list)
+
+    class Meta:
+        verbose_name = 'Враховане замовлення'
+        verbose_name_plural = 'Враховані замовлення'
+
+    def __str__(self):
+        return f'Замовлення {self.order_id}'
+
+
+class RecommendationRun(models.Model):
+    last_paid_at = models.DateTimeField('Оплата останнього замовлення', null=True)
+    last_order_id = models.PositiveBigIntegerField('Останнє замовлення', default=0)
+    orders_processed = models.PositiveIntegerField('Оброблено замовлень', default=0)
+    created = models.DateTimeField('Створено', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Запуск рекомендацій'
+        verbose_name_plural = 'Запуски рекомендацій'
+        ordering = ['-created']
+
+    def __str__(self):
+        return f'До замовлення {self.last_order_id}'
@@ -0,0 +1,95 @@
+import hashlib
+import time
+from functools import wraps
+from django.core.cache import cache
+from django.http import HttpResponse
+from .cache import catalog_version
+from .shell import is_public_shell
+
+# Скільки сторінка вважається свіжою і скільки ще її можна віддавати
+# застарілою, поки один воркер рендерить нову
+PAGE_CACHE_TIMEOUT = 60 * 5
+PAGE_STALE_TIMEOUT = 60 * 10
+LOCK_TIMEOUT = 30
+WAIT_STEP = 0.05
+WAIT_STEPS = 20
+
+# Параметри, від яких залежить вміст; решта (utm_* тощо) ігнорується
+CACHED_PARAMS = (
+    'category', 'scent_type', 'min_price', 'max_price', 'badge', 'sort', 'search', 'cursor',
+)
+
+
+def is_cacheable(request):
+    # Кешуємо лише спільні оболонки - у них немає нічого персонального
+    return request.method in ('GET', 'HEAD') and is_public_shell(request)
+
+
+def page_cache_key(request):
+    params = sorted(
+        (name, value)
+        for name in CACHED_PARAMS
+        for value in request.GET.getlist(name)
+        if value
+    )
+    key = [request.path, params, request.headers.get('X-Requested-With')]
+    return 'pages:' + hashlib.md5(repr(key).encode()).hexdigest()
+
+
+def _from_entry(entry, status):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['X-Page-Cache'] = status
+    return response
+
+
+def _store(key, response, version):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return
+    cache.set(key, {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'version': version,
+        'expires': time.time() + PAGE_CACHE_TIMEOUT,
+    }, PAGE_CACHE_TIMEOUT + PAGE_STALE_TIMEOUT)
+
+
+def shared_page_cache(view):
+    """
+    Кеш готового HTML спільних сторінок (public_shell). Запис прив'язаний
+    до версії каталогу; після зміни каталогу чи закінчення TTL сторінку
+    перерендерить лише той воркер, що взяв блокування, інші віддають
+    застарілу копію.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable(request):
+            return view(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        version = catalog_version()
+        entry = cache.get(key)
+        if entry and entry['version'] == version and entry['expires'] > time.time():
+            return _from_entry(entry, 'hit')
+
+        lock_key = f'{key}:lock'
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            try:
+                response = view(request, *args, **kwargs)
+                _store(key, response, version)
+            finally:
+                cache.delete(lock_key)
+            response['X-Page-Cache'] = 'miss'
+            return response
+
+        if entry:
+            return _from_entry(entry, 'stale')
+
+        # Сторінки ще немає зовсім - коротко чекаємо на воркер із блокуванням
+        for _ in range(WAIT_STEPS):
+            time.sleep(WAIT_STEP)
+            entry = cache.get(key)
+            if entry:
+                return _from_entry(entry, 'hit')
+        return view(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,114 @@
+from datetime import datetime
+from decimal import Decimal
+from django.core import signing
+from django.db.models import Q
+
+PAGE_SIZE = 24
+CURSOR_SALT = 'products.pagination.cursor'
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Пагінація за курсором (sort_key, id) без OFFSET: кожна сторінка - це
+    WHERE (key, id) < (last_key, last_id) ORDER BY key, id LIMIT n+1.
+    """
+
+    def __init__(self, queryset, key, descending=False, per_page=PAGE_SIZE):
+        self.queryset = queryset
+        self.key = key
+        self.descending = descending
+        self.per_page = per_page
+
+    def _ordering(self, reverse=False):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return [f'{prefix}{self.key}', f'{prefix}id']
+
+    def _seek(self, value, pk, reverse=False):
+        op = 'lt' if self.descending != reverse else 'gt'
+        return (
+            Q(**{f'{self.key}__{op}': value}) |
+            Q(**{self.key: value, f'id__{op}': pk})
+        )
+
+    def encode_cursor(self, obj, direction):
+        value = getattr(obj, self.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        return signing.dumps(
+            [self._ordering()[0], value, obj.pk, direction], salt=CURSOR_SALT
+        )
+
+    def decode_cursor(self, cursor):
+        try:
+            key, value, pk, direction = signing.loads(cursor, salt=CURSOR_SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        # Курсор іншого сортування не підходить - починаємо спочатку
+        if key != self._ordering()[0] or direction not in ('next', 'prev'):
+            return None
+        return value, pk, direction
+
+    def get_page(self, cursor=None):
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            items = list(self.queryset.order_by(*self._ordering())[:self.per_page + 1])
+            has_more = len(items) > self.per_page
+            items = items[:self.per_page]
+            return KeysetPage(
+                items,
+                next_cursor=self.encode_cursor(items[-1], 'next') if has_more else None,
+            )
+
+        value, pk, direction = decoded
+        reverse = direction == 'prev'
+        items = list(
+            self.queryset
+            .filter(self._seek(value, pk, reverse=reverse))
+            .order_by(*self._ordering(reverse=reverse))[:self.per_page + 1]
+        )
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if reverse:
+            items.reverse()
+        if not items:
+            return KeysetPage(items)
+
+        has_next = has_more if not reverse else True
+        has_prev = has_more if reverse else True
+        return KeysetPage(
+            items,
+            next_cursor=self.encode_cursor(items[-1], 'next') if has_next else None,
+            prev_cursor=self.encode_cursor(items[0], 'prev') if has_prev else None,
+        )
+
+
+def page_url(request, cursor):
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    if cursor:
+        params['cursor'] = cursor
+    return f'{request.path}?{params.urlencode()}' if params else request.path
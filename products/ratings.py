@@ -0,0 +1,104 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.db.models import Case, When, F, Q, Count, Sum, DecimalField, FloatField
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
+
+STARS = range(1, 6)
+
+
+def display_rating():
+    """
+    Рейтинг для показу й сортування: середня оцінка відгуків, а поки їх
+    немає - рейтинг, заданий у адмінці. FloatField - щоб SQLite не
+    загортав вираз у CAST і використовував індекс за ним.
+    """
+    return Coalesce('review_rating', 'rating', output_field=FloatField())
+
+
+def _rating_expression(count_delta, sum_delta):
+    # Нові значення в SET рахуються від старих, тому додаємо дельту явно.
+    # Без відгуків середньої немає - NULL, а не остання оцінка
+    new_count = F('review_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    return Case(
+        When(
+            Q(review_count__gt=-count_delta),
+            then=Round(Cast(new_sum, FloatField()) / new_count, 1),
+        ),
+        default=None,
+        output_field=DecimalField(max_digits=2, decimal_places=1),
+    )
+
+
+def apply_delta(product_model, product_id, count_delta=0, sum_delta=0, stars=None):
+    """
+    Атомарно змінює агрегати відгуків одного товару одним UPDATE
+    з F-виразами, без читання рядка в Python.
+    """
+    changes = {
+        'review_count': F('review_count') + count_delta,
+        'rating_sum': F('rating_sum') + sum_delta,
+        'review_rating': _rating_expression(count_delta, sum_delta),
+        'updated': timezone.now(),
+    }
+    for star, delta in (stars or {}).items():
+        field = f'rating_count_{star}'
+        changes[field] = F(field) + delta
+    product_model.objects.filter(pk=product_id).update(**changes)
+
+
+def review_added(product_model, product_id, rating):
+    apply_delta(product_model, product_id, 1, rating, {rating: 1})
+
+
+def review_removed(product_model, product_id, rating):
+    apply_delta(product_model, product_id, -1, -rating, {rating: -1})
+
+
+def review_changed(product_model, product_id, old_rating, new_rating):
+    if old_rating == new_rating:
+        return
+    apply_delta(
+        product_model, product_id, 0, new_rating - old_rating,
+        {old_rating: -1, new_rating: 1}
+    )
+
+
+def rebuild(product_model, review_model, batch_size=500):
+    """Перераховує агрегати всіх товарів одним згрупованим запитом."""
+    stats = review_model.objects.values('product_id').annotate(
+        count=Count('id'),
+        total=Sum('rating'),
+        **{f'star_{star}': Count('id', filter=Q(rating=star)) for star in STARS}
+    ).order_by()
+    stats = {row['product_id']: row for row in stats}
+
+    fields = ['review_count', 'rating_sum', 'review_rating'] + [f'rating_count_{s}' for s in STARS]
+    products = product_model.objects.only(*fields, 'updated').order_by('pk')
+    now = timezone.now()
+    batch = []
+    updated = 0
+    for product in products.iterator(chunk_size=batch_size):
+        row = stats.get(product.pk)
+        values = {
+            'review_count': row['count'] if row else 0,
+            'rating_sum': row['total'] if row else 0,
+            **{f'rating_count_{s}': row[f'star_{s}'] if row else 0 for s in STARS},
+            'review_rating': (Decimal(row['total']) / row['count']).quantize(
+                Decimal('0.1'), rounding=ROUND_HALF_UP
+            ) if row else None,
+        }
+        if all(getattr(product, field) == value for field, value in values.items()):
+            continue
+        for field, value in values.items():
+            setattr(product, field, value)
+        product.updated = now
+        batch.append(product)
+        if len(batch) >= batch_size:
+            product_model.objects.bulk_update(batch, fields + ['updated'])
+            updated += len(batch)
+            batch = []
+    if batch:
+        product_model.objects.bulk_update(batch, fields + ['updated'])
+        updated += len(batch)
+    return updated
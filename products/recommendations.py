@@ -0,0 +1,257 @@
+from datetime import timedelta
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .cache import bump_catalog_version
+from .models import Product, ProductPairCount, ProductRecommendation
+from .models import RecommendationOrder, RecommendationRun
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOP_K = 8
+ORDER_BATCH_SIZE = 5000
+# Великі оптові замовлення дають квадратичну кількість пар і мало сигналу
+MAX_ORDER_LINES = 50
+# Оплати, новіші за це, ще можуть бути в незавершених транзакціях -
+# беремо їх наступного запуску, щоб курсор їх не перескочив
+SETTLE_DELAY = 60
+# Замовлення з цими статусами не рахуються, навіть якщо ще позначені оплаченими
+WITHDRAWN_STATUSES = ('cancelled', 'refunded')
+
+
+def co_occurrences(order_ids, product_ids):
+    """
+    Рахує пари (товар, інший товар) для замовлень - це ненульові
+    елементи X^T X, де X - розріджена матриця замовлення × товар.
+    Повертає масиви (product, other, count) без діагоналі.
+    """
+    orders = np.asarray(order_ids, dtype=np.int64)
+    products = np.asarray(product_ids, dtype=np.int64)
+    if orders.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    # Кожна пара (замовлення, товар) рахується один раз
+    pairs = np.unique(np.stack([orders, products], axis=1), axis=0)
+    orders, products = pairs[:, 0], pairs[:, 1]
+
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, orders.size])
+    keep = np.repeat(sizes <= MAX_ORDER_LINES, sizes)
+    orders, products = orders[keep], products[keep]
+    if orders.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, orders.size])
+
+    # Для кожного рядка - всі рядки того ж замовлення
+    group = np.repeat(np.arange(starts.size), sizes)
+    repeats = sizes[group]
+    left = np.repeat(np.arange(orders.size), repeats)
+    offsets = np.arange(left.size) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    right = np.repeat(starts[group], repeats) + offsets
+    mask = left != right
+
+    matrix = np.stack([products[left[mask]], products[right[mask]]], axis=1)
+    if matrix.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    unique, counts = np.unique(matrix, axis=0, return_counts=True)
+    return unique[:, 0], unique[:, 1], counts
+
+
+def top_k(product_ids, other_ids, counts, k=TOP_K):
+    """Для кожного товару - k сусідів з найбільшою кількістю спільних покупок."""
+    order = np.lexsort((other_ids, -counts, product_ids))
+    product_ids, other_ids = product_ids[order], other_ids[order]
+    starts = np.flatnonzero(np.r_[True, product_ids[1:] != product_ids[:-1]])
+    sizes = np.diff(np.r_[starts, product_ids.size])
+    rank = np.arange(product_ids.size) - np.repeat(starts, sizes)
+    selected = rank < k
+    result = {}
+    for product_id, other_id in zip(product_ids[selected].tolist(), other_ids[selected].tolist()):
+        result.setdefault(product_id, []).append(other_id)
+    return result
+
+
+def _merge_counts(product_ids, other_ids, counts):
+    """
+    Додає до збережених лічильників нові (від'ємні - віднімає) і повертає
+    зачеплені товари та їхні повні масиви пар. Пари, що дійшли до нуля,
+    видаляються.
+    """
+    touched = np.unique(product_ids).tolist()
+    existing = {
+        (row[0], row[1]): row[2]
+        for row in ProductPairCount.objects.filter(product_id__in=touched)
+        .values_list('product_id', 'other_id', 'count')
+    }
+    merged = dict(existing)
+    for product_id, other_id, count in zip(product_ids.tolist(), other_ids.tolist(), counts.tolist()):
+        merged[(product_id, other_id)] = merged.get((product_id, other_id), 0) + count
+
+    gone = {}
+    for pair, count in list(merged.items()):
+        if count <= 0:
+            del merged[pair]
+            if pair in existing:
+                gone.setdefault(pair[0], []).append(pair[1])
+    for product_id, others in gone.items():
+        ProductPairCount.objects.filter(product_id=product_id, other_id__in=others).delete()
+
+    ProductPairCount.objects.bulk_create(
+        [
+            ProductPairCount(product_id=pair[0], other_id=pair[1], count=merged[pair])
+            for pair in merged
+            if merged[pair] != existing.get(pair)
+        ],
+        update_conflicts=True,
+        unique_fields=['product', 'other'],
+        update_fields=['count'],
+        batch_size=1000,
+    )
+    keys = np.array(list(merged.keys()), dtype=np.int64).reshape(-1, 2)
+    values = np.array(list(merged.values()), dtype=np.int64)
+    return touched, (keys[:, 0], keys[:, 1], values)
+
+
+def _apply(rows, k, sign=1):
+    """
+    Додає (sign=1) чи віднімає (sign=-1) пари замовлень - rows з
+    (замовлення, товар) - і перераховує top-k зачеплених товарів.
+    """
+    if not rows:
+        return
+    orders, products = zip(*rows)
+    pair_products, pair_others, pair_counts = co_occurrences(orders, products)
+    if not pair_products.size:
+        return
+    touched, merged = _merge_counts(pair_products, pair_others, sign * pair_counts)
+    neighbours = top_k(*merged, k=k)
+    ProductRecommendation.objects.bulk_create(
+        [
+            ProductRecommendation(product_id=product_id, also_bought=others)
+            for product_id, others in neighbours.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['also_bought', 'updated'],
+        batch_size=1000,
+    )
+    # У товару не лишилося жодної спільної покупки
+    ProductRecommendation.objects.filter(
+        product_id__in=set(touched) - set(neighbours)
+    ).delete()
+
+
+def _withdraw(counted, k):
+    """
+    Віднімає пари врахованих замовлень, які відтоді скасували, повернули
+    чи видалили. Повертає їх кількість.
+    """
+    withdrawn = list(
+        RecommendationOrder.objects.exclude(order_id__in=counted.values('id'))
+        .values_list('order_id', 'products')
+    )
+    if not withdrawn:
+        return 0
+    with transaction.atomic():
+        _apply(
+            [(order_id, product_id) for order_id, products in withdrawn for product_id in products],
+            k, sign=-1,
+        )
+        RecommendationOrder.objects.filter(
+            order_id__in=[order_id for order_id, products in withdrawn]
+        ).delete()
+    return len(withdrawn)
+
+
+def update(full=False, k=TOP_K, batch_size=ORDER_BATCH_SIZE):
+    """
+    Спершу віднімає пари замовлень, що перестали бути оплаченими
+    (скасовані, повернені, видалені). Далі обробляє лише оплачені
+    замовлення, оплачені після попереднього запуску (курсор - час оплати
+    й id), і перераховує top-k тільки для товарів, яких вони стосуються.
+    Повертає кількість доданих і віднятих замовлень.
+    """
+    if np is None:
+        raise RuntimeError('NumPy не встановлено')
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    if full:
+        with transaction.atomic():
+            ProductPairCount.objects.all().delete()
+            ProductRecommendation.objects.all().delete()
+            RecommendationOrder.objects.all().delete()
+            RecommendationRun.objects.all().delete()
+
+    counted = Order.objects.filter(paid=True).exclude(status__in=WITHDRAWN_STATUSES)
+    processed = _withdraw(counted, k)
+
+    last_run = RecommendationRun.objects.order_by('-last_paid_at', '-last_order_id').first()
+    last_paid_at = last_run.last_paid_at if last_run else None
+    last_order_id = last_run.last_order_id if last_run else 0
+    settled = counted.filter(paid_at__lte=timezone.now() - timedelta(seconds=SETTLE_DELAY))
+
+    while True:
+        pending = settled
+        if last_paid_at is not None:
+            pending = pending.filter(
+                Q(paid_at__gt=last_paid_at) | Q(paid_at=last_paid_at, id__gt=last_order_id)
+            )
+        batch = list(
+            pending.order_by('paid_at', 'id').values_list('id', 'paid_at')[:batch_size]
+        )
+        if not batch:
+            break
+        order_ids = [order_id for order_id, paid_at in batch]
+        rows = list(
+            OrderItem.objects.filter(order_id__in=order_ids, product__isnull=False)
+            .values_list('order_id', 'product_id')
+        )
+        products = {order_id: [] for order_id in order_ids}
+        for order_id, product_id in rows:
+            products[order_id].append(product_id)
+
+        with transaction.atomic():
+            _apply(rows, k)
+            # Склад замовлення - щоб відняти його пари, навіть коли його видалять
+            RecommendationOrder.objects.bulk_create(
+                [
+                    RecommendationOrder(order_id=order_id, products=product_ids)
+                    for order_id, product_ids in products.items()
+                ],
+                ignore_conflicts=True,
+                batch_size=1000,
+            )
+            last_order_id, last_paid_at = batch[-1]
+            processed += len(order_ids)
+            RecommendationRun.objects.create(
+                last_paid_at=last_paid_at,
+                last_order_id=last_order_id,
+                orders_processed=len(order_ids),
+            )
+    if processed:
+        # Блок "разом купують" - частина сторінки товару
+        bump_catalog_version()
+    return processed
+
+
+def also_bought(product, limit=4):
+    """Один індексований запит за рекомендаціями + вибірка самих товарів."""
+    ids = (
+        ProductRecommendation.objects.filter(product_id=product.pk)
+        .values_list('also_bought', flat=True)
+        .first()
+    )
+    if not ids:
+        return []
+    products = Product.objects.filter(id__in=ids, available=True).select_related('category')
+    by_id = {p.id: p for p in products}
+    return [by_id[pk] for pk in ids if pk in by_id][:limit]
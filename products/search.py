@@ -0,0 +1,203 @@
+import re
+import unicodedata
+from django.db import connection
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'products_search'
+# Скільки найрелевантніших товарів упорядковуються за bm25; решта збігів
+# теж потрапляє у видачу й лічильники, але після них
+SEARCH_RANK_LIMIT = 1000
+INDEX_BATCH_SIZE = 500
+
+# Ваги колонок для bm25: назва важливіша за категорію, категорія - за опис
+RANK_WEIGHTS = (10.0, 1.0, 4.0)
+
+# Транслітерація за постановою КМУ №55 (2010), щоб "dior" знаходив "Діор"
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'h', 'ґ': 'g', 'д': 'd', 'е': 'e',
+    'є': 'ie', 'ж': 'zh', 'з': 'z', 'и': 'y', 'і': 'i', 'ї': 'i', 'й': 'i',
+    'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'shch', 'ь': '', 'ю': 'iu', 'я': 'ia',
+    'ё': 'e', 'ы': 'y', 'э': 'e', 'ъ': '',
+}
+
+TOKEN_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[Ѐ-ӿ]')
+APOSTROPHES = str.maketrans('', '', '\'’ʼ`')
+
+_index_available = None
+
+
+def normalize(text):
+    """Приводить текст до нижнього регістру без апострофів і діакритики."""
+    text = unicodedata.normalize('NFC', (text or '').casefold()).translate(APOSTROPHES)
+    # ї, й, ё розкладаються в NFKD на базову літеру + діакритику
+    text = ''.join(
+        ch for ch in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(ch)
+    )
+    return text
+
+
+def transliterate(token):
+    return ''.join(TRANSLIT.get(ch, ch) for ch in token)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def _index_text(text):
+    tokens = tokenize(text)
+    latin = [transliterate(t) for t in tokens if CYRILLIC_RE.search(t)]
+    return ' '.join(tokens + latin)
+
+
+def build_match_query(query):
+    terms = []
+    for token in tokenize(query):
+        variants = {token}
+        if CYRILLIC_RE.search(token):
+            variants.add(transliterate(token))
+        terms.append(
+            '(' + ' OR '.join(f'"{v}"*' for v in sorted(variants) if v) + ')'
+        )
+    return ' AND '.join(terms)
+
+
+def is_available():
+    global _index_available
+    if _index_available is None:
+        if connection.vendor != 'sqlite':
+            _index_available = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                    [SEARCH_TABLE]
+                )
+                _index_available = cursor.fetchone() is not None
+    return _index_available
+
+
+def create_index(schema_editor):
+    global _index_available
+    _index_available = None
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+        'name, description, category, '
+        'tokenize="unicode61 remove_diacritics 2")'
+    )
+
+
+def drop_index(schema_editor):
+    global _index_available
+    _index_available = None
+    schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def _write_rows(cursor, products):
+    rows = [
+        (
+            product.id,
+            _index_text(product.name),
+            _index_text(product.description),
+            _index_text(product.category.name),
+        )
+        for product in products
+    ]
+    if not rows:
+        return
+    cursor.executemany(
+        f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(row[0],) for row in rows]
+    )
+    cursor.executemany(
+        f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, category) '
+        'VALUES (%s, %s, %s, %s)',
+        rows
+    )
+
+
+def index_products(products, using=None):
+    """Додає або оновлює записи індексу для переданих товарів (з category)."""
+    if using is None and not is_available():
+        return
+    conn = connection if using is None else using
+    batch = []
+    with conn.cursor() as cursor:
+        for product in products:
+            batch.append(product)
+            if len(batch) >= INDEX_BATCH_SIZE:
+                _write_rows(cursor, batch)
+                batch = []
+        _write_rows(cursor, batch)
+
+
+def remove_products(product_ids):
+    if not is_available() or not product_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+            [(pk,) for pk in product_ids]
+        )
+
+
+def rebuild_index(queryset, using=None):
+    conn = connection if using is None else using
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    index_products(
+        queryset.select_related('category').iterator(chunk_size=INDEX_BATCH_SIZE),
+        using=conn
+    )
+
+
+def search_ids(query, limit=SEARCH_RANK_LIMIT):
+    """Повертає id товарів, відсортовані за релевантністю (bm25)."""
+    match = build_match_query(query)
+    if not match:
+        return []
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s',
+            [match, limit]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def match(query):
+    """
+    Повертає (Q-умова, ids за релевантністю). Умова - підзапит до FTS5
+    без обмеження кількості, ids - лише перші SEARCH_RANK_LIMIT для
+    сортування. Без FTS5 - icontains і ids=None.
+    """
+    if not is_available():
+        condition = (
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(category__name__icontains=query)
+        )
+        return condition, None
+    expression = build_match_query(query)
+    if not expression:
+        return Q(pk__in=[]), []
+    condition = Q(id__in=RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [expression]
+    ))
+    return condition, search_ids(query, SEARCH_RANK_LIMIT)
+
+
+def rank_expression(ids):
+    if not ids:
+        return Value(0, output_field=IntegerField())
+    return Case(
+        *[When(id=pk, then=position) for position, pk in enumerate(ids)],
+        default=len(ids),
+        output_field=IntegerField()
+    )
+
@@ -0,0 +1,29 @@
+from functools import wraps
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+# Скільки спільна копія сторінки може жити в проксі без перевірки
+SHELL_MAX_AGE = 60
+
+
+def public_shell(view):
+    """
+    Рендерить сторінку без персональних даних (кошик, користувач,
+    улюблені, повідомлення, csrf-токени) - їх підтягує JS із
+    session_state. Така відповідь однакова для всіх і може лежати
+    в спільному кеші.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.public_shell = True
+        response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304) and not response.has_header('Cache-Control'):
+            patch_cache_control(response, public=True, max_age=SHELL_MAX_AGE)
+            # Колекція віддає JSON на той самий URL для AJAX-запитів
+            patch_vary_headers(response, ['X-Requested-With'])
+        return response
+
+    return wrapper
+
+
+def is_public_shell(request):
+    return getattr(request, 'public_shell', False)
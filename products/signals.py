@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Category, Favorite, Product, Review
+from . import search, ratings, images
+from .cache import bump_catalog_version, bump_category_version, invalidate_favorites
+
+
+@receiver(pre_save, sender=Product)
+def reset_image_variants(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Нове зображення - старі варіанти вже не відповідають йому
+    if instance.image_variants and instance.image_variants.get('source') != instance.image.name:
+        instance.image_variants = {}
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_products([instance])
+    bump_catalog_version()
+    if images.needs_variants(instance):
+        transaction.on_commit(lambda: images.schedule(instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    bump_category_version()
+    if created:
+        return
+    search.index_products(
+        instance.products.select_related('category').iterator(
+            chunk_size=search.INDEX_BATCH_SIZE
+        )
+    )
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    bump_category_version()
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_rating = (
+        Review.objects.filter(pk=instance.pk)
+        .values_list('product_id', 'rating')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        ratings.review_added(Product, instance.product_id, instance.rating)
+        bump_catalog_version()
+        return
+    old_product_id, old_rating = previous
+    if old_product_id != instance.product_id:
+        ratings.review_removed(Product, old_product_id, old_rating)
+        ratings.review_added(Product, instance.product_id, instance.rating)
+    else:
+        ratings.review_changed(Product, instance.product_id, old_rating, instance.rating)
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    ratings.review_removed(Product, instance.product_id, instance.rating)
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    invalidate_favorites(instance.user_id)
@@ -0,0 +1,250 @@
+import logging
+import math
+import threading
+import zlib
+from collections import Counter
+from django.db import connections
+from .cache import catalog_version, category_version
+from .facets import get_categories
+from .models import Product
+from .search import tokenize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 8
+HASH_DIM = 128
+MIN_TERM_LENGTH = 3
+PRICE_BAND_EDGES = [500, 1000, 2000, 3000, 5000, 8000, 12000]
+BADGE_FIELDS = ['is_bestseller', 'is_exclusive', 'is_limited']
+SCENTS = [value for value, label in Product.SCENT_CHOICES]
+
+# Вага кожного блоку ознак у підсумковому векторі
+WEIGHTS = {
+    'scent': 1.0,
+    'category': 0.6,
+    'price': 0.5,
+    'badges': 0.3,
+    'terms': 0.8,
+}
+
+FIELDS = ['id', 'category_id', 'scent_type', 'price', 'name', 'description', 'updated'] + BADGE_FIELDS
+
+
+def _terms(row):
+    return Counter(
+        zlib.crc32(token.encode()) % HASH_DIM
+        for token in tokenize(f"{row['name']} {row['description']}")
+        if len(token) >= MIN_TERM_LENGTH
+    )
+
+
+def _price_band(price):
+    band = 0
+    while band < len(PRICE_BAND_EDGES) and price >= PRICE_BAND_EDGES[band]:
+        band += 1
+    return band
+
+
+class SimilarityIndex:
+    """
+    Незмінний знімок векторів ознак товарів і пошук найближчих сусідів
+    за косинусною подібністю перебором (один matvec на запит + кеш).
+    Оновлення не змінює знімок, а будує новий (synced), тож запити
+    читають його без блокування.
+    """
+
+    def __init__(self, rows, terms, category_columns, version, categories_version, synced_until):
+        self.category_columns = category_columns
+        self.version = version
+        self.categories_version = categories_version
+        self.synced_until = synced_until
+        self.products = rows
+        self.terms = terms
+
+        # idf рахується з нуля для кожного знімка, тож не старіє після
+        # часткових оновлень
+        document_frequency = np.zeros(HASH_DIM, dtype=np.float32)
+        for counter in terms.values():
+            for bucket in counter:
+                document_frequency[bucket] += 1
+        self.idf = np.log((1 + len(rows)) / (1 + document_frequency)) + 1
+
+        ids = sorted(rows)
+        matrix = np.zeros((len(ids), self.dimensions), dtype=np.float32)
+        for index, product_id in enumerate(ids):
+            matrix[index] = self.vectorize(rows[product_id], terms[product_id])
+        self.ids = np.array(ids, dtype=np.int64)
+        self.matrix = matrix
+        self.rows = {product_id: index for index, product_id in enumerate(ids)}
+        self.neighbours = {}
+
+    @property
+    def dimensions(self):
+        return len(SCENTS) + len(self.category_columns) + len(PRICE_BAND_EDGES) + 1 + len(BADGE_FIELDS) + HASH_DIM
+
+    def vectorize(self, row, terms):
+        blocks = []
+
+        scent = np.zeros(len(SCENTS), dtype=np.float32)
+        if row['scent_type'] in SCENTS:
+            scent[SCENTS.index(row['scent_type'])] = 1
+        blocks.append(('scent', scent))
+
+        category = np.zeros(len(self.category_columns), dtype=np.float32)
+        if row['category_id'] in self.category_columns:
+            category[self.category_columns[row['category_id']]] = 1
+        blocks.append(('category', category))
+
+        # Сусідні цінові діапазони теж трохи схожі
+        price = np.zeros(len(PRICE_BAND_EDGES) + 1, dtype=np.float32)
+        band = _price_band(row['price'])
+        price[band] = 1
+        if band > 0:
+            price[band - 1] = 0.5
+        if band < len(price) - 1:
+            price[band + 1] = 0.5
+        blocks.append(('price', price))
+
+        badges = np.array([1 if row[field] else 0 for field in BADGE_FIELDS], dtype=np.float32)
+        blocks.append(('badges', badges))
+
+        tfidf = np.zeros(HASH_DIM, dtype=np.float32)
+        for bucket, count in terms.items():
+            tfidf[bucket] = (1 + math.log(count)) * self.idf[bucket]
+        blocks.append(('terms', tfidf))
+
+        parts = []
+        for name, block in blocks:
+            norm = np.linalg.norm(block)
+            parts.append(block / norm * WEIGHTS[name] if norm else block)
+        vector = np.concatenate(parts)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @classmethod
+    def build(cls):
+        version = catalog_version()
+        categories_version = category_version()
+        category_columns = {c['id']: i for i, c in enumerate(get_categories())}
+        rows = {row['id']: row for row in Product.objects.filter(available=True).values(*FIELDS)}
+        return cls(
+            rows,
+            {product_id: _terms(row) for product_id, row in rows.items()},
+            category_columns,
+            version,
+            categories_version,
+            max((row['updated'] for row in rows.values()), default=None),
+        )
+
+    def synced(self):
+        """
+        Новий знімок після bump версії каталогу: з бази читаються лише
+        товари з updated >= останньої синхронізації, вектори решти
+        перераховуються з пам'яті під новий idf. Зміна категорій -
+        повна перебудова. Повертає self, якщо каталог не змінювався.
+        """
+        if category_version() != self.categories_version:
+            return self.build()
+        version = catalog_version()
+        if version == self.version:
+            return self
+        changed = Product.objects.all()
+        if self.synced_until is not None:
+            changed = changed.filter(updated__gte=self.synced_until)
+        changed = list(changed.values(*FIELDS, 'available'))
+        rows, terms = dict(self.products), dict(self.terms)
+        for row in changed:
+            if row.pop('available'):
+                rows[row['id']] = row
+                terms[row['id']] = _terms(row)
+            else:
+                rows.pop(row['id'], None)
+                terms.pop(row['id'], None)
+        # Видалені товари updated не змінюють - звіряємо з переліком id
+        available = set(Product.objects.filter(available=True).values_list('id', flat=True))
+        if available - rows.keys():
+            return self.build()
+        for product_id in rows.keys() - available:
+            del rows[product_id], terms[product_id]
+        updated = [row['updated'] for row in changed]
+        if self.synced_until is not None:
+            updated.append(self.synced_until)
+        return SimilarityIndex(
+            rows, terms, self.category_columns, version, self.categories_version, max(updated, default=None)
+        )
+
+    def similar_ids(self, product_id, k=TOP_K):
+        if product_id in self.neighbours:
+            return self.neighbours[product_id][:k]
+        index = self.rows.get(product_id)
+        if index is None:
+            return []
+        matrix = self.matrix
+        scores = matrix @ matrix[index]
+        scores[index] = -np.inf
+        count = min(max(k, TOP_K), len(scores) - 1)
+        if count <= 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        result = [int(self.ids[i]) for i in top if scores[i] > 0]
+        self.neighbours[product_id] = result
+        return result[:k]
+
+
+# Поточний знімок. Запит лише читає посилання, нове присвоює фоновий потік
+_index = None
+_refreshing = threading.Lock()
+
+
+def refresh():
+    """Будує або синхронізує знімок і підміняє поточний. Повертає новий знімок."""
+    global _index
+    _index = SimilarityIndex.build() if _index is None else _index.synced()
+    return _index
+
+
+def _refresh_job():
+    try:
+        refresh()
+    except Exception:
+        logger.exception('similarity index refresh failed')
+    finally:
+        connections.close_all()
+        _refreshing.release()
+
+
+def _schedule_refresh():
+    # Один фоновий потік на процес, поки він працює - нові не запускаються
+    if _refreshing.acquire(blocking=False):
+        threading.Thread(target=_refresh_job, name='similarity-refresh', daemon=True).start()
+
+
+def similar_ids(product_id, k=TOP_K):
+    """
+    Сусіди з поточного знімка. Застарілий знімок віддається як є, а
+    новий будується у фоні; до першої побудови сусідів немає.
+    """
+    if np is None:
+        return []
+    index = _index
+    if index is None or index.version != catalog_version() or \
+            index.categories_version != category_version():
+        _schedule_refresh()
+    if index is None:
+        return []
+    return index.similar_ids(product_id, k)
+
+
+def similar_products(product, limit=4, exclude=()):
+    ids = [pk for pk in similar_ids(product.pk, limit + len(exclude)) if pk not in exclude]
+    if not ids:
+        return []
+    products = Product.objects.filter(id__in=ids, available=True).select_related('category')
+    by_id = {p.id: p for p in products}
+    return [by_id[pk] for pk in ids if pk in by_id][:limit]
@@ -0,0 +1,104 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from products.cache import category_version, favorite_ids
+from products.images import SIZES, variant_srcset
+
+register = template.Library()
+
+CARD_TEMPLATES = {
+    'grid': 'products/includes/product_card.html',
+    'favorite': 'products/includes/favorite_card.html',
+    'related': 'products/includes/related_card.html',
+}
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# Змінити при правці шаблонів карток, щоб не віддавати стару розмітку
+CARD_CACHE_VERSION = 3
+# csrf-токен різний для кожного відвідувача, тому в кеші лежить заглушка
+CSRF_PLACEHOLDER = '__csrf_token_placeholder__'
+CSRF_INPUT = f'<input type="hidden" name="csrfmiddlewaretoken" value="{CSRF_PLACEHOLDER}">'
+# Стан "в улюблених" теж персональний - підставляється для кожної картки
+FAVORITE_PLACEHOLDER = '__favorite_state_placeholder__'
+
+
+def card_cache_key(product, variant, categories_version):
+    return (
+        f'products:card:{CARD_CACHE_VERSION}:{variant}:{product.pk}:'
+        f'{product.updated.timestamp()}:{categories_version}'
+    )
+
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products, variant='grid'):
+    """
+    Рендерить картки товарів із кешу фрагментів одним get_many.
+    Ключ містить Product.updated і версію категорій, тож збереження
+    товару чи категорії автоматично робить старий фрагмент недосяжним.
+    """
+    products = list(products)
+    if not products:
+        return ''
+    categories_version = category_version()
+    keys = [card_cache_key(product, variant, categories_version) for product in products]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    card_template = None
+    for product, key in zip(products, keys):
+        if key in cached:
+            continue
+        if card_template is None:
+            card_template = get_template(CARD_TEMPLATES[variant])
+        missing[key] = card_template.render({
+            'product': product,
+            'csrf_token': CSRF_PLACEHOLDER,
+            'favorite_state': FAVORITE_PLACEHOLDER,
+        })
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+        cached.update(missing)
+
+    request = context.get('request')
+    favorites = favorite_ids(request) if request is not None else frozenset()
+    html = ''.join(
+        cached[key].replace(FAVORITE_PLACEHOLDER, 'active' if product.pk in favorites else '')
+        for product, key in zip(products, keys)
+    )
+    csrf_token = context.get('csrf_token')
+    if csrf_token == 'NOTPROVIDED':
+        # Спільна сторінка: поле з токеном додасть JS
+        html = html.replace(CSRF_INPUT, '')
+    elif csrf_token and CSRF_PLACEHOLDER in html:
+        html = html.replace(CSRF_PLACEHOLDER, str(csrf_token))
+    return mark_safe(html)
+
+
+@register.simple_tag
+def product_image(product, sizes='card', css_class='', lazy=True):
+    """
+    <picture> з WebP і запасним srcset для згенерованих варіантів.
+    Поки варіантів немає (або вони від старого файлу) - звичайний <img>.
+    """
+    if not product.image:
+        return ''
+    alt = product.name
+    loading = 'lazy' if lazy else 'eager'
+    variants = product.image_variants or {}
+    if variants.get('source') != product.image.name:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}">',
+            product.image.url, alt, css_class, loading
+        )
+    return format_html(
+        '<picture class="product-picture">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="{}" decoding="async"{}>'
+        '</picture>',
+        variant_srcset(product, 'webp'), SIZES.get(sizes, sizes),
+        product.image.url, variant_srcset(product, 'fallback'), SIZES.get(sizes, sizes),
+        variants['width'], variants['height'], alt, css_class, loading,
+        mark_safe('' if lazy else ' fetchpriority="high"'),
+    )
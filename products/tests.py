@@ -1,3 +1,693 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from orders.models import Order, OrderItem
+from .admin import ProductAdmin
+from .cache import CATEGORY_VERSION_KEY, bump_catalog_version, catalog_version, category_version
+from .cache import favorite_ids
+from .facets import compute_facets
+from .models import CatalogVersion, Category, Favorite, Product, Review
+from .models import ProductPairCount, ProductRecommendation
+from .page_cache import page_cache_key, shared_page_cache
+from .pagination import PAGE_SIZE, KeysetPaginator
+from .shell import public_shell
+from .templatetags.product_tags import FAVORITE_PLACEHOLDER
+from . import images, ratings, recommendations, search, similarity
 
-# Create your tests here.
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        for i in range(5):
+            Product.objects.create(
+                category=category, name=f'Rose {i}', slug=f'rose-{i}',
+                description='Троянда', scent_type='floral', price=1000 + i,
+            )
+        Product.objects.create(
+            category=category, name='Cedar', slug='cedar',
+            description='Кедр', scent_type='woody', price=1500,
+        )
+
+    def test_matches_are_not_capped_by_rank_limit(self):
+        if not search.is_available():
+            self.skipTest('FTS5 недоступний')
+        with mock.patch.object(search, 'SEARCH_RANK_LIMIT', 2):
+            condition, ids = search.match('rose')
+        self.assertEqual(len(ids), 2)
+        products = Product.objects.filter(condition)
+        self.assertEqual(products.count(), 5)
+        self.assertEqual(compute_facets({'search': condition})['total'], 5)
+        # Найрелевантніші - першими, решта збігів іде після них
+        ranked = list(
+            products.annotate(search_rank=search.rank_expression(ids))
+            .order_by('search_rank', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(ranked[:2], ids)
+
+    def test_empty_query_matches_nothing(self):
+        condition, ids = search.match('!!!')
+        self.assertFalse(Product.objects.filter(condition).exists())
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        # Однакова ціна в усіх - порядок тримається лише на id
+        self.ids = [
+            Product.objects.create(
+                category=category, name=f'p{i}', slug=f'p{i}', description='',
+                scent_type='woody', price=1000,
+            ).pk
+            for i in range(7)
+        ]
+        self.paginator = KeysetPaginator(Product.objects.all(), 'price', per_page=3)
+
+    def ids_of(self, page):
+        return [product.pk for product in page]
+
+    def test_walks_forward_and_back_through_ties(self):
+        first = self.paginator.get_page()
+        second = self.paginator.get_page(first.next_cursor)
+        third = self.paginator.get_page(second.next_cursor)
+        self.assertEqual(self.ids_of(first) + self.ids_of(second) + self.ids_of(third), self.ids)
+        self.assertFalse(first.has_previous)
+        self.assertFalse(third.has_next)
+
+        back = self.paginator.get_page(third.prev_cursor)
+        self.assertEqual(self.ids_of(back), self.ids_of(second))
+        self.assertTrue(back.has_next)
+        start = self.paginator.get_page(back.prev_cursor)
+        self.assertEqual(self.ids_of(start), self.ids_of(first))
+        self.assertFalse(start.has_previous)
+
+    def test_bad_cursor_starts_from_first_page(self):
+        first = self.paginator.get_page()
+        other_sort = KeysetPaginator(Product.objects.all(), 'price', descending=True, per_page=3)
+        for cursor in (first.next_cursor[:-2] + 'xx', 'garbage', other_sort.get_page().next_cursor):
+            self.assertEqual(self.ids_of(self.paginator.get_page(cursor)), self.ids[:3])
+
+    def test_collection_json_links_carry_the_cursor(self):
+        cache.clear()
+        category = Category.objects.get()
+        Product.objects.bulk_create([
+            Product(
+                category=category, name=f'bulk{i}', slug=f'bulk{i}', description='',
+                scent_type='woody', price=2000 + i,
+            )
+            for i in range(PAGE_SIZE)
+        ])
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        first = self.client.get('/collection/', {'sort': 'price_low'}, **ajax).json()
+        self.assertIsNone(first['prev_url'])
+        self.assertIn('sort=price_low', first['next_url'])
+
+        second = self.client.get(first['next_url'], **ajax).json()
+        self.assertEqual(len(first['products']) + len(second['products']), PAGE_SIZE + len(self.ids))
+        self.assertIsNone(second['next_url'])
+        back = self.client.get(second['prev_url'], **ajax).json()
+        self.assertEqual(back['products'], first['products'])
+
+
+class ProductCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.products = [
+            Product.objects.create(
+                category=category, name=f'Card {i}', slug=f'card-{i}', description='',
+                scent_type='woody', price=1000,
+            )
+            for i in range(3)
+        ]
+        self.user = get_user_model().objects.create_user('buyer', password='pw12345!')
+        Favorite.objects.create(user=self.user, product=self.products[1])
+
+    def render(self, user=None, csrf_token='token-a'):
+        request = RequestFactory().get('/')
+        request.user = user or AnonymousUser()
+        products = Product.objects.filter(pk__in=[p.pk for p in self.products]).order_by('pk')
+        return Template('{% load product_tags %}{% product_cards products %}').render(Context({
+            'products': products, 'request': request, 'csrf_token': csrf_token,
+        }))
+
+    def test_cards_are_rendered_once_and_fetched_in_bulk(self):
+        self.render()
+        with mock.patch('products.templatetags.product_tags.get_template') as get_template, \
+                mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            html = self.render()
+        get_template.assert_not_called()
+        get_many.assert_called_once()
+        self.assertEqual(html.count('product-name'), 3)
+
+    def test_saved_product_gets_a_fresh_card(self):
+        self.render()
+        product = self.products[0]
+        product.name = 'Renamed'
+        product.save()
+        html = self.render()
+        self.assertIn('Renamed', html)
+        self.assertNotIn('Card 0', html)
+
+    def test_per_visitor_parts_are_not_cached(self):
+        self.render()
+        html = self.render(user=self.user, csrf_token='token-b')
+        self.assertIn('value="token-b"', html)
+        self.assertNotIn('token-a', html)
+        self.assertNotIn(FAVORITE_PLACEHOLDER, html)
+        self.assertEqual(html.count('card-favorite active'), 1)
+        self.assertEqual(self.render().count('card-favorite active'), 0)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        if images.Image is None:
+            self.skipTest('Pillow не встановлено')
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PRODUCT_IMAGE_WORKER=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+        self.category = Category.objects.create(name='Нішеві', slug='niche')
+
+    def source(self, name, mode='RGB', size=(1000, 500)):
+        os.makedirs(os.path.join(self.media_root, 'products'), exist_ok=True)
+        images.Image.new(mode, size).save(os.path.join(self.media_root, 'products', name))
+        return f'products/{name}'
+
+    def test_generates_fallback_and_webp_for_each_width(self):
+        manifest = images.generate_variants(self.source('wide.jpg'))
+        self.assertEqual((manifest['width'], manifest['height']), (1000, 500))
+        self.assertEqual(sorted(manifest['webp'], key=int), ['320', '640', '960', '1000'])
+        for key in ('fallback', 'webp'):
+            for width, name in manifest[key].items():
+                with images.Image.open(os.path.join(self.media_root, name)) as variant:
+                    self.assertEqual(variant.width, int(width))
+        self.assertTrue(manifest['fallback']['320'].endswith('.jpg'))
+
+        transparent = images.generate_variants(self.source('logo.png', mode='RGBA', size=(300, 300)))
+        self.assertEqual(list(transparent['fallback']), ['300'])
+        self.assertTrue(transparent['fallback']['300'].endswith('.png'))
+
+    def test_saving_product_builds_variants_and_picture_markup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                category=self.category, name='Pic', slug='pic', description='',
+                scent_type='woody', price=1000, image=self.source('pic.jpg'),
+            )
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['source'], 'products/pic.jpg')
+        html = Template('{% load product_tags %}{% product_image product %}').render(
+            Context({'product': product})
+        )
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('640w', html)
+
+        # Нове зображення - старі варіанти більше не віддаються
+        product.image = self.source('other.jpg')
+        product.save()
+        self.assertEqual(product.image_variants, {})
+
+    def test_manifest_of_replaced_image_is_not_saved(self):
+        product = Product.objects.create(
+            category=self.category, name='Pic', slug='pic', description='',
+            scent_type='woody', price=1000, image=self.source('new.jpg'),
+        )
+        stale = images.generate_variants(self.source('old.jpg'))
+        self.assertFalse(images.save_manifest(product.pk, stale))
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
+
+
+class FavoriteIdsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.product = Product.objects.create(
+            category=category, name='Fav', slug='fav', description='',
+            scent_type='woody', price=1000,
+        )
+        self.user = get_user_model().objects.create_user('buyer', password='pw12345!')
+
+    def request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return request
+
+    def test_one_query_per_miss_then_cached(self):
+        Favorite.objects.create(user=self.user, product=self.product)
+        request = self.request()
+        with self.assertNumQueries(1):
+            self.assertEqual(favorite_ids(request), {self.product.pk})
+            favorite_ids(request)
+        with self.assertNumQueries(0):
+            self.assertEqual(favorite_ids(self.request()), {self.product.pk})
+
+    def test_toggle_invalidates_the_set(self):
+        self.assertEqual(favorite_ids(self.request()), frozenset())
+        self.client.force_login(self.user)
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        url = f'/favorites/toggle/{self.product.pk}/'
+        self.assertTrue(self.client.post(url, **ajax).json()['is_favorite'])
+        self.assertEqual(favorite_ids(self.request()), {self.product.pk})
+        self.assertFalse(self.client.post(url, **ajax).json()['is_favorite'])
+        self.assertEqual(favorite_ids(self.request()), frozenset())
+
+    def test_anonymous_and_public_shell_skip_the_lookup(self):
+        Favorite.objects.create(user=self.user, product=self.product)
+        anonymous = RequestFactory().get('/')
+        anonymous.user = AnonymousUser()
+        shell = self.request()
+        shell.public_shell = True
+        with self.assertNumQueries(0):
+            self.assertEqual(favorite_ids(anonymous), frozenset())
+            self.assertEqual(favorite_ids(shell), frozenset())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.product = Product.objects.create(
+            category=category, name='Cond', slug='cond', description='',
+            scent_type='woody', price=1000,
+        )
+        # Фоновий потік індексу схожих не бачить транзакції тесту
+        patcher = mock.patch.object(similarity, '_schedule_refresh')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_collection_etag_and_last_modified(self):
+        response = self.client.get('/collection/')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get('/collection/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get('/collection/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304
+        )
+        # JSON тієї ж адреси - інший валідатор
+        ajax = self.client.get('/collection/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotEqual(ajax['ETag'], etag)
+
+        self.product.price = 1100
+        self.product.save()
+        response = self.client.get('/collection/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_product_detail_revalidates_on_product_change(self):
+        url = '/product/cond/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.product.name = 'Cond 2'
+        self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/product/missing/').status_code, 404)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+        @public_shell
+        @shared_page_cache
+        def view(request):
+            self.calls += 1
+            return HttpResponse(f'render {self.calls}')
+
+        self.view = view
+
+    def get(self, path='/page/', **params):
+        response = self.view(RequestFactory().get(path, params))
+        return response['X-Page-Cache'], response.content.decode()
+
+    def test_hit_after_miss_and_ignored_params(self):
+        self.assertEqual(self.get(), ('miss', 'render 1'))
+        self.assertEqual(self.get(utm_source='mail'), ('hit', 'render 1'))
+        self.assertEqual(self.get(sort='price_low'), ('miss', 'render 2'))
+        self.assertEqual(self.calls, 2)
+
+    def test_catalog_change_rerenders(self):
+        self.get()
+        bump_catalog_version()
+        self.assertEqual(self.get(), ('miss', 'render 2'))
+
+    def test_only_lock_holder_renders_others_get_stale_copy(self):
+        self.get()
+        bump_catalog_version()
+        key = page_cache_key(RequestFactory().get('/page/'))
+        # Інший воркер уже рендерить нову версію
+        cache.add(f'{key}:lock', 1)
+        self.assertEqual(self.get(), ('stale', 'render 1'))
+        self.assertEqual(self.calls, 1)
+
+    def test_waits_for_lock_holder_when_nothing_is_cached(self):
+        key = page_cache_key(RequestFactory().get('/page/'))
+        cache.add(f'{key}:lock', 1)
+        entry = {'content': b'rendered elsewhere', 'content_type': 'text/html', 'version': 0, 'expires': 0}
+
+        def sleep(seconds):
+            cache.set(key, entry)
+
+        with mock.patch('products.page_cache.time.sleep', side_effect=sleep):
+            self.assertEqual(self.get(), ('hit', 'rendered elsewhere'))
+        self.assertEqual(self.calls, 0)
+
+    def test_personal_responses_are_not_stored(self):
+        @public_shell
+        @shared_page_cache
+        def with_cookie(request):
+            self.calls += 1
+            response = HttpResponse('x')
+            response.set_cookie('cart', '1')
+            return response
+
+        for _ in range(2):
+            with_cookie(RequestFactory().get('/cookie/'))
+        self.assertEqual(self.calls, 2)
+
+
+class PublicShellTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.product = Product.objects.create(
+            category=category, name='Shell', slug='shell', description='',
+            scent_type='woody', price=1000, stock=5,
+        )
+        self.user = get_user_model().objects.create_user(
+            'buyer', email='buyer@example.com', password='pw12345!', first_name='Олена'
+        )
+        Favorite.objects.create(user=self.user, product=self.product)
+
+    def login_with_cart(self):
+        self.client.force_login(self.user)
+        self.client.post(f'/cart/add/{self.product.pk}/', {'quantity': 2, 'override': False})
+
+    def test_shell_is_the_same_for_every_visitor(self):
+        anonymous = self.client.get('/collection/', {'sort': 'name'})
+        self.login_with_cart()
+        cache.clear()
+        shell = self.client.get('/collection/', {'sort': 'name'})
+
+        self.assertEqual(shell.content, anonymous.content)
+        self.assertNotIn('Олена', shell.content.decode())
+        self.assertNotIn(b'csrfmiddlewaretoken', shell.content)
+        self.assertFalse(shell.cookies)
+        self.assertIn('public', shell['Cache-Control'])
+        self.assertNotIn('Cookie', shell.get('Vary', ''))
+        self.assertIn(b'data-session-state-url', shell.content)
+
+    def test_session_state_hydrates_the_shell(self):
+        self.login_with_cart()
+        response = self.client.get('/session-state/')
+        self.assertIn('no-cache', response['Cache-Control'])
+        state = response.json()
+        self.assertTrue(state['authenticated'])
+        self.assertEqual(state['user_name'], 'Олена')
+        self.assertEqual(state['total_items'], 2)
+        self.assertEqual(state['favorites'], [self.product.pk])
+        self.assertTrue(state['csrf_token'])
+
+        self.client.logout()
+        state = self.client.get('/session-state/').json()
+        self.assertEqual((state['authenticated'], state['favorites']), (False, []))
+
+
+class PriceBucketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        for price in (999.99, 1000, 1999.99, 2000):
+            Product.objects.create(
+                category=category, name=f'P {price}', slug=f'p-{price}'.replace('.', '-'),
+                description='', scent_type='woody', price=price,
+            )
+
+    def test_bucket_count_matches_its_filter(self):
+        response = self.client.get('/collection/')
+        for bucket in response.context['price_buckets'][:2]:
+            filtered = self.client.get('/collection/', {
+                'min_price': bucket['min'], 'max_price': bucket['max'],
+            })
+            self.assertEqual(filtered.context['total_count'], bucket['count'])
+            self.assertEqual(bucket['count'], 1 if not bucket['min'] else 2)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.a, self.b = [
+            Product.objects.create(
+                category=category, name=name, slug=name, description='',
+                scent_type='woody', price=1000,
+            )
+            for name in ('a', 'b')
+        ]
+
+    def order(self, paid=False, paid_at=None):
+        order = Order.objects.create(
+            first_name='Ім\'я', last_name='Прізвище', email='a@example.com',
+            phone='1', address='вул. 1', postal_code='1', city='Київ', paid=paid,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, price=1000) for product in (self.a, self.b)
+        ])
+        if paid_at is not None:
+            Order.objects.filter(pk=order.pk).update(paid_at=paid_at)
+        return order
+
+    def pair_count(self):
+        pair = ProductPairCount.objects.filter(product=self.a, other=self.b).first()
+        return pair.count if pair else 0
+
+    def test_counts_only_paid_orders(self):
+        if recommendations.np is None:
+            self.skipTest('NumPy не встановлено')
+        settled = timezone.now() - timedelta(minutes=10)
+        pending = self.order()
+        self.order(paid=True, paid_at=settled)
+        self.assertEqual(recommendations.update(), 1)
+        self.assertEqual(self.pair_count(), 1)
+
+        # Замовлення оплатили пізніше - його враховує наступний запуск
+        pending.paid = True
+        pending.save()
+        Order.objects.filter(pk=pending.pk).update(paid_at=settled + timedelta(minutes=1))
+        self.assertEqual(recommendations.update(), 1)
+        self.assertEqual(self.pair_count(), 2)
+
+    def test_late_commit_with_older_payment_time_is_not_skipped(self):
+        if recommendations.np is None:
+            self.skipTest('NumPy не встановлено')
+        now = timezone.now()
+        self.order(paid=True, paid_at=now - timedelta(minutes=5))
+        # Ще в межах SETTLE_DELAY - чекає наступного запуску
+        recent = self.order(paid=True, paid_at=now)
+        self.assertEqual(recommendations.update(), 1)
+        self.order(paid=True, paid_at=now - timedelta(minutes=4))
+        Order.objects.filter(pk=recent.pk).update(paid_at=now - timedelta(minutes=3))
+        self.assertEqual(recommendations.update(), 2)
+        self.assertEqual(self.pair_count(), 3)
+
+    def test_cancelled_refunded_and_deleted_orders_are_subtracted(self):
+        if recommendations.np is None:
+            self.skipTest('NumPy не встановлено')
+        settled = timezone.now() - timedelta(minutes=10)
+        cancelled, refunded, deleted, kept = [self.order(paid=True, paid_at=settled) for _ in range(4)]
+        self.assertEqual(recommendations.update(), 4)
+        self.assertEqual(self.pair_count(), 4)
+
+        Order.objects.filter(pk=cancelled.pk).update(status='cancelled')
+        Order.objects.filter(pk=refunded.pk).update(paid=False, status='refunded')
+        deleted.delete()
+        self.assertEqual(recommendations.update(), 3)
+        self.assertEqual(self.pair_count(), 1)
+        self.assertEqual(ProductRecommendation.objects.get(product=self.a).also_bought, [self.b.pk])
+
+        Order.objects.filter(pk=kept.pk).update(status='cancelled')
+        self.assertEqual(recommendations.update(), 1)
+        self.assertEqual(self.pair_count(), 0)
+        self.assertFalse(ProductRecommendation.objects.exists())
+        # Вдруге не віднімається
+        self.assertEqual(recommendations.update(), 0)
+
+
+class ProductAdminStockTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.product = Product.objects.create(
+            category=category, name='Stocked', slug='stocked', description='Деревний',
+            scent_type='woody', price=1000, stock=5, image='products/stocked.jpg',
+        )
+        self.admin = ProductAdmin(Product, admin.site)
+        self.request = RequestFactory().post('/')
+        self.request.user = get_user_model().objects.create_superuser('admin', password='pw12345!')
+
+    def test_stock_is_not_editable_in_the_list(self):
+        self.assertNotIn('stock', self.admin.list_editable)
+        self.assertIn('stock', self.admin.get_readonly_fields(self.request, self.product))
+
+    def test_stock_change_is_applied_as_delta(self):
+        obj = Product.objects.get(pk=self.product.pk)
+        Form = self.admin.get_form(self.request, obj, change=True)
+        data = {
+            name: value for name, value in Form(instance=obj).initial.items()
+            if value is not None and name != 'image'
+        }
+        data.update(price='1200', stock_change='10')
+        # Поки адмін редагував, checkout зарезервував два флакони
+        Product.objects.filter(pk=obj.pk).update(stock=3)
+
+        form = Form(data, instance=obj)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.admin.save_model(self.request, form.save(commit=False), form, True)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.price), (13, 1200))
+
+
+class CatalogVersionTests(TestCase):
+    def test_version_is_shared_through_the_database(self):
+        version = catalog_version()
+        # Інший процес має свій порожній локальний кеш
+        cache.clear()
+        self.assertEqual(catalog_version(), version)
+
+        Category.objects.create(name='Нова', slug='new')
+        cache.clear()
+        self.assertGreater(catalog_version(), version)
+        self.assertEqual(category_version(), CatalogVersion.objects.get(key=CATEGORY_VERSION_KEY).value)
+
+
+class SimilarityTests(TestCase):
+    def setUp(self):
+        if similarity.np is None:
+            self.skipTest('NumPy не встановлено')
+        cache.clear()
+        patcher = mock.patch.object(similarity, '_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.woody, self.cedar, self.citrus = [
+            Product.objects.create(
+                category=category, name=name, slug=name, description=description,
+                scent_type=scent, price=price,
+            )
+            for name, description, scent, price in (
+                ('woody', 'кедр ветивер дим', 'woody', 3000),
+                ('cedar', 'кедр ветивер шкіра', 'woody', 3200),
+                ('citrus', 'бергамот лимон', 'citrus', 900),
+            )
+        ]
+
+    def test_requests_read_snapshot_and_refresh_in_background(self):
+        with mock.patch.object(similarity, '_schedule_refresh') as schedule:
+            self.assertEqual(similarity.similar_ids(self.woody.pk), [])
+            schedule.assert_called_once()
+
+            similarity.refresh()
+            schedule.reset_mock()
+            self.assertEqual(similarity.similar_ids(self.woody.pk, 1), [self.cedar.pk])
+            schedule.assert_not_called()
+
+            # Застарілий знімок віддається, поки фоновий потік будує новий
+            self.cedar.available = False
+            self.cedar.save()
+            self.assertEqual(similarity.similar_ids(self.woody.pk, 1), [self.cedar.pk])
+            schedule.assert_called_once()
+
+        similarity.refresh()
+        self.assertNotIn(self.cedar.pk, similarity.similar_ids(self.woody.pk))
+
+    def test_incremental_sync_matches_full_build(self):
+        before = similarity.refresh()
+        self.citrus.description = 'кедр лимон'
+        self.citrus.save()
+        Product.objects.create(
+            category=self.woody.category, name='smoke', slug='smoke', description='дим кедр',
+            scent_type='woody', price=2500,
+        )
+        cedar_id = self.cedar.pk
+        self.cedar.delete()
+
+        synced = similarity.refresh()
+        self.assertIsNot(synced, before)
+        # Старий знімок не змінився - його ще можуть читати запити
+        self.assertEqual(before.rows.keys(), {self.woody.pk, cedar_id, self.citrus.pk})
+        full = similarity.SimilarityIndex.build()
+        self.assertEqual(synced.ids.tolist(), full.ids.tolist())
+        self.assertTrue((synced.idf == full.idf).all())
+        self.assertTrue((abs(synced.matrix - full.matrix) < 1e-6).all())
+
+
+class RatingTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Нішеві', slug='niche')
+        self.product = Product.objects.create(
+            category=category, name='Rated', slug='rated', description='',
+            scent_type='woody', price=1000, rating=Decimal('4.2'),
+        )
+        self.curated = Product.objects.create(
+            category=category, name='Curated', slug='curated', description='',
+            scent_type='woody', price=1000, rating=Decimal('4.8'),
+        )
+        User = get_user_model()
+        self.users = [User.objects.create_user(f'u{i}', password='pw12345!') for i in range(2)]
+
+    def review(self, user, rating):
+        return Review.objects.create(product=self.product, user=user, rating=rating, text='')
+
+    def stats(self):
+        self.product.refresh_from_db()
+        return self.product.review_count, self.product.rating_sum, self.product.review_rating
+
+    def test_reviews_keep_curated_rating(self):
+        first = self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        self.assertEqual(self.stats(), (2, 7, Decimal('3.5')))
+        self.assertEqual(self.product.rating_avg, Decimal('3.5'))
+        self.assertEqual(self.product.rating_count_2, 1)
+
+        first.rating = 4
+        first.save()
+        self.assertEqual(self.stats(), (2, 6, Decimal('3.0')))
+        self.assertEqual((self.product.rating_count_4, self.product.rating_count_5), (1, 0))
+        # Оцінку з адмінки відгуки не перезаписують
+        self.assertEqual(self.product.rating, Decimal('4.2'))
+
+    def test_deleting_last_review_falls_back_to_curated_rating(self):
+        self.review(self.users[0], 1).delete()
+        self.assertEqual(self.stats(), (0, 0, None))
+        self.assertEqual(self.product.rating_avg, Decimal('4.2'))
+
+    def test_rebuild_recomputes_aggregates(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 4)
+        Product.objects.filter(pk=self.product.pk).update(
+            review_count=0, rating_sum=0, review_rating=None, rating_count_5=0
+        )
+        self.assertEqual(ratings.rebuild(Product, Review), 1)
+        self.assertEqual(self.stats(), (2, 9, Decimal('4.5')))
+        self.assertEqual(self.product.rating_count_5, 1)
+        self.assertEqual(self.product.rating, Decimal('4.2'))
+        self.assertEqual(ratings.rebuild(Product, Review), 0)
+
+    def test_rating_sort_falls_back_to_curated_rating(self):
+        self.review(self.users[0], 3)
+        response = self.client.get('/collection/', {'sort': 'rating'})
+        self.assertEqual(
+            [product.pk for product in response.context['products']],
+            [self.curated.pk, self.product.pk],
+        )
@@ -10,6 +10,8 @@ urlpatterns = [
     path('products/', views.product_list, name='product_list'),
     path('products/<slug:category_slug>/', views.product_list, name='product_list_by_category'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
+    path('product/<slug:slug>/similar/', views.similar_products, name='similar_products'),
+    path('session-state/', views.session_state, name='session_state'),
     path('favorites/', views.favorites, name='favorites'),
     path('favorites/toggle/<int:product_id>/', views.toggle_favorite, name='toggle_favorite'),
 ]
\ No newline at end of file
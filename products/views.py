@@ -1,88 +1,160 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Q, Min, Max, Avg
+from django.db.models import Q
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
 from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
 from .models import Product, Category, Review, Favorite
+from . import ratings, search, recommendations, similarity
+from .cache import favorite_ids
+from .conditional import catalog_condition, product_condition
+from .page_cache import shared_page_cache
+from .shell import public_shell
+from .facets import BADGES, get_categories, get_facets
+from .pagination import KeysetPaginator, page_url
+from cart.cart import get_cart
 from cart.forms import CartAddProductForm
 
+# Ключ сортування для кожного режиму: (поле, за спаданням)
+SORT_KEYS = {
+    'newest': ('created', True),
+    'price_low': ('price', False),
+    'price_high': ('price', True),
+    'name': ('name', False),
+    'rating': ('display_rating', True),
+    'relevance': ('search_rank', False),
+}
+
+
+def is_ajax(request):
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+def product_json(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'url': product.get_absolute_url(),
+        'image': product.image.url if product.image else None,
+        'category': product.category.name,
+        'price': str(product.price),
+        'rating': str(product.rating_avg),
+        'badge': product.get_badge(),
+    }
+
+
+def page_json(request, page, products):
+    return JsonResponse({
+        'products': [product_json(product) for product in products],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'next_url': page_url(request, page.next_cursor) if page.has_next else None,
+        'prev_url': page_url(request, page.prev_cursor) if page.has_previous else None,
+    })
+
+
+def page_context(request, page):
+    return {
+        'page': page,
+        'next_page_url': page_url(request, page.next_cursor) if page.has_next else None,
+        'prev_page_url': page_url(request, page.prev_cursor) if page.has_previous else None,
+    }
+
+@public_shell
+@catalog_condition
+@shared_page_cache
 def home(request):
-    products = Product.objects.filter(available=True)[:6]
+    products = Product.objects.filter(available=True).select_related('category')[:6]
     cart_form = CartAddProductForm()
     return render(request, 'products/home.html', {
         'products': products,
         'cart_form': cart_form
     })
 
+@public_shell
+@catalog_condition
+@shared_page_cache
 def collection(request):
-    products = Product.objects.filter(available=True)
-    categories = Category.objects.all()
-    
     category_slug = request.GET.get('category')
     scent_type = request.GET.get('scent_type')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
     badge = request.GET.get('badge')
-    sort_by = request.GET.get('sort', 'newest')
-    search_query = request.GET.get('search', '')
+    search_query = request.GET.get('search', '').strip()
+    sort_by = request.GET.get('sort') or ('relevance' if search_query else 'newest')
+    
+    filters = {'category': None, 'scent_type': None, 'badge': None, 'price': None, 'search': None}
     
     if category_slug:
-        products = products.filter(category__slug=category_slug)
+        category_ids = [c['id'] for c in get_categories() if c['slug'] == category_slug]
+        filters['category'] = Q(category_id__in=category_ids)
     
     if scent_type:
-        products = products.filter(scent_type=scent_type)
+        filters['scent_type'] = Q(scent_type=scent_type)
     
+    price_filter = Q()
     if min_price:
         try:
-            products = products.filter(price__gte=float(min_price))
+            price_filter &= Q(price__gte=float(min_price))
         except ValueError:
             pass
     if max_price:
         try:
-            products = products.filter(price__lte=float(max_price))
+            price_filter &= Q(price__lte=float(max_price))
         except ValueError:
             pass
+    if price_filter:
+        filters['price'] = price_filter
     
-    if badge == 'bestseller':
-        products = products.filter(is_bestseller=True)
-    elif badge == 'exclusive':
-        products = products.filter(is_exclusive=True)
-    elif badge == 'limited':
-        products = products.filter(is_limited=True)
+    badge_filters = {value: condition for value, label, condition in BADGES}
+    if badge in badge_filters:
+        filters['badge'] = badge_filters[badge]
     
+    search_ids = None
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(category__name__icontains=search_query)
-        )
+        filters['search'], search_ids = search.match(search_query)
+    elif sort_by == 'relevance':
+        sort_by = 'newest'
     
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'name':
-        products = products.order_by('name')
-    elif sort_by == 'rating':
-        products = products.order_by('-rating')
-    else:
-        products = products.order_by('-created')
+    products = Product.objects.filter(available=True)
+    for condition in filters.values():
+        if condition is not None:
+            products = products.filter(condition)
+    if search_query:
+        products = products.annotate(search_rank=search.rank_expression(search_ids))
+    if sort_by == 'rating':
+        products = products.annotate(display_rating=ratings.display_rating())
     
-    cart_form = CartAddProductForm()
+    if sort_by not in SORT_KEYS:
+        sort_by = 'newest'
+    key, descending = SORT_KEYS[sort_by]
+    page = KeysetPaginator(
+        products.select_related('category'), key, descending
+    ).get_page(request.GET.get('cursor'))
     
-    scent_types = Product.SCENT_CHOICES
+    if is_ajax(request):
+        return page_json(request, page, page.object_list)
     
-    all_products = Product.objects.filter(available=True)
-    price_range = all_products.aggregate(
-        min_price=Min('price'),
-        max_price=Max('price')
-    ) if all_products.exists() else {'min_price': 0, 'max_price': 10000}
+    facets = get_facets(filters, {
+        'category': category_slug,
+        'scent_type': scent_type,
+        'min_price': min_price,
+        'max_price': max_price,
+        'badge': badge,
+        'search': search_query,
+    })
+    
+    cart_form = CartAddProductForm()
     
     context = {
-        'products': products,
-        'categories': categories,
-        'scent_types': scent_types,
+        'products': page.object_list,
+        'total_count': facets['total'],
+        'categories': facets['categories'],
+        'scent_types': facets['scent_types'],
+        'badges': facets['badges'],
+        'price_buckets': facets['price_buckets'],
         'cart_form': cart_form,
         'selected_category': category_slug,
         'selected_scent_type': scent_type,
@@ -91,11 +163,14 @@ def collection(request):
         'search_query': search_query,
         'min_price': min_price or '',
         'max_price': max_price or '',
-        'price_range': price_range,
+        'price_range': facets['price_range'],
+        **page_context(request, page),
     }
     
     return render(request, 'products/collection.html', context)
 
+@public_shell
+@catalog_condition
 def product_list(request, category_slug=None):
     category = None
     categories = Category.objects.all()
@@ -105,56 +180,112 @@ def product_list(request, category_slug=None):
         category = get_object_or_404(Category, slug=category_slug)
         products = products.filter(category=category)
     
+    page = KeysetPaginator(
+        products.select_related('category'), 'created', descending=True
+    ).get_page(request.GET.get('cursor'))
+    
+    if is_ajax(request):
+        return page_json(request, page, page.object_list)
+    
     cart_form = CartAddProductForm()
     return render(request, 'products/product_list.html', {
         'category': category,
         'categories': categories,
-        'products': products,
-        'cart_form': cart_form
+        'products': page.object_list,
+        'cart_form': cart_form,
+        **page_context(request, page),
     })
 
+@public_shell
+@product_condition
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug, available=True)
+    product = get_object_or_404(Product.objects.select_related('category'), slug=slug, available=True)
     cart_form = CartAddProductForm()
     
     # Get reviews
-    reviews = Review.objects.filter(product=product).order_by('-created')[:10]
-    num_reviews = Review.objects.filter(product=product).count()
-    avg_rating = Review.objects.filter(product=product).aggregate(Avg('rating'))['rating__avg'] or product.rating
+    reviews = Review.objects.filter(product=product).select_related('user').order_by('-created')[:10]
     
     # Check if product is in favorites
-    is_favorite = False
-    if request.user.is_authenticated:
-        is_favorite = Favorite.objects.filter(user=request.user, product=product).exists()
+    is_favorite = product.id in favorite_ids(request)
     
-    # Get related products
-    related_products = Product.objects.filter(
-        category=product.category,
-        available=True
-    ).exclude(id=product.id)[:4]
+    # Get related products: co-purchases first, then similar scents, same category as fallback
+    related_products = recommendations.also_bought(product)
+    if len(related_products) < 4:
+        related_products += similarity.similar_products(
+            product, limit=4 - len(related_products),
+            exclude={p.id for p in related_products},
+        )
+    if not related_products:
+        related_products = Product.objects.filter(
+            category=product.category,
+            available=True
+        ).exclude(id=product.id).select_related('category')[:4]
     
     return render(request, 'products/product_detail.html', {
         'product': product,
         'cart_form': cart_form,
         'reviews': reviews,
-        'num_reviews': num_reviews,
-        'avg_rating': avg_rating,
+        'num_reviews': product.review_count,
+        'avg_rating': product.rating_avg,
+        'rating_histogram': product.get_rating_histogram(),
         'is_favorite': is_favorite,
         'related_products': related_products,
     })
 
+def similar_products(request, slug):
+    product = get_object_or_404(Product, slug=slug, available=True)
+    try:
+        limit = min(max(int(request.GET.get('limit', 4)), 1), similarity.TOP_K)
+    except ValueError:
+        limit = 4
+    return JsonResponse({
+        'products': [product_json(p) for p in similarity.similar_products(product, limit=limit)],
+    })
+
+@public_shell
+@shared_page_cache
 def about(request):
     return render(request, 'products/about.html')
 
+@never_cache
+def session_state(request):
+    """Персональна частина спільних сторінок: кошик, користувач, улюблені, повідомлення."""
+    user = request.user
+    cart = get_cart(request)
+    return JsonResponse({
+        'authenticated': user.is_authenticated,
+        'user_name': (user.first_name or user.email) if user.is_authenticated else None,
+        'user_title': (user.get_full_name() or user.email) if user.is_authenticated else None,
+        'total_items': len(cart),
+        'total_price': float(cart.get_total_price()),
+        'favorites': sorted(favorite_ids(request)),
+        'messages': [
+            {'text': str(message), 'tags': message.tags}
+            for message in messages.get_messages(request)
+        ],
+        'csrf_token': get_token(request),
+    })
+
 @login_required
 def favorites(request):
-    favorites_list = Favorite.objects.filter(user=request.user).select_related('product')
-    products = [fav.product for fav in favorites_list if fav.product.available]
-    cart_form = CartAddProductForm()
+    favorites_list = Favorite.objects.filter(
+        user=request.user,
+        product__available=True
+    ).select_related('product__category')
+    page = KeysetPaginator(favorites_list, 'created', descending=True).get_page(
+        request.GET.get('cursor')
+    )
+    products = [fav.product for fav in page]
     
+    if is_ajax(request):
+        return page_json(request, page, products)
+    
+    cart_form = CartAddProductForm()
     return render(request, 'products/favorite.html', {
         'products': products,
+        'total_count': favorites_list.count(),
         'cart_form': cart_form,
+        **page_context(request, page),
     })
 
 @login_required
@@ -174,7 +305,7 @@ def toggle_favorite(request, product_id):
         is_favorite = True
         message = 'Товар додано до улюблених'
     
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+    if is_ajax(request):
         return JsonResponse({
             'success': True,
             'is_favorite': is_favorite,
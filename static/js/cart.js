@@ -117,100 +117,212 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    async function updateQuantityViaButtons(productId, newQuantity) {
+    // Зміни кількості й видалення збираються й надсилаються одним запитом
+    const BATCH_DELAY = 400;
+    const pendingOperations = new Map();
+    let batchTimer = null;
+
+    function queueCartOperation(productId, operation) {
+        pendingOperations.set(String(productId), { product_id: Number(productId), ...operation });
+        clearTimeout(batchTimer);
+        batchTimer = setTimeout(flushCartOperations, BATCH_DELAY);
+    }
+
+    function showEmptyCart() {
+        const cartTable = document.querySelector('.cart-table-wrapper');
+        const cartActions = document.querySelector('.cart-actions');
+        const emptyCart = document.createElement('div');
+        emptyCart.className = 'empty-cart';
+        emptyCart.innerHTML = `
+            <i class="fas fa-shopping-bag"></i>
+            <p>Ваш кошик порожній</p>
+            <a href="/products/" class="continue-shopping">
+                <i class="fas fa-arrow-left"></i> Перейти до покупок
+            </a>
+        `;
+        if (cartTable) cartTable.replaceWith(emptyCart);
+        if (cartActions) cartActions.remove();
+    }
+
+    async function flushCartOperations() {
+        batchTimer = null;
+        if (!pendingOperations.size) return;
+
+        const operations = Array.from(pendingOperations.values());
+        pendingOperations.clear();
+
         try {
-            const response = await fetch(`/cart/update/${productId}/`, {
+            const response = await fetch('/cart/batch/', {
                 method: 'POST',
                 headers: {
                     'X-Requested-With': 'XMLHttpRequest',
                     'X-CSRFToken': csrftoken || '',
-                    'Content-Type': 'application/x-www-form-urlencoded'
+                    'Content-Type': 'application/json'
                 },
-                body: `quantity=${newQuantity}`
+                body: JSON.stringify({ operations }),
+                keepalive: true
             });
-            
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            
+
             const data = await response.json();
-            
+
             if (data.success) {
                 updateCartIndicators(data.total_items, data.total_price);
-                
-                const row = document.querySelector(`[data-product-id="${productId}"]`)?.closest('tr');
-                if (row) {
-                    const totalCell = row.querySelector('td.price:last-child');
+
+                Object.entries(data.items).forEach(([productId, itemTotal]) => {
+                    const row = document.querySelector(`.qty-input[data-product-id="${productId}"]`)?.closest('tr');
+                    const totalCell = row?.querySelector('td.price:last-child');
                     if (totalCell) {
-                        totalCell.textContent = formatPrice(data.item_total);
+                        totalCell.textContent = formatPrice(itemTotal);
                     }
-                }
-                
+                });
+
                 const cartTotalCell = document.querySelector('tr.total td:last-child');
                 if (cartTotalCell) {
                     cartTotalCell.textContent = formatPrice(data.total_price);
                 }
-                
-                showNotification('Кількість оновлена');
+
+                if (data.is_empty) {
+                    showEmptyCart();
+                }
+
+                showNotification(data.message || 'Кошик оновлено');
             } else {
-                showNotification('Не вдалося оновити кількість', 'error');
+                showNotification('Не вдалося оновити кошик', 'error');
             }
         } catch (error) {
             showNotification('Сталася помилка', 'error');
         }
     }
 
-    async function removeFromCart(event) {
+    function removeFromCart(event) {
         event.preventDefault();
         const form = event.target;
         const row = form.closest('tr');
-        
+        const productId = row.querySelector('.qty-input').dataset.productId;
+
+        queueCartOperation(productId, { remove: true });
+        row.remove();
+    }
+
+    function setCsrfInputs(token) {
+        document.querySelectorAll('form[method="post"], form[method="POST"]').forEach(form => {
+            let input = form.querySelector('[name=csrfmiddlewaretoken]');
+            if (!input) {
+                input = document.createElement('input');
+                input.type = 'hidden';
+                input.name = 'csrfmiddlewaretoken';
+                form.prepend(input);
+            }
+            input.value = token;
+        });
+    }
+
+    function showMessages(messages) {
+        if (!messages.length) return;
+
+        const container = document.createElement('div');
+        container.className = 'messages-container';
+        messages.forEach(message => {
+            const alert = document.createElement('div');
+            alert.className = `alert alert-${message.tags}`;
+            alert.textContent = message.text;
+            container.appendChild(alert);
+
+            setTimeout(() => {
+                alert.classList.add('fade-out');
+                setTimeout(() => alert.remove(), 500);
+            }, 2000);
+        });
+        document.querySelector('header').after(container);
+    }
+
+    function showUser(data) {
+        const userMenu = document.getElementById('userMenu');
+        const loginLink = document.getElementById('loginLink');
+        if (!data.authenticated || !userMenu) return;
+
+        const userName = userMenu.querySelector('.user-name');
+        userName.textContent = data.user_name.length > 12
+            ? data.user_name.slice(0, 11) + '…'
+            : data.user_name;
+        userName.title = data.user_title;
+        userMenu.hidden = false;
+        if (loginLink) loginLink.remove();
+    }
+
+    function showFavorites(favorites) {
+        const ids = new Set(favorites.map(String));
+        document.querySelectorAll('.card-favorite, .btn-favorite[data-product-id]').forEach(btn => {
+            const active = ids.has(btn.dataset.productId);
+            btn.classList.toggle('active', active);
+            const icon = btn.querySelector('i');
+            if (btn.classList.contains('btn-favorite') && icon) {
+                icon.classList.toggle('fas', active);
+                icon.classList.toggle('far', !active);
+            }
+        });
+    }
+
+    // Спільна сторінка без персональних даних - підтягуємо їх окремим запитом
+    async function hydrateSessionState() {
+        const url = document.body.dataset.sessionStateUrl;
+        if (!url) return;
+
         try {
-            const response = await fetch(form.action, {
+            const response = await fetch(url, {
+                headers: { 'X-Requested-With': 'XMLHttpRequest' },
+                credentials: 'same-origin'
+            });
+            const data = await response.json();
+
+            csrftoken = data.csrf_token;
+            setCsrfInputs(data.csrf_token);
+            updateCartIndicators(data.total_items, data.total_price);
+            showUser(data);
+            showFavorites(data.favorites);
+            showMessages(data.messages);
+        } catch (error) {
+            console.error('Error:', error);
+        }
+    }
+
+    async function toggleCardFavorite(event) {
+        event.preventDefault();
+        event.stopPropagation();
+        const btn = event.currentTarget;
+
+        try {
+            const response = await fetch(`/favorites/toggle/${btn.dataset.productId}/`, {
                 method: 'POST',
                 headers: {
                     'X-Requested-With': 'XMLHttpRequest',
-                    'X-CSRFToken': csrftoken
-                },
-                body: new FormData(form)
+                    'X-CSRFToken': csrftoken || ''
+                }
             });
-            
+
+            // Гостя перенаправляє на сторінку входу
+            if (response.redirected) {
+                const loginUrl = new URL(response.url);
+                loginUrl.searchParams.set('next', window.location.pathname);
+                window.location.href = loginUrl;
+                return;
+            }
+
             const data = await response.json();
-            
+
             if (data.success) {
-                row.remove();
-                updateCartIndicators(data.total_items, data.total_price);
-                
-                const cartTotalCell = document.querySelector('tr.total td:last-child');
-                if (cartTotalCell) {
-                    cartTotalCell.textContent = formatPrice(data.total_price);
-                }
-                
-                if (data.is_empty) {
-                    const cartTable = document.querySelector('.cart-table-wrapper');
-                    const cartActions = document.querySelector('.cart-actions');
-                    const emptyCart = document.createElement('div');
-                    emptyCart.className = 'empty-cart';
-                    emptyCart.innerHTML = `
-                        <i class="fas fa-shopping-bag"></i>
-                        <p>Ваш кошик порожній</p>
-                        <a href="/products/" class="continue-shopping">
-                            <i class="fas fa-arrow-left"></i> Перейти до покупок
-                        </a>
-                    `;
-                    if (cartTable) cartTable.replaceWith(emptyCart);
-                    if (cartActions) cartActions.remove();
-                }
-                
-                showNotification('Товар видалено з кошика');
-            } else {
-                showNotification('Не вдалося видалити товар', 'error');
+                btn.classList.toggle('active', data.is_favorite);
+                showNotification(data.message);
             }
         } catch (error) {
-            showNotification('Сталася помилка', 'error');
+            showNotification('Помилка при додаванні до улюблених', 'error');
         }
     }
 
+    document.querySelectorAll('.card-favorite').forEach(btn => {
+        btn.addEventListener('click', toggleCardFavorite);
+    });
+
     document.querySelectorAll('.add-to-cart-form').forEach(form => {
         form.addEventListener('submit', addToCart);
     });
@@ -231,7 +343,7 @@ document.addEventListener('DOMContentLoaded', () => {
             let qty = parseInt(input.value) || 1;
             
             if (qty < 20) {
-                updateQuantityViaButtons(productId, qty + 1);
+                queueCartOperation(productId, { quantity: qty + 1 });
                 input.value = qty + 1;
             }
         });
@@ -246,7 +358,7 @@ document.addEventListener('DOMContentLoaded', () => {
             let qty = parseInt(input.value) || 1;
             
             if (qty > 1) {
-                updateQuantityViaButtons(productId, qty - 1);
+                queueCartOperation(productId, { quantity: qty - 1 });
                 input.value = qty - 1;
             }
         });
@@ -255,4 +367,9 @@ document.addEventListener('DOMContentLoaded', () => {
     document.querySelectorAll('.cart-remove-form').forEach(form => {
         form.addEventListener('submit', removeFromCart);
     });
+
+    // Не губимо відкладені зміни при переході зі сторінки
+    window.addEventListener('pagehide', flushCartOperations);
+
+    hydrateSessionState();
 });
\ No newline at end of file
@@ -1,16 +1,28 @@
 from django.shortcuts import render
+from products.page_cache import shared_page_cache
+from products.shell import public_shell
 
+@public_shell
+@shared_page_cache
 def delivery_payment(request):
     return render(request, "support/delivery_payment.html")
 
+@public_shell
+@shared_page_cache
 def returns(request):
     return render(request, "support/returns.html")
 
+@public_shell
+@shared_page_cache
 def faq(request):
     return render(request, "support/faq.html")
 
+@public_shell
+@shared_page_cache
 def quality_guarantee(request):
     return render(request, "support/quality_guarantee.html")
 
+@public_shell
+@shared_page_cache
 def certificates(request):
     return render(request, "support/certificates.html")
\ No newline at end of file